@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class AuthenticationsystemConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'AuthenticationSystem'
+
+    def ready(self):
+        from . import jobs  # noqa: F401  registers the background job handlers
+        from .authentication import user_deactivated, user_deleted
+        from .caching import user_changed
+
+        # Any change of a user row retires its cached "me" representation
+        user_model = self.get_model("CustomUser")
+        post_save.connect(user_changed, sender=user_model)
+        post_delete.connect(user_changed, sender=user_model)
+        # and deleting / deactivating it revokes its tokens
+        post_save.connect(user_deactivated, sender=user_model)
+        post_delete.connect(user_deleted, sender=user_model)
@@ -0,0 +1,9 @@
+from django.urls import path
+from . import async_views
+
+# Async routes for SmartContact/asgi_urls.py (see urls.py for the parameters)
+urlpatterns = [
+    path("signup/", async_views.signup, name="signup"),
+    path("manual-login/", async_views.manual_login, name="manual_login"),
+    path("login/", async_views.login, name="login"),
+]
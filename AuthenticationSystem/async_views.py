@@ -0,0 +1,131 @@
+from rest_framework import status
+from rest_framework.permissions import AllowAny
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from SmartContact.async_api import async_api_view, json_response
+from SmartContact.metrics import span
+from .authentication import add_user_claims, aget_token_version
+from .caching import aget_me, aset_me
+from .hashers import HashingBusy, acheck_password
+from .models import CustomUser
+from .throttling import aclear_user_attempts, acount_attempt
+from .views import TOO_MANY_ATTEMPTS, dashboard_data, serialize_user
+
+# Async versions of the authentication endpoints, served when ASYNC_VIEWS is
+# on (see SmartContact/asgi_urls.py). Same requests and responses as views.py.
+# Password hashing is CPU bound and runs in the hashing pool (hashers.py),
+# never on the event loop (django's own acheck_password() hashes on the loop).
+
+
+async def aget_tokens_for_user(user):
+    refresh = add_user_claims(
+        RefreshToken.for_user(user=user), user, await aget_token_version(user.id)
+    )
+    return {
+        "access": str(refresh.access_token),
+        "refresh": str(refresh),
+    }
+
+
+def too_many_attempts_response(retry_after):
+    return json_response(
+        {"error": TOO_MANY_ATTEMPTS},
+        status.HTTP_429_TOO_MANY_REQUESTS,
+        {"Retry-After": str(retry_after)},
+    )
+
+
+def hashing_busy_response(e):
+    return json_response(
+        {"error": str(e)}, status.HTTP_503_SERVICE_UNAVAILABLE, {"Retry-After": "1"}
+    )
+
+
+@async_api_view(["POST"], permission_classes=[AllowAny])
+async def signup(request):
+    user_password = request.data.get("password")
+    user_name = request.data.get("user_name")
+    user_first_name = request.data.get("first_name")
+    user_last_name = request.data.get("last_name")
+
+    if not all([user_password, user_name]):
+        return json_response(
+            {"error": "All fields ( user_password, user_name) are required."},
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    retry_after = await acount_attempt("signup", request)
+    if retry_after:
+        return too_many_attempts_response(retry_after)
+
+    try:
+        user = await CustomUser.objects.acreate_user(
+            first_name=user_first_name,
+            last_name=user_last_name,
+            user_name=user_name,
+            password=user_password,
+        )
+    except ValueError as e:
+        return json_response({"error": str(e)}, status.HTTP_403_FORBIDDEN)
+    except HashingBusy as e:
+        return hashing_busy_response(e)
+
+    return json_response(
+        {
+            "msg": "user created",
+            "user": serialize_user(user),
+            "tokens": await aget_tokens_for_user(user),
+        },
+        status.HTTP_201_CREATED,
+    )
+
+
+@async_api_view(["POST"], permission_classes=[AllowAny])
+async def manual_login(request):
+    user_password = request.data.get("password")
+    user_user_name = request.data.get("user_name")
+    remember = request.data.get("remember")
+
+    retry_after = await acount_attempt("login", request, user_user_name)
+    if retry_after:
+        return too_many_attempts_response(retry_after)
+
+    try:
+        user = await CustomUser.objects.aget(user_name=user_user_name)
+    except CustomUser.DoesNotExist:
+        return json_response({"error": "User not found"}, status.HTTP_404_NOT_FOUND)
+
+    try:
+        with span("password_hash"):
+            is_correct = await acheck_password(user, user_password)
+    except HashingBusy as e:
+        return hashing_busy_response(e)
+    if not is_correct:
+        return json_response({"error": "User not found"}, status.HTTP_404_NOT_FOUND)
+
+    await aclear_user_attempts("login", user_user_name)
+    tokens = await aget_tokens_for_user(user)
+    return json_response(
+        dashboard_data(serialize_user(user), tokens, remember=remember)
+    )
+
+
+@async_api_view(["POST"], permission_classes=[AllowAny])
+async def login(request):
+    user = request.user
+    if not user or not user.is_authenticated:
+        return json_response({"error": "JWT is not ok"}, status.HTTP_400_BAD_REQUEST)
+
+    user_data, version = await aget_me(user.id)
+    if user_data is not None:
+        return json_response(dashboard_data(user_data, tokens=None))
+
+    # A fresh row, as in views.login()
+    try:
+        user = await CustomUser.objects.aget(pk=user.id)
+    except CustomUser.DoesNotExist:
+        return json_response({"error": "JWT is not ok"}, status.HTTP_400_BAD_REQUEST)
+
+    user_data = serialize_user(user)
+    await aset_me(user.id, version, user_data)
+    return json_response(dashboard_data(user_data, tokens=None))
@@ -0,0 +1,316 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from rest_framework.settings import api_settings as drf_api_settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from SmartContact import async_cache
+from SmartContact.metrics import record_cache, span
+
+# JWT authentication with a short-lived cache of the user lookup.
+#
+# simplejwt loads the user row on every request. With this class the row is
+# loaded at most once per user per JWT_USER_CACHE["TIMEOUT"] seconds, either
+# in process ("local") or in the shared Django cache ("cache").
+#
+#     JWT_USER_CACHE = {
+#         "BACKEND": "local",     # "local", "cache" or None to disable
+#         "TIMEOUT": 30,          # seconds, keep it short: deactivation
+#                                 # takes up to this long to apply
+#         "MAX_ENTRIES": 10000,   # only for "local"
+#     }
+
+
+class LocalUserCache:
+    # Bounded in-process LRU with per-entry expiry
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        # Each request gets its own copy, so per-request attributes
+        # set on the user never leak between threads
+        return copy.copy(user)
+
+    def set(self, key, user, timeout, max_entries):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, user)
+            self.entries.move_to_end(key)
+            while len(self.entries) > max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_user_cache = LocalUserCache()
+
+
+def get_config():
+    return getattr(settings, "JWT_USER_CACHE", {})
+
+
+def user_cache_key(user_id):
+    return f"jwt_user_{user_id}"
+
+
+def forget_user(user_id):
+    # Drop a cached user right away (e.g. after deactivating it)
+    local_user_cache.delete(user_cache_key(user_id))
+    cache.delete(user_cache_key(user_id))
+
+
+class AsyncJWTAuthenticationMixin:
+    # authenticate() for the async views (SmartContact/async_api.py).
+    # Decoding the token is CPU only; the user lookup is awaited in aget_user().
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    def get_validated_token(self, raw_token):
+        with span("jwt_decode"):
+            return super().get_validated_token(raw_token)
+
+
+def get_async_authenticators():
+    # The configured DEFAULT_AUTHENTICATION_CLASSES that can run without a thread
+    return [
+        authentication_class()
+        for authentication_class in drf_api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        if hasattr(authentication_class, "aauthenticate")
+    ]
+
+
+class CachedJWTAuthentication(AsyncJWTAuthenticationMixin, JWTAuthentication):
+    def get_user(self, validated_token):
+        config = get_config()
+        backend = config.get("BACKEND")
+        timeout = config.get("TIMEOUT", 30)
+        # CHECK_REVOKE_TOKEN compares against the stored password hash, which
+        # has to come from a fresh row
+        if not backend or not timeout or api_settings.CHECK_REVOKE_TOKEN:
+            return super().get_user(validated_token)
+
+        key = user_cache_key(validated_token.get(api_settings.USER_ID_CLAIM))
+        started = time.perf_counter()
+        if backend == "local":
+            user = local_user_cache.get(key)
+        else:
+            user = cache.get(key)
+        record_cache("jwt_user", user is not None, time.perf_counter() - started)
+        if user is not None:
+            return user
+
+        # Raises AuthenticationFailed for unknown / inactive users,
+        # so only valid users are ever cached
+        user = super().get_user(validated_token)
+        if backend == "local":
+            # A copy, like the hits: this request may set attributes on its user
+            local_user_cache.set(
+                key, copy.copy(user), timeout, config.get("MAX_ENTRIES", 10000)
+            )
+        else:
+            cache.set(key, user, timeout=timeout)
+        return user
+
+    async def aget_user(self, validated_token):
+        config = get_config()
+        backend = config.get("BACKEND")
+        timeout = config.get("TIMEOUT", 30)
+        if not backend or not timeout or api_settings.CHECK_REVOKE_TOKEN:
+            return await self.aget_db_user(validated_token)
+
+        key = user_cache_key(validated_token.get(api_settings.USER_ID_CLAIM))
+        started = time.perf_counter()
+        if backend == "local":
+            user = local_user_cache.get(key)
+        else:
+            user = await async_cache.aget(key)
+        record_cache("jwt_user", user is not None, time.perf_counter() - started)
+        if user is not None:
+            return user
+
+        user = await self.aget_db_user(validated_token)
+        if backend == "local":
+            local_user_cache.set(
+                key, copy.copy(user), timeout, config.get("MAX_ENTRIES", 10000)
+            )
+        else:
+            await async_cache.aset(key, user, timeout=timeout)
+        return user
+
+    async def aget_db_user(self, validated_token):
+        # JWTAuthentication.get_user() on the async ORM
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        try:
+            user = await self.user_model.objects.aget(
+                **{api_settings.USER_ID_FIELD: user_id}
+            )
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+            api_settings.REVOKE_TOKEN_CLAIM
+        ) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(
+                "The user's password has been changed.", code="password_changed"
+            )
+        return user
+
+
+# Stateless mode (JWT_AUTH_MODE = "claims").
+#
+# Tokens carry the claims the contact endpoints need (user id, user_name,
+# is_active) plus a per-user token version. ClaimsJWTAuthentication builds a
+# ClaimsUser from those claims without touching the database. Revocation
+# lives in the cache (Redis):
+#   - revoke_user_tokens(user_id) bumps the user's token version, every token
+#     issued before is rejected (use it when deactivating a user)
+#   - revoke_token(token) rejects a single token by its jti
+# Both are checked with one get_many round trip per request. apps.py connects
+# user_deleted() / user_deactivated() to the user signals, so deleting or
+# deactivating a user through the ORM revokes its tokens in both modes.
+
+TOKEN_VERSION_CLAIM = "ver"
+
+
+def token_version_key(user_id):
+    return f"jwt_token_version_{user_id}"
+
+
+def revoked_token_key(jti):
+    return f"jwt_revoked_{jti}"
+
+
+def revocation_timeout():
+    # Revocations only need to outlive the tokens they reject
+    return int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+
+
+def get_token_version(user_id):
+    return cache.get(token_version_key(user_id), 0)
+
+
+async def aget_token_version(user_id):
+    return await async_cache.aget(token_version_key(user_id), 0)
+
+
+def add_user_claims(token, user, token_version=None):
+    token["user_name"] = user.user_name
+    token["is_active"] = user.is_active
+    if token_version is None:
+        token_version = get_token_version(user.id)
+    token[TOKEN_VERSION_CLAIM] = token_version
+    return token
+
+
+def revoke_user_tokens(user_id):
+    key = token_version_key(user_id)
+    cache.add(key, 0, timeout=revocation_timeout())
+    cache.incr(key)
+    forget_user(user_id)
+
+
+def revoke_token(token):
+    key = revoked_token_key(token[api_settings.JTI_CLAIM])
+    cache.set(key, True, timeout=revocation_timeout())
+
+
+def user_deleted(sender, instance, **kwargs):
+    # post_delete receiver: tokens of a deleted user must stop authenticating
+    # before they expire (writes would fail on the owner foreign key)
+    revoke_user_tokens(instance.pk)
+
+
+def user_deactivated(sender, instance, created=False, **kwargs):
+    # post_save receiver
+    if not created and not instance.is_active:
+        revoke_user_tokens(instance.pk)
+
+
+class ClaimsUser(TokenUser):
+    # Request user built from token claims only, no database row behind it
+
+    @cached_property
+    def user_name(self):
+        return self.token.get("user_name", "")
+
+    @cached_property
+    def is_active(self):
+        return self.token.get("is_active", False)
+
+    def __str__(self):
+        return self.user_name
+
+
+class ClaimsJWTAuthentication(AsyncJWTAuthenticationMixin, JWTAuthentication):
+    def claims_user(self, validated_token):
+        # Returns (user, revocation keys to look up)
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        user = ClaimsUser(validated_token)
+        if not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+
+        version_key = token_version_key(user.id)
+        revoked_key = revoked_token_key(validated_token.get(api_settings.JTI_CLAIM))
+        return user, [version_key, revoked_key]
+
+    def check_revocation(self, validated_token, keys, state):
+        version_key, revoked_key = keys
+        if state.get(revoked_key) or validated_token.get(
+            TOKEN_VERSION_CLAIM, 0
+        ) < state.get(version_key, 0):
+            raise AuthenticationFailed("Token has been revoked", code="token_revoked")
+
+    def get_user(self, validated_token):
+        user, keys = self.claims_user(validated_token)
+        self.check_revocation(validated_token, keys, cache.get_many(keys))
+        return user
+
+    async def aget_user(self, validated_token):
+        user, keys = self.claims_user(validated_token)
+        self.check_revocation(
+            validated_token, keys, await async_cache.aget_many(keys)
+        )
+        return user
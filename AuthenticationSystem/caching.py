@@ -0,0 +1,122 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from SmartContact import async_cache
+from SmartContact.metrics import record_cache
+
+# Cached "me" representation: the "user" of the auth responses.
+#
+# Stored as (user version, data) under user_<id>_me. The user version
+# (user_<id>_version) is bumped whenever the user row is saved or deleted
+# (apps.py connects invalidate_me() to post_save / post_delete), so an entry
+# built from an older row is never served. Both keys are read with one
+# get_many round trip: with a valid JWT, POST login/ answers without touching
+# a table, in either JWT_AUTH_MODE.
+#
+# Queryset .update() calls skip the signals: call invalidate_me() after them
+# when they change a serialized field.
+#
+# Settings (optional, ME_CACHE = None turns the cache off):
+#     ME_CACHE = {
+#         "TIMEOUT": 300,
+#         "VERSION_TIMEOUT": 2592000,
+#     }
+
+DEFAULT_TIMEOUT = 60 * 5
+DEFAULT_VERSION_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def get_config():
+    return getattr(settings, "ME_CACHE", {})
+
+
+def version_timeout():
+    return get_config().get("VERSION_TIMEOUT", DEFAULT_VERSION_TIMEOUT)
+
+
+def timeout():
+    return get_config().get("TIMEOUT", DEFAULT_TIMEOUT)
+
+
+def version_key(user_id):
+    return f"user_{user_id}_version"
+
+
+def me_key(user_id):
+    return f"user_{user_id}_me"
+
+
+def new_version():
+    # Start from the clock, so a lost counter never points back at an entry
+    # that is still alive
+    return int(time.time() * 1000)
+
+
+def read_entry(user_id, values):
+    # (data or None, version to store a fresh entry under, None if unknown)
+    version = values.get(version_key(user_id))
+    entry = values.get(me_key(user_id))
+    if version is not None and entry is not None and entry[0] == version:
+        return entry[1], version
+    return None, version
+
+
+def get_me(user_id):
+    # Returns (cached data or None, version); build a miss from a row read
+    # after this call and store it with set_me(user_id, version, data)
+    if get_config() is None:
+        return None, None
+    started = time.perf_counter()
+    data, version = read_entry(
+        user_id, cache.get_many([version_key(user_id), me_key(user_id)])
+    )
+    record_cache("me", data is not None, time.perf_counter() - started)
+    if version is None:
+        cache.add(version_key(user_id), new_version(), timeout=version_timeout())
+        version = cache.get(version_key(user_id))
+    return data, version
+
+
+async def aget_me(user_id):
+    if get_config() is None:
+        return None, None
+    started = time.perf_counter()
+    data, version = read_entry(
+        user_id,
+        await async_cache.aget_many([version_key(user_id), me_key(user_id)]),
+    )
+    record_cache("me", data is not None, time.perf_counter() - started)
+    if version is None:
+        await async_cache.aadd(
+            version_key(user_id), new_version(), timeout=version_timeout()
+        )
+        version = await async_cache.aget(version_key(user_id))
+    return data, version
+
+
+def set_me(user_id, version, data):
+    # The entry carries the version read before the row: if the user changed
+    # in between, the version moved on and the entry is never served
+    if version is not None:
+        cache.set(me_key(user_id), (version, dict(data)), timeout=timeout())
+
+
+async def aset_me(user_id, version, data):
+    if version is not None:
+        await async_cache.aset(me_key(user_id), (version, dict(data)), timeout())
+
+
+def invalidate_me(user_id):
+    try:
+        cache.incr(version_key(user_id))
+    except ValueError:
+        # No version yet: nothing was cached for this user
+        pass
+
+
+def user_changed(sender, instance, created=False, **kwargs):
+    # post_save / post_delete receiver; a new user has nothing cached yet
+    if not created:
+        invalidate_me(instance.pk)
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+# Password hashing: tunable hashers and a bounded hashing pool.
+#
+# PASSWORD_HASHERS (settings.py) lists the hashers below first; the first one
+# hashes new passwords. Hashes of any other listed hasher, or of the same one
+# with other parameters, still verify and are re-hashed on the next
+# successful login (check_password() / acheck_password()), so changing the
+# hasher or its cost needs no migration.
+#
+# Hashing is CPU bound by design. Every hash of a request runs in one
+# process-wide pool of WORKERS threads (the hash functions release the GIL),
+# so a login flood can use at most WORKERS cores and the other requests keep
+# the rest. At most QUEUE more hashes wait for a thread; beyond that the
+# request fails at once with HashingBusy (503) instead of piling up.
+#
+# Settings (all optional):
+#     PASSWORD_HASHING = {
+#         "SCRYPT": {"WORK_FACTOR": 2**15, "BLOCK_SIZE": 8, "PARALLELISM": 3},
+#         "ARGON2": {"TIME_COST": 2, "MEMORY_COST": 19456, "PARALLELISM": 1},
+#         "WORKERS": 2,     # default: half the cores
+#         "QUEUE": 64,
+#     }
+
+DEFAULT_QUEUE = 64
+
+
+def get_config():
+    return getattr(settings, "PASSWORD_HASHING", {})
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    # OWASP's N=2^15, r=8, p=3 (32 MiB per hash) by default
+    @property
+    def work_factor(self):
+        return get_config().get("SCRYPT", {}).get("WORK_FACTOR", 2**15)
+
+    @property
+    def block_size(self):
+        return get_config().get("SCRYPT", {}).get("BLOCK_SIZE", 8)
+
+    @property
+    def parallelism(self):
+        return get_config().get("SCRYPT", {}).get("PARALLELISM", 3)
+
+    @property
+    def maxmem(self):
+        # hashlib's default limit (32 MiB) is too small from N=2^15 on
+        return 2 * 128 * self.work_factor * self.block_size
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    # Argon2id, OWASP's t=2, m=19 MiB, p=1 by default; needs argon2-cffi
+    @property
+    def time_cost(self):
+        return get_config().get("ARGON2", {}).get("TIME_COST", 2)
+
+    @property
+    def memory_cost(self):
+        return get_config().get("ARGON2", {}).get("MEMORY_COST", 19456)
+
+    @property
+    def parallelism(self):
+        return get_config().get("ARGON2", {}).get("PARALLELISM", 1)
+
+
+# Hashing pool
+
+
+class HashingBusy(Exception):
+    pass
+
+
+class HashingPool:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.slots = None
+
+    def start(self):
+        with self.lock:
+            if self.executor is None:
+                config = get_config()
+                workers = config.get("WORKERS") or max(1, (os.cpu_count() or 2) // 2)
+                self.executor = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix="password-hashing"
+                )
+                self.slots = threading.BoundedSemaphore(
+                    workers + config.get("QUEUE", DEFAULT_QUEUE)
+                )
+            return self.executor, self.slots
+
+    def submit(self, function, *args):
+        executor, slots = self.start()
+        if not slots.acquire(blocking=False):
+            raise HashingBusy("too many password checks in progress, retry later")
+        future = executor.submit(function, *args)
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    def run(self, function, *args):
+        return self.submit(function, *args).result()
+
+    async def arun(self, function, *args):
+        return await asyncio.wrap_future(self.submit(function, *args))
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+            self.executor = None
+            self.slots = None
+
+
+hashing_pool = HashingPool()
+
+
+@receiver(setting_changed)
+def reset_hashing_pool(*, setting, **kwargs):
+    if setting == "PASSWORD_HASHING":
+        hashing_pool.shutdown()
+
+
+# Hashing processes (bulk provisioning)
+
+# Settings a hashing process copies from its parent, so it hashes with the
+# same hasher and cost
+PROCESS_SETTINGS = ["PASSWORD_HASHERS", "PASSWORD_HASHING"]
+
+
+def process_settings():
+    return {
+        name: getattr(settings, name)
+        for name in PROCESS_SETTINGS
+        if hasattr(settings, name)
+    }
+
+
+def setup_hashing_process(parent_settings):
+    # Initializer of the processes: they start without django (spawn /
+    # forkserver). Lives here, as importing the models needs django set up.
+    import django
+
+    django.setup()
+    for name, value in parent_settings.items():
+        setattr(settings, name, value)
+
+
+def hash_password(raw_password):
+    return hashing_pool.run(hashers.make_password, raw_password)
+
+
+async def ahash_password(raw_password):
+    return await hashing_pool.arun(hashers.make_password, raw_password)
+
+
+def check_password(user, raw_password):
+    # user.check_password() through the pool, re-hashing outdated hashes
+    is_correct, must_update = hashing_pool.run(
+        hashers.verify_password, raw_password, user.password
+    )
+    if is_correct and must_update:
+        user.password = hash_password(raw_password)
+        user.save(update_fields=["password"])
+    return is_correct
+
+
+async def acheck_password(user, raw_password):
+    is_correct, must_update = await hashing_pool.arun(
+        hashers.verify_password, raw_password, user.password
+    )
+    if is_correct and must_update:
+        user.password = await ahash_password(raw_password)
+        await user.asave(update_fields=["password"])
+    return is_correct
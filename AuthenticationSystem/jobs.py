@@ -0,0 +1,25 @@
+from Jobs.models import Job
+from Jobs.queue import register
+from .provisioning import provision_users, scrub_rows, unseal_rows
+
+# Background version of /api/auth/provision/ (see Jobs/queue.py), registered
+# by AuthenticationsystemConfig.ready().
+
+
+@register("auth.provision")
+def provision_job(job, progress):
+    def store_hashes(rows):
+        # Plaintext passwords do not outlive the hashing step in the job row
+        # (a retried job starts from the hashes)
+        Job.objects.filter(id=job.id).update(payload={"users": rows})
+
+    try:
+        return provision_users(
+            unseal_rows(job.payload["users"]), progress=progress, hashed=store_hashes
+        )
+    finally:
+        # Succeeded or failed, the job is not run again: no password of any
+        # form stays behind
+        Job.objects.filter(id=job.id).update(
+            payload={"users": scrub_rows(job.payload["users"])}
+        )
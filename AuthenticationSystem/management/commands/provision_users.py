@@ -0,0 +1,76 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from AuthenticationSystem.provisioning import json_rows, provision_users
+
+
+def read_csv(path):
+    # Columns: user_name, password (or password_hash), first_name, last_name
+    with open(path, encoding="utf-8-sig", newline="") as file:
+        return [
+            {name: value for name, value in row.items() if value}
+            for row in csv.DictReader(file)
+        ]
+
+
+def read_json(path):
+    # A list of users or {"users": [...]}, as for /api/auth/provision/
+    with open(path, encoding="utf-8-sig") as file:
+        return json_rows(json.load(file))
+
+
+READERS = {"csv": read_csv, "json": read_json}
+
+
+class Command(BaseCommand):
+    help = (
+        "Create many users at once from a CSV or JSON file, hashing their "
+        "passwords on a pool of processes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSON file of users")
+        parser.add_argument(
+            "--format",
+            choices=sorted(READERS),
+            default=None,
+            help="Input format (defaults to the file extension)",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=None,
+            help="Hashing processes (defaults to BULK_PROVISION['PROCESSES'])",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        input_format = options["format"] or path.rsplit(".", 1)[-1].lower()
+        if input_format not in READERS:
+            raise CommandError("use --format csv or --format json")
+        try:
+            rows = READERS[input_format](path)
+        except (OSError, ValueError, csv.Error) as e:
+            raise CommandError(f"cannot read {path}: {e}")
+
+        totals = []
+
+        def progress(done, total=None):
+            if total is not None:
+                totals.append(total)
+            if self.stdout.isatty():
+                self.stdout.write(f"\r{done}/{totals[-1]}", ending="")
+
+        result = provision_users(
+            rows, processes=options["processes"], progress=progress
+        )
+        if self.stdout.isatty():
+            self.stdout.write("")
+
+        for error in result["errors"]:
+            self.stderr.write(f"row {error['row']}: {error['error']}")
+        self.stdout.write(
+            f"{result['created']} users created, {result['failed']} failed"
+        )
@@ -1,4 +1,5 @@
-from django.db import models
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import (
     BaseUserManager,
     AbstractBaseUser,
@@ -7,6 +8,9 @@ from django.contrib.auth.models import (
     PermissionsMixin,
 )
 
+from SmartContact.metrics import span
+from .hashers import ahash_password, hash_password
+
 
 class CustomUserManager(BaseUserManager):
     def get_by_natural_key(self, id_code):
@@ -23,8 +27,28 @@ class CustomUserManager(BaseUserManager):
         if not all([password, user_name]):
             raise ValueError(f"'user_name' and 'password' fields are required")
 
-        if CustomUser.objects.filter(user_name=user_name).exists():
-            raise ValueError(f"'user_name': {user_name} is allready exist")
+        user = self.model(
+            first_name=first_name,
+            last_name=last_name,
+            user_name=user_name,
+            **extra_fields,
+        )
+
+        with span("password_hash"):
+            user.password = hash_password(password)
+        self.insert_user(user)
+        return user
+
+    async def acreate_user(
+        self,
+        first_name=None,
+        last_name=None,
+        user_name=None,
+        password=None,
+        **extra_fields,
+    ):
+        if not all([password, user_name]):
+            raise ValueError(f"'user_name' and 'password' fields are required")
 
         user = self.model(
             first_name=first_name,
@@ -33,10 +57,21 @@ class CustomUserManager(BaseUserManager):
             **extra_fields,
         )
 
-        user.set_password(password)
-        user.save(using=self._db)
+        # Hashing is CPU bound, keep it off the event loop
+        with span("password_hash"):
+            user.password = await ahash_password(password)
+        await sync_to_async(self.insert_user)(user)
         return user
 
+    def insert_user(self, user):
+        # One INSERT: a taken user_name is caught by the unique constraint,
+        # not by a lookup before (which races with concurrent signups)
+        try:
+            with transaction.atomic(using=self._db):
+                user.save(using=self._db, force_insert=True)
+        except IntegrityError:
+            raise ValueError(f"'user_name': {user.user_name} is allready exist")
+
 
 class CustomUser(AbstractBaseUser, PermissionsMixin):
 
@@ -0,0 +1,276 @@
+import base64
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from cryptography.fernet import Fernet, InvalidToken
+from django.conf import settings
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.db import IntegrityError, transaction
+from django.utils.crypto import salted_hmac
+
+from .hashers import hash_password, process_settings, setup_hashing_process
+from .models import CustomUser
+
+# Bulk user provisioning, used by /api/auth/provision/ and
+# manage.py provision_users to onboard whole organisations at once.
+#
+# Rows carry either a plaintext "password" or a ready "password_hash" (any
+# format of PASSWORD_HASHERS, e.g. exported from another Django site).
+# Plaintext passwords are hashed first, over a pool of processes (one hash
+# keeps a core busy for a few hundred ms, thousands of them would take
+# minutes on one core); then users are inserted PROVISION_CHUNK_SIZE at a
+# time, one bulk_create per chunk. Hashes of other hashers / costs are
+# upgraded on each user's first login (hashers.py).
+#
+# Plaintext passwords of a queued batch never reach the database as is: they
+# wait in Job.payload sealed (Fernet, with a key derived from SECRET_KEY) and
+# every password, sealed or hashed, is scrubbed from the payload when the job
+# ends (jobs.py).
+#
+# Settings (all optional):
+#     BULK_PROVISION = {
+#         "PROCESSES": None,            # hashing processes, default: all cores
+#         "INLINE_MAX_PASSWORDS": 10,   # more plaintext passwords go to a job
+#     }
+
+PROVISION_CHUNK_SIZE = 1000
+# Only the first errors are reported back, the rest are just counted
+MAX_REPORTED_ERRORS = 1000
+DEFAULT_INLINE_MAX_PASSWORDS = 10
+# Passwords sent to a hashing process at a time
+HASH_CHUNK_SIZE = 16
+
+
+def get_config():
+    return getattr(settings, "BULK_PROVISION", {})
+
+
+def inline_max_passwords():
+    return get_config().get("INLINE_MAX_PASSWORDS", DEFAULT_INLINE_MAX_PASSWORDS)
+
+
+def json_rows(data):
+    # Body is either a list of users or {"users": [...]}
+    if isinstance(data, dict):
+        data = data.get("users")
+    if not isinstance(data, list):
+        raise ValueError("expected a list of users")
+    return data
+
+
+def has_plain_password(row):
+    return isinstance(row, dict) and isinstance(row.get("password"), str)
+
+
+def sealing_key():
+    key = salted_hmac(
+        "AuthenticationSystem.provisioning", "sealed passwords", algorithm="sha256"
+    ).digest()
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+def seal_rows(rows):
+    # The rows with each plaintext "password" replaced by a "sealed_password"
+    fernet = sealing_key()
+    sealed = []
+    for row in rows:
+        if has_plain_password(row):
+            row = dict(row)
+            password = row.pop("password").encode()
+            row["sealed_password"] = fernet.encrypt(password).decode()
+        sealed.append(row)
+    return sealed
+
+
+def unseal_rows(rows):
+    fernet = sealing_key()
+    unsealed = []
+    for row in rows:
+        if isinstance(row, dict) and "sealed_password" in row:
+            row = dict(row)
+            try:
+                row["password"] = fernet.decrypt(row.pop("sealed_password")).decode()
+            except (InvalidToken, TypeError):
+                raise ValueError(
+                    "sealed passwords cannot be read (SECRET_KEY changed?)"
+                )
+        unsealed.append(row)
+    return unsealed
+
+
+def scrub_rows(rows):
+    # The rows without any password, plain, sealed or hashed
+    secrets = ["password", "sealed_password", "password_hash"]
+    return [
+        {name: value for name, value in row.items() if name not in secrets}
+        if isinstance(row, dict)
+        else row
+        for row in rows
+    ]
+
+
+def hashing_context():
+    # Hashing processes are started from threads (run_jobs workers, the web
+    # server): forking a multithreaded process can leave locks held forever in
+    # the child, so they start from a fresh interpreter instead
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def hash_passwords(passwords, processes=None, progress=None):
+    # make_password() of every password, in order.
+    # processes=0 hashes in this process, through the hashing pool of the
+    # request path (may raise HashingBusy).
+    if processes is None:
+        processes = get_config().get("PROCESSES") or os.cpu_count() or 1
+    if processes == 0:
+        return [hash_password(password) for password in passwords]
+
+    hashes = []
+    with ProcessPoolExecutor(
+        max_workers=min(processes, max(1, len(passwords))),
+        mp_context=hashing_context(),
+        initializer=setup_hashing_process,
+        initargs=(process_settings(),),
+    ) as executor:
+        for password_hash in executor.map(
+            make_password, passwords, chunksize=HASH_CHUNK_SIZE
+        ):
+            hashes.append(password_hash)
+            if progress and len(hashes) % HASH_CHUNK_SIZE == 0:
+                progress(len(hashes))
+    return hashes
+
+
+def hash_rows(rows, processes=None, progress=None):
+    # The rows with each plaintext "password" replaced by its "password_hash"
+    plain = [index for index, row in enumerate(rows) if has_plain_password(row)]
+    if not plain:
+        return rows
+    hashes = hash_passwords(
+        [rows[index]["password"] for index in plain], processes, progress
+    )
+    rows = list(rows)
+    for index, password_hash in zip(plain, hashes):
+        row = dict(rows[index])
+        del row["password"]
+        row["password_hash"] = password_hash
+        rows[index] = row
+    return rows
+
+
+def validate_row(row):
+    # Returns (user fields, None) or (None, error message), after hash_rows()
+    if not isinstance(row, dict):
+        return None, "row is not an object"
+
+    user_name = str(row.get("user_name") or "").strip()
+    password_hash = row.get("password_hash")
+    if not user_name or not password_hash:
+        return None, "(user_name, password) are required"
+    if len(user_name) > CustomUser._meta.get_field("user_name").max_length:
+        return None, "user_name is too long"
+    try:
+        identify_hasher(password_hash)
+    except (TypeError, ValueError):
+        return None, "password_hash is not in a known format"
+
+    fields = {"user_name": user_name, "password": password_hash}
+    for name in ["first_name", "last_name"]:
+        value = str(row.get(name) or "").strip() or None
+        if value and len(value) > CustomUser._meta.get_field(name).max_length:
+            return None, f"{name} is too long"
+        fields[name] = value
+    return fields, None
+
+
+def insert_chunk(chunk):
+    # Returns (created, taken user_names); names taken by another request
+    # between the check and the insert are dropped and the insert retried
+    taken = set(
+        CustomUser.objects.filter(
+            user_name__in=[fields["user_name"] for fields in chunk]
+        ).values_list("user_name", flat=True)
+    )
+    while True:
+        users = [
+            CustomUser(**fields) for fields in chunk if fields["user_name"] not in taken
+        ]
+        try:
+            with transaction.atomic():
+                return len(CustomUser.objects.bulk_create(users)), taken
+        except IntegrityError:
+            now_taken = set(
+                CustomUser.objects.filter(
+                    user_name__in=[user.user_name for user in users]
+                ).values_list("user_name", flat=True)
+            )
+            if not now_taken:
+                raise
+            taken |= now_taken
+
+
+def provision_users(rows, processes=None, progress=None, hashed=None):
+    # Returns {"created": int, "failed": int, "errors": [{"row": n, "error": str}]}
+    # progress(done, total) counts the hashes, then the rows.
+    # hashed(rows) gets the rows once their plaintext passwords are hashed.
+    hashes = sum(1 for row in rows if has_plain_password(row))
+    total = hashes + len(rows)
+    if progress:
+        progress(0, total)
+    if hashes:
+        rows = hash_rows(rows, processes, progress)
+        if hashed:
+            hashed(rows)
+
+    created = 0
+    failed = 0
+    errors = []
+
+    def fail(row_number, error):
+        nonlocal failed
+        failed += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"row": row_number, "error": error})
+
+    seen = set()
+    chunk = []
+    row_numbers = {}
+
+    def flush():
+        nonlocal created
+        inserted, taken = insert_chunk(chunk)
+        created += inserted
+        for fields in chunk:
+            user_name = fields["user_name"]
+            if user_name in taken:
+                error = f"'user_name': {user_name} is allready exist"
+                fail(row_numbers[user_name], error)
+
+    for row_number, row in enumerate(rows, start=1):
+        fields, error = validate_row(row)
+        if not error and fields["user_name"] in seen:
+            error = f"'user_name': {fields['user_name']} is repeated"
+        if error:
+            fail(row_number, error)
+            continue
+        seen.add(fields["user_name"])
+        chunk.append(fields)
+        row_numbers[fields["user_name"]] = row_number
+
+        if len(chunk) >= PROVISION_CHUNK_SIZE:
+            flush()
+            chunk = []
+            row_numbers = {}
+            if progress:
+                progress(hashes + row_number)
+
+    if chunk:
+        flush()
+    if progress:
+        progress(total, total)
+
+    errors.sort(key=lambda error: error["row"])
+    return {"created": created, "failed": failed, "errors": errors}
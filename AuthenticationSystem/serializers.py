@@ -2,7 +2,24 @@ from rest_framework import serializers
 from .models import CustomUser
 
 
+class UserSerializer(serializers.ModelSerializer):
+    # The "user" of the auth responses: plain columns only, no password hash
+    # and no groups / user_permissions M2M (two queries per user)
+    class Meta:
+        model = CustomUser
+        fields = [
+            "id",
+            "user_name",
+            "first_name",
+            "last_name",
+            "last_login",
+            "is_superuser",
+        ]
+
+
 class CustomUserSerializer(serializers.ModelSerializer):
+    # With permissions, where they are actually needed: load the users with
+    # prefetch_related("groups", "user_permissions")
     class Meta:
         model = CustomUser
-        fields = "__all__"
+        exclude = ["password"]
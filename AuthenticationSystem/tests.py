@@ -1,3 +1,494 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from Jobs.models import Job
+from Jobs.queue import work
+
+from .authentication import (
+    CachedJWTAuthentication,
+    ClaimsJWTAuthentication,
+    forget_user,
+    local_user_cache,
+    revoke_token,
+    revoke_user_tokens,
+)
+from .hashers import hashing_pool
+from .models import CustomUser
+from .views import get_tokens_for_user
+
+
+# The async views (SmartContact/asgi_urls.py) must answer exactly like the sync ones
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    ROOT_URLCONF="SmartContact.asgi_urls",
+)
+class AsyncAuthenticationTests(TestCase):
+
+    async def test_signup_then_login_with_jwt(self):
+        response = await self.async_client.post(
+            "/api/auth/signup/",
+            {"user_name": "async", "password": "pw"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        access = response.json()["tokens"]["access"]
+
+        response = await self.async_client.post(
+            "/api/auth/login/", headers={"Authorization": f"Bearer {access}"}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["user"]["user_name"], "async")
+
+    async def test_signup_duplicate_user_name(self):
+        await CustomUser.objects.acreate_user(user_name="taken", password="pw")
+
+        response = await self.async_client.post(
+            "/api/auth/signup/",
+            {"user_name": "taken", "password": "pw"},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 403)
+
+    async def test_manual_login(self):
+        await CustomUser.objects.acreate_user(user_name="async", password="pw")
+
+        wrong = await self.async_client.post(
+            "/api/auth/manual-login/",
+            {"user_name": "async", "password": "nope"},
+            content_type="application/json",
+        )
+        right = await self.async_client.post(
+            "/api/auth/manual-login/",
+            {"user_name": "async", "password": "pw", "remember": True},
+            content_type="application/json",
+        )
+
+        self.assertEqual(wrong.status_code, 404)
+        self.assertEqual(right.status_code, 200)
+        self.assertIn("tokens", right.json())
+
+    async def test_invalid_token_is_rejected(self):
+        response = await self.async_client.get(
+            "/api/contact/all/", headers={"Authorization": "Bearer nope"}
+        )
+
+        self.assertEqual(response.status_code, 401)
+        self.assertIn("WWW-Authenticate", response.headers)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    PASSWORD_HASHING={"SCRYPT": {"WORK_FACTOR": 2**10, "PARALLELISM": 1}},
+    LOGIN_RATE_LIMIT={"USER_ATTEMPTS": 2, "IP_ATTEMPTS": 4, "SIGNUP_IP_ATTEMPTS": 1},
+)
+class PasswordHashingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def login(self, user_name="owner", password="pw", **kwargs):
+        return self.client.post(
+            "/api/auth/manual-login/",
+            {"user_name": user_name, "password": password},
+            content_type="application/json",
+            **kwargs,
+        )
+
+    def test_new_passwords_use_the_tuned_hasher(self):
+        user = CustomUser.objects.create_user(user_name="owner", password="pw")
+
+        self.assertTrue(user.password.startswith("scrypt$1024$"))
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_outdated_hashes_are_upgraded_on_login(self):
+        user = CustomUser.objects.create_user(user_name="owner", password="pw")
+        CustomUser.objects.filter(id=user.id).update(
+            password=make_password("pw", hasher="pbkdf2_sha256")
+        )
+
+        self.assertEqual(self.login().status_code, 200)
+
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("scrypt$1024$"))
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_attempts_are_limited_before_hashing(self):
+        CustomUser.objects.create_user(user_name="owner", password="pw")
+        self.assertEqual(self.login(password="wrong").status_code, 404)
+        self.assertEqual(self.login(password="wrong").status_code, 404)
+
+        # No user lookup, no hashing
+        with self.assertNumQueries(0):
+            response = self.login()
+        self.assertEqual(response.status_code, 429)
+        # What is left of the 300 s window
+        self.assertIn(int(response["Retry-After"]), range(1, 301))
+
+        # Another user from the same address, until the address is limited too
+        self.assertEqual(self.login(user_name="other").status_code, 404)
+        self.assertEqual(self.login(user_name="other").status_code, 429)
+        self.assertEqual(
+            self.login(user_name="third", REMOTE_ADDR="10.0.0.2").status_code, 404
+        )
+
+    def test_successful_logins_do_not_lock_the_account(self):
+        CustomUser.objects.create_user(user_name="owner", password="pw")
+        self.assertEqual(self.login(password="wrong").status_code, 404)
+
+        for _ in range(3):
+            self.assertEqual(self.login().status_code, 200)
+
+        # Still counted per address
+        self.assertEqual(self.login(user_name="other").status_code, 429)
+
+    def test_signups_are_limited_per_address(self):
+        for user_name, expected in [("first", 201), ("second", 429)]:
+            response = self.client.post(
+                "/api/auth/signup/",
+                {"user_name": user_name, "password": "pw"},
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, expected)
+
+    @override_settings(PASSWORD_HASHING={"WORKERS": 1, "QUEUE": 0})
+    def test_a_full_hashing_pool_sheds_logins(self):
+        CustomUser.objects.create_user(user_name="owner", password="pw")
+        release = threading.Event()
+        busy = hashing_pool.submit(release.wait)
+        try:
+            response = self.login()
+        finally:
+            release.set()
+            busy.result()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.login().status_code, 200)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    PASSWORD_HASHING={"SCRYPT": {"WORK_FACTOR": 2**10, "PARALLELISM": 1}},
+)
+class UserRepresentationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        local_user_cache.clear()
+        response = self.client.post(
+            "/api/auth/signup/",
+            {"user_name": "owner", "password": "pw", "first_name": "Ann"},
+            content_type="application/json",
+        )
+        self.user_data = response.json()["user"]
+        self.access = response.json()["tokens"]["access"]
+
+    def login(self):
+        return self.client.post(
+            "/api/auth/login/", headers={"Authorization": f"Bearer {self.access}"}
+        )
+
+    def test_no_password_hash_or_permissions(self):
+        self.assertEqual(
+            set(self.user_data),
+            {"id", "user_name", "first_name", "last_name", "last_login", "is_superuser"},
+        )
+
+    def test_repeated_jwt_logins_hit_no_tables(self):
+        first = self.login()
+
+        with self.assertNumQueries(0):
+            second = self.login()
+
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(second.json()["user"], self.user_data)
+
+    def test_changes_of_the_user_are_served_at_once(self):
+        self.login()
+        user = CustomUser.objects.get(user_name="owner")
+        user.first_name = "Anna"
+        user.save()
+
+        self.assertEqual(self.login().json()["user"]["first_name"], "Anna")
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class TokenRevocationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        local_user_cache.clear()
+        self.user = CustomUser.objects.create_user(user_name="owner", password="pw")
+        self.tokens = get_tokens_for_user(self.user)
+
+    def claims_authenticate(self, access):
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {access}")
+        return ClaimsJWTAuthentication().authenticate(request)
+
+    def test_claims_mode_needs_no_queries(self):
+        with self.assertNumQueries(0):
+            user, _ = self.claims_authenticate(self.tokens["access"])
+
+        self.assertEqual((user.id, user.user_name), (str(self.user.id), "owner"))
+        self.assertTrue(user.is_active)
+
+    def test_revoke_user_tokens(self):
+        revoke_user_tokens(self.user.id)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.claims_authenticate(self.tokens["access"])
+        # Tokens issued afterwards carry the new version
+        user, _ = self.claims_authenticate(get_tokens_for_user(self.user)["access"])
+        self.assertEqual(user.id, str(self.user.id))
+
+    def test_revoke_token(self):
+        other = get_tokens_for_user(self.user)["access"]
+        _, token = self.claims_authenticate(self.tokens["access"])
+
+        revoke_token(token)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.claims_authenticate(self.tokens["access"])
+        self.assertEqual(self.claims_authenticate(other)[0].id, str(self.user.id))
+
+    def test_deleted_user_tokens_are_revoked(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+        # Caches the user of the "db" mode
+        self.assertEqual(client.get("/api/contact/all/").status_code, 200)
+
+        self.user.delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.claims_authenticate(self.tokens["access"])
+        response = client.post(
+            "/api/contact/create/",
+            {"name": "Alice", "phone_number": "+12025550100", "tags": "work"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_deactivated_user_tokens_are_revoked(self):
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.claims_authenticate(self.tokens["access"])
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    JWT_USER_CACHE={"BACKEND": "local", "TIMEOUT": 30, "MAX_ENTRIES": 100},
+)
+class CachedJWTAuthenticationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        local_user_cache.clear()
+        self.user = CustomUser.objects.create_user(
+            user_name="owner", password="pw", first_name="Ann"
+        )
+        self.access = get_tokens_for_user(self.user)["access"]
+
+    def authenticate(self, access=None):
+        request = APIRequestFactory().get(
+            "/", HTTP_AUTHORIZATION=f"Bearer {access or self.access}"
+        )
+        return CachedJWTAuthentication().authenticate(request)
+
+    def test_cache_hit_needs_no_queries(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate()
+
+        self.assertEqual((user.pk, user.user_name), (self.user.pk, "owner"))
+
+    def test_shared_cache_hit_needs_no_queries(self):
+        with self.settings(JWT_USER_CACHE={"BACKEND": "cache", "TIMEOUT": 30}):
+            self.authenticate()
+
+            with self.assertNumQueries(0):
+                user, _ = self.authenticate()
+
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertIsNone(local_user_cache.get(f"jwt_user_{self.user.pk}"))
+
+    def test_hits_are_copies(self):
+        first, _ = self.authenticate()
+        first.first_name = "changed"
+
+        self.assertEqual(self.authenticate()[0].first_name, "Ann")
+
+    def test_forget_user_after_a_profile_change(self):
+        self.authenticate()
+        CustomUser.objects.filter(pk=self.user.pk).update(first_name="Anna")
+        # Within the timeout the cached row is served
+        self.assertEqual(self.authenticate()[0].first_name, "Ann")
+
+        forget_user(self.user.pk)
+
+        with self.assertNumQueries(1):
+            user, _ = self.authenticate()
+        self.assertEqual(user.first_name, "Anna")
+
+    def test_deleted_user_is_forgotten(self):
+        self.authenticate()
+
+        self.user.delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_check_revoke_token_rejects_revoked_tokens(self):
+        # simplejwt modules hold on to the api_settings object they imported,
+        # so the setting is switched on that object rather than with settings()
+        jwt_settings.CHECK_REVOKE_TOKEN = True
+        self.addCleanup(delattr, jwt_settings, "CHECK_REVOKE_TOKEN")
+        access = get_tokens_for_user(self.user)["access"]
+        self.assertEqual(self.authenticate(access)[0].pk, self.user.pk)
+
+        self.user.set_password("new")
+        self.user.save()
+
+        # The stored hash is compared on every request, nothing is cached
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(access)
+        self.assertIsNone(local_user_cache.get(f"jwt_user_{self.user.pk}"))
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    PASSWORD_HASHING={"SCRYPT": {"WORK_FACTOR": 2**10, "PARALLELISM": 1}},
+    BULK_PROVISION={"PROCESSES": 2, "INLINE_MAX_PASSWORDS": 4},
+    JOBS={"BACKEND": "db"},
+)
+class ProvisioningTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = CustomUser.objects.create_user(
+            user_name="admin", password="pw", is_superuser=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def provision(self, users):
+        return self.client.post("/api/auth/provision/", {"users": users}, format="json")
+
+    def test_signup_is_a_single_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            CustomUser.objects.create_user(user_name="new", password="pw")
+
+        # Around the INSERT only the savepoint of the test's transaction
+        statements = [
+            query["sql"].split()[0]
+            for query in queries
+            if "SAVEPOINT" not in query["sql"]
+        ]
+        self.assertEqual(statements, ["INSERT"])
+
+        response = self.client.post(
+            "/api/auth/signup/",
+            {"user_name": "new", "password": "pw"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(CustomUser.objects.filter(user_name="new").count(), 1)
+
+    def test_small_batches_are_provisioned_inline(self):
+        response = self.provision(
+            [
+                {"user_name": "ann", "password": "pw", "first_name": "Ann"},
+                {"user_name": "bob", "password_hash": make_password("bob-pw")},
+                {"user_name": "ann", "password": "other"},
+                {"user_name": "admin", "password": "pw"},
+                {"user_name": "eve", "password_hash": "not a hash"},
+                {"password": "pw"},
+            ]
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(
+            [error["row"] for error in response.data["errors"]], [3, 4, 5, 6]
+        )
+        self.assertTrue(CustomUser.objects.get(user_name="ann").check_password("pw"))
+        self.assertTrue(
+            CustomUser.objects.get(user_name="bob").check_password("bob-pw")
+        )
+
+    def test_large_batches_are_hashed_by_a_job(self):
+        users = [{"user_name": f"user{n}", "password": f"pw{n}"} for n in range(5)]
+
+        response = self.provision(users)
+
+        self.assertEqual(response.status_code, 202)
+        job = Job.objects.get(id=response.data["job"]["id"])
+        # Queued sealed, never in plaintext
+        self.assertNotIn("pw3", str(job.payload))
+        self.assertIn("sealed_password", job.payload["users"][3])
+
+        self.assertEqual(work(threading.Event(), once=True), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result["created"], 5)
+        self.assertEqual(job.payload["users"][3], {"user_name": "user3"})
+        self.assertTrue(
+            CustomUser.objects.get(user_name="user3").check_password("pw3")
+        )
+
+    def test_failed_jobs_keep_no_passwords(self):
+        users = [{"user_name": f"user{n}", "password": f"pw{n}"} for n in range(5)]
+        response = self.provision(users)
+
+        # The worker cannot unseal the passwords
+        with override_settings(SECRET_KEY="another key"), self.assertLogs("Jobs.queue"):
+            self.assertEqual(work(threading.Event(), once=True), 1)
+
+        job = Job.objects.get(id=response.data["job"]["id"])
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.payload["users"][0], {"user_name": "user0"})
+        self.assertFalse(CustomUser.objects.filter(user_name="user0").exists())
+
+    def test_only_superusers_provision(self):
+        self.client.force_authenticate(
+            user=CustomUser.objects.create_user(user_name="user", password="pw")
+        )
+
+        self.assertEqual(self.provision([]).status_code, 403)
+
+    def test_provision_users_command(self):
+        with tempfile.NamedTemporaryFile(
+            "w", suffix=".csv", delete=False, encoding="utf-8"
+        ) as file:
+            file.write("user_name,password,first_name\n")
+            file.write("ann,pw,Ann\nbob,pw,\nann,pw,\n")
+        self.addCleanup(os.remove, file.name)
+
+        with open(os.devnull, "w") as devnull:
+            call_command("provision_users", file.name, stdout=devnull, stderr=devnull)
+
+        self.assertEqual(
+            sorted(
+                CustomUser.objects.exclude(user_name="admin").values_list(
+                    "user_name", "first_name"
+                )
+            ),
+            [("ann", "Ann"), ("bob", None)],
+        )
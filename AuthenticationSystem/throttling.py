@@ -0,0 +1,140 @@
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from SmartContact import async_cache
+
+# Rate limits of the endpoints that hash passwords, checked before any
+# hashing (and before the user lookup), so credential stuffing bursts are
+# turned away cheaply.
+#
+# Fixed windows counted in the shared cache (Redis), one counter per key:
+#   manual-login: per user_name (USER_ATTEMPTS) and per client IP (IP_ATTEMPTS)
+#   signup:       per client IP (SIGNUP_IP_ATTEMPTS)
+# Attempts are counted before hashing, so every one counts; a successful
+# login then clears its user_name counter, so a user who logs in often never
+# locks their own account (the IP counter keeps every attempt, each one cost
+# a hash). Windows are aligned on the clock (the window number is part of
+# the key), and a limited request gets 429 with Retry-After set to the
+# seconds left in the window.
+#
+# Settings (all optional, LOGIN_RATE_LIMIT = None turns the limits off):
+#     LOGIN_RATE_LIMIT = {
+#         "WINDOW": 300,               # seconds
+#         "USER_ATTEMPTS": 10,
+#         "IP_ATTEMPTS": 100,
+#         "SIGNUP_IP_ATTEMPTS": 20,
+#         "NUM_PROXIES": 0,            # trusted proxies adding X-Forwarded-For
+#     }
+
+DEFAULT_WINDOW = 60 * 5
+DEFAULT_USER_ATTEMPTS = 10
+DEFAULT_IP_ATTEMPTS = 100
+DEFAULT_SIGNUP_IP_ATTEMPTS = 20
+
+
+def get_config():
+    return getattr(settings, "LOGIN_RATE_LIMIT", {})
+
+
+def client_ip(request):
+    # REMOTE_ADDR, or the address the last trusted proxy saw
+    num_proxies = (get_config() or {}).get("NUM_PROXIES", 0)
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR")
+    if num_proxies and forwarded:
+        hops = [hop.strip() for hop in forwarded.split(",")]
+        return hops[-min(num_proxies, len(hops))]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def rate_key(scope, kind, value, window_number):
+    digest = hashlib.sha1(str(value).encode()).hexdigest()
+    return f"rate_{scope}_{kind}_{digest}_{window_number}"
+
+
+def limits(scope, request, user_name=None):
+    # [(key, max attempts)] of a request, [] when rate limiting is off
+    config = get_config()
+    if config is None:
+        return []
+    number, _ = current_window()
+    if scope == "signup":
+        return [
+            (
+                rate_key(scope, "ip", client_ip(request), number),
+                config.get("SIGNUP_IP_ATTEMPTS", DEFAULT_SIGNUP_IP_ATTEMPTS),
+            )
+        ]
+    return [
+        (
+            rate_key(scope, "ip", client_ip(request), number),
+            config.get("IP_ATTEMPTS", DEFAULT_IP_ATTEMPTS),
+        ),
+        (
+            rate_key(scope, "user", user_name, number),
+            config.get("USER_ATTEMPTS", DEFAULT_USER_ATTEMPTS),
+        ),
+    ]
+
+
+def window():
+    return (get_config() or {}).get("WINDOW", DEFAULT_WINDOW)
+
+
+def current_window():
+    # (window number, whole seconds left in it)
+    now = time.time()
+    number = int(now // window())
+    return number, max(1, math.ceil((number + 1) * window() - now))
+
+
+def count_attempt(scope, request, user_name=None):
+    # Counts the attempt; returns the seconds to wait when over a limit, else None
+    for key, max_attempts in limits(scope, request, user_name):
+        try:
+            attempts = cache.incr(key)
+        except ValueError:
+            # First attempt of the window (or a race with another one)
+            if not cache.add(key, 1, timeout=window()):
+                attempts = cache.incr(key)
+            else:
+                attempts = 1
+        if attempts > max_attempts:
+            return current_window()[1]
+    return None
+
+
+async def acount_attempt(scope, request, user_name=None):
+    for key, max_attempts in limits(scope, request, user_name):
+        try:
+            attempts = await async_cache.aincr(key)
+        except ValueError:
+            if not await async_cache.aadd(key, 1, timeout=window()):
+                attempts = await async_cache.aincr(key)
+            else:
+                attempts = 1
+        if attempts > max_attempts:
+            return current_window()[1]
+    return None
+
+
+def user_key(scope, user_name):
+    if get_config() is None:
+        return None
+    return rate_key(scope, "user", user_name, current_window()[0])
+
+
+def clear_user_attempts(scope, user_name):
+    # After a successful login
+    key = user_key(scope, user_name)
+    if key:
+        cache.delete(key)
+
+
+async def aclear_user_attempts(scope, user_name):
+    key = user_key(scope, user_name)
+    if key:
+        await async_cache.adelete(key)
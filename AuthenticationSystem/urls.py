@@ -25,8 +25,18 @@ urlpatterns = [
     # Method: POST
     # URL: /api/auth/login/
     # Headers: Authorization: Bearer <access_token>
-    # Auth: AllowAny (view uses JWTAuthentication manually)
+    # Auth: AllowAny (the JWT is checked once by the default authentication class)
     # Success: HTTP 200, { "success": "...", "user": {...} }  (no tokens are returned here)
     # Error cases: 400 with {"error": "JWT is not ok"}
     path("login/", views.login, name="login"),
+
+    # Bulk user provisioning (onboarding a whole organisation)
+    # Method: POST
+    # URL: /api/auth/provision/
+    # Body (JSON): { "users": [ { "user_name": str, "password": str | "password_hash": str, "first_name": str (optional), "last_name": str (optional) }, ... ] }
+    # Auth: Bearer token of a superuser
+    # Success: HTTP 201, { "msg": "users provisioned", "created": int, "failed": int, "errors": [{"row": int, "error": str}] }
+    #          HTTP 202 with a job (see /api/jobs/) for more than a few plaintext passwords
+    # Error cases: 400 / 403 / 503 with {"error": "..."}
+    path("provision/", views.provision, name="provision"),
 ]
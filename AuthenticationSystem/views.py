@@ -1,56 +1,87 @@
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework.exceptions import AuthenticationFailed
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 from rest_framework.permissions import AllowAny
 
+from Jobs.queue import inline_max_items, run_in_background
+from Jobs.views import enqueue_response
+from SmartContact.metrics import span
 from .models import CustomUser
+from .authentication import add_user_claims
+from .caching import get_me, set_me
+from .hashers import HashingBusy, check_password
+from .permissions import IsSuperuser
+from .provisioning import (
+    has_plain_password,
+    inline_max_passwords,
+    json_rows,
+    provision_users,
+    seal_rows,
+)
+from .throttling import clear_user_attempts, count_attempt
 from .serializers import (
-    CustomUserSerializer,
+    UserSerializer,
 )
 
 
 # Generate JWT access and refresh tokens for a user
 def get_tokens_for_user(user):
-    refresh = RefreshToken.for_user(user=user)
+    # The claims let ClaimsJWTAuthentication skip the user lookup
+    refresh = add_user_claims(RefreshToken.for_user(user=user), user)
     return {
         "access": str(refresh.access_token),
         "refresh": str(refresh),
     }
 
 
+def serialize_user(user):
+    # No queries: UserSerializer has no relations
+    with span("serialize"):
+        return UserSerializer(user).data
+
+
 # Dashboard Response Generator
-def choose_dashboard(user, tokens, msg="Login successful", remember=False):
-    if not tokens:
-        return Response(
-            {
-                "success": msg,
-                "user": CustomUserSerializer(user).data,
-            },
-            status=status.HTTP_200_OK,
-        )
-    else:
-        if remember in [True, "true", "True", 1, "1"]:
+def dashboard_data(user_data, tokens, msg="Login successful", remember=False):
+    # Tokens are only sent back when the client asked to be remembered
+    if tokens and remember in [True, "true", "True", 1, "1"]:
+        return {
+            "success": msg,
+            "tokens": tokens,
+            "user": user_data,
+        }
+    return {
+        "success": msg,
+        "user": user_data,
+    }
 
-            return Response(
-                {
-                    "success": msg,
-                    "tokens": tokens,
-                    "user": CustomUserSerializer(user).data,
-                },
-                status=status.HTTP_200_OK,
-            )
-        else:
-            return Response(
-                {
-                    "success": msg,
-                    "user": CustomUserSerializer(user).data,
-                },
-                status=status.HTTP_200_OK,
-            )
+
+def choose_dashboard(user_data, tokens, msg="Login successful", remember=False):
+    return Response(
+        dashboard_data(user_data, tokens, msg=msg, remember=remember),
+        status=status.HTTP_200_OK,
+    )
+
+
+# Answers of the endpoints that hash passwords when they are overloaded
+TOO_MANY_ATTEMPTS = "too many attempts, retry later"
+
+
+def too_many_attempts_response(retry_after):
+    return Response(
+        {"error": TOO_MANY_ATTEMPTS},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+def hashing_busy_response(e):
+    return Response(
+        {"error": str(e)},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": "1"},
+    )
 
 
 # Admin-only signup view
@@ -76,6 +107,10 @@ def signup(request):
             status=status.HTTP_400_BAD_REQUEST,
         )
 
+    retry_after = count_attempt("signup", request)
+    if retry_after:
+        return too_many_attempts_response(retry_after)
+
     try:
         try:
             user = CustomUser.objects.create_user(
@@ -89,11 +124,14 @@ def signup(request):
                 {"error": str(e)},
                 status=status.HTTP_403_FORBIDDEN,
             )
+        except HashingBusy as e:
+            return hashing_busy_response(e)
 
+        user_data = serialize_user(user)
         return Response(
             {
                 "msg": "user created",
-                "user": CustomUserSerializer(user).data,
+                "user": user_data,
                 "tokens": get_tokens_for_user(user),
             },
             status=status.HTTP_201_CREATED,
@@ -114,11 +152,21 @@ def manual_login(request):
     user_user_name = request.data.get("user_name")
     remember = request.data.get("remember")
 
+    # Before the user lookup and the hashing
+    retry_after = count_attempt("login", request, user_user_name)
+    if retry_after:
+        return too_many_attempts_response(retry_after)
+
     try:
         user = CustomUser.objects.get(user_name=user_user_name)
-        if user.check_password(user_password):
+        with span("password_hash"):
+            is_correct = check_password(user, user_password)
+        if is_correct:
+            clear_user_attempts("login", user_user_name)
             return choose_dashboard(
-                user, tokens=get_tokens_for_user(user), remember=remember
+                serialize_user(user),
+                tokens=get_tokens_for_user(user),
+                remember=remember,
             )
         else:
             return Response(
@@ -126,6 +174,8 @@ def manual_login(request):
             )
     except CustomUser.DoesNotExist:
         return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+    except HashingBusy as e:
+        return hashing_busy_response(e)
 
 
 # Login view: prefer JWT, fallback to manual login
@@ -134,21 +184,68 @@ def manual_login(request):
 def login(request):
     remember = False
 
+    # DRF already ran the JWT authentication (DEFAULT_AUTHENTICATION_CLASSES),
+    # so the token is not decoded a second time here
+    user = request.user
+    if not user or not user.is_authenticated:
+        return Response(
+            {"error": "JWT is not ok"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    # Repeated logins are served from the cached "me" representation
+    user_data, version = get_me(user.id)
+    if user_data is not None:
+        return choose_dashboard(user_data, tokens=None, remember=False)
+
+    # A fresh row: request.user has none behind it in "claims" mode, and may
+    # come from the JWT user cache (older than the version) in "db" mode
     try:
+        user = CustomUser.objects.get(pk=user.id)
+    except CustomUser.DoesNotExist:
+        return Response(
+            {"error": "JWT is not ok"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
 
-        user_auth = JWTAuthentication().authenticate(request)
-        if not user_auth:
-            return Response(
-                {"error": "JWT is not ok"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+    user_data = serialize_user(user)
+    set_me(user.id, version, user_data)
+    return choose_dashboard(user_data, tokens=None, remember=False)
 
-        else:
-            user, _ = user_auth
-            return choose_dashboard(user, tokens=None, remember=False)
 
-    except AuthenticationFailed:
+# Bulk user provisioning (superusers only), see provisioning.py
+@api_view(["POST"])
+@permission_classes([IsSuperuser])
+def provision(request):
+    try:
+        rows = json_rows(request.data)
+    except ValueError as e:
         return Response(
-            {"error": "JWT is not ok"},
+            {"error": f"{e}"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    # Hashing is the slow part: more than a few plaintext passwords are hashed
+    # by a background job, on a pool of processes
+    if (
+        run_in_background(request)
+        or len(rows) > inline_max_items()
+        or sum(1 for row in rows if has_plain_password(row)) > inline_max_passwords()
+    ):
+        # Plaintext passwords wait for the worker sealed, see provisioning.py
+        return enqueue_response(request, "auth.provision", {"users": seal_rows(rows)})
+
+    try:
+        result = provision_users(rows, processes=0)
+    except HashingBusy as e:
+        return hashing_busy_response(e)
+
+    if not result["created"]:
+        return Response(
+            {"error": "no user was provisioned", **result},
             status=status.HTTP_400_BAD_REQUEST,
         )
+    return Response(
+        {"msg": "users provisioned", **result},
+        status=status.HTTP_201_CREATED,
+    )
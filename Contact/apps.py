@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ContactConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Contact'
+
+    def ready(self):
+        from . import jobs  # noqa: F401  registers the background job handlers
+        from .search import install_search_triggers
+
+        post_migrate.connect(install_search_triggers, sender=self)
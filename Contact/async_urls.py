@@ -0,0 +1,13 @@
+from django.urls import path
+from . import async_views
+
+# Async routes for SmartContact/asgi_urls.py; they shadow the views of the same
+# URL in urls.py (see urls.py for the parameters of each endpoint).
+# Every other contact endpoint keeps its sync view.
+urlpatterns = [
+    path("create/", async_views.create_contact, name="create_contact"),
+    path("all/", async_views.view_all_contacts, name="view_all_contacts"),
+    path("detail/", async_views.view_contact, name="view_contact"),
+    path("delete/", async_views.delete_contact, name="delete_contact"),
+    path("edit/", async_views.edit_contact, name="edit_contact"),
+]
@@ -0,0 +1,195 @@
+from asgiref.sync import sync_to_async
+from rest_framework import status
+
+from SmartContact.async_api import async_api_view, json_response, not_modified_response
+from SmartContact.db_router import replica_reads
+from SmartContact.metrics import span
+from .caching import contact_cache
+from .models import Contact, parse_tags
+from .pagination import apaginate, decode_cursor, parse_page_size
+from .serializers import ContactListSerializer, ContactSerializer
+from .views import (
+    PreconditionFailed,
+    contact_etag,
+    contact_missing_error,
+    contact_owner_query,
+    delete_owned_contact,
+    edit_owned_contact,
+    not_modified,
+    parse_edit,
+)
+
+# Async versions of the hot contact endpoints, served when ASYNC_VIEWS is on
+# (see SmartContact/asgi_urls.py). Same URLs, parameters and responses as
+# views.py; reads use the async ORM and the non-blocking cache client.
+# A write that needs a transaction runs as one sync_to_async call, so it
+# costs a single hop to the database thread.
+
+
+async def contact_missing_response(contact_id, user=None):
+    body, status_code = contact_missing_error(
+        await contact_owner_query(contact_id).afirst(), user
+    )
+    return json_response(body, status_code)
+
+
+@async_api_view(["POST"])
+async def create_contact(request):
+    contact_name = request.data.get("name")
+    contact_phone_number = request.data.get("phone_number")
+    contact_tags = request.data.get("tags")
+
+    if not all([contact_name, contact_phone_number, contact_tags]):
+        return json_response(
+            {
+                "error": "all fields (contact_name, contact_phone_number, contact_tags) are required"
+            },
+            status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        parse_tags(contact_tags)
+    except ValueError as e:
+        return json_response({"error": f"{e}"}, status.HTTP_400_BAD_REQUEST)
+
+    user = request.user
+    try:
+        await Contact.objects.acreate(
+            name=contact_name,
+            phone_number=contact_phone_number,
+            owner_user_id=user.id,
+            tags=contact_tags,
+        )
+    except ValueError as e:
+        return json_response({"error": f"{e}"}, status.HTTP_403_FORBIDDEN)
+
+    await contact_cache.ainvalidate(user.id)
+    return json_response({"msg": "was successfuly"}, status.HTTP_201_CREATED)
+
+
+@async_api_view(["GET"])
+@replica_reads
+async def view_all_contacts(request):
+    user = request.user
+
+    cursor = request.query_params.get("cursor", "")
+    try:
+        limit = parse_page_size(request.query_params.get("limit"))
+        fields = ContactListSerializer.parse_fields(request.query_params.get("fields"))
+        decode_cursor(cursor)
+    except ValueError as e:
+        return json_response({"error": f"{e}"}, status.HTTP_400_BAD_REQUEST)
+
+    cache_key = await contact_cache.amake_key(
+        user.id, "page", cursor, limit, ",".join(fields)
+    )
+    etag = contact_cache.etag(cache_key)
+    if not_modified(request, etag):
+        return not_modified_response(etag)
+
+    cached_data = await contact_cache.aget(cache_key, "page")
+    if cached_data is not None:
+        return json_response(
+            {"msg": "was successful (from cache)", **cached_data},
+            headers={"ETag": etag},
+        )
+
+    user_contacts = Contact.objects.filter(owner_user_id=user.id).only(
+        *ContactListSerializer.model_fields(fields), "created_at"
+    )
+    page, next_cursor = await apaginate(user_contacts, cursor, limit)
+
+    with span("serialize"):
+        contacts = ContactListSerializer(page, many=True, fields=fields).data
+    serialized_data = {"contacts": contacts, "next_cursor": next_cursor}
+    await contact_cache.aset(cache_key, "page", serialized_data)
+    return json_response(
+        {"msg": "was successful", **serialized_data}, headers={"ETag": etag}
+    )
+
+
+@async_api_view(["GET"])
+async def view_contact(request):
+    user = request.user
+    contact_id = request.query_params.get("contact_id")
+    if not contact_id:
+        return json_response(
+            {"error": "(contact_id) is required"}, status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        contacts = Contact.objects.filter(id=contact_id, owner_user_id=user.id)
+        if request.headers.get("If-None-Match"):
+            version = await contacts.values_list("version", flat=True).afirst()
+            if version is not None:
+                etag = contact_etag(contact_id, version)
+                if not_modified(request, etag):
+                    return not_modified_response(etag)
+        contact = await contacts.afirst()
+    except ValueError:
+        return json_response(
+            {"error": "(contact_id) must be a number"}, status.HTTP_400_BAD_REQUEST
+        )
+
+    if contact is None:
+        return await contact_missing_response(contact_id)
+
+    with span("serialize"):
+        data = ContactSerializer(contact).data
+    return json_response(
+        data,
+        headers={"ETag": contact_etag(contact.id, contact.version)},
+    )
+
+
+@async_api_view(["DELETE"])
+async def delete_contact(request):
+    user = request.user
+    contact_id = request.query_params.get("contact_id")
+
+    if not contact_id:
+        return json_response(
+            {"error": "(contact_id) is required"}, status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        deleted = await sync_to_async(delete_owned_contact)(user.id, contact_id)
+    except ValueError:
+        return json_response(
+            {"error": "(contact_id) must be a number"}, status.HTTP_400_BAD_REQUEST
+        )
+
+    if not deleted:
+        return await contact_missing_response(contact_id)
+
+    await contact_cache.ainvalidate(user.id)
+    return json_response({})
+
+
+@async_api_view(["PUT"])
+async def edit_contact(request):
+    user = request.user
+
+    try:
+        contact_id, expected_version = parse_edit(request)
+    except PreconditionFailed as e:
+        return json_response({"error": f"{e}"}, status.HTTP_412_PRECONDITION_FAILED)
+    except ValueError as e:
+        return json_response({"error": f"{e}"}, status.HTTP_400_BAD_REQUEST)
+
+    try:
+        updated = await sync_to_async(edit_owned_contact)(
+            user.id, contact_id, request.data, expected_version
+        )
+    except ValueError:
+        return json_response(
+            {"error": "(contact_id, version) must be numbers"},
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    if not updated:
+        return await contact_missing_response(contact_id, user)
+
+    await contact_cache.ainvalidate(user.id)
+    headers = {}
+    if expected_version is not None:
+        headers["ETag"] = contact_etag(contact_id, int(expected_version) + 1)
+    return json_response({"msg": "Contact updated"}, headers=headers)
@@ -0,0 +1,101 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import (
+    Contact,
+    delete_contacts,
+    parse_tags,
+    record_changes,
+    sync_contact_tags,
+)
+from .tag_expressions import parse_tag_expression, tree_to_q
+
+# Bulk edit / delete used by /api/contact/bulk-edit/ and /api/contact/bulk-delete/.
+# Targets are picked with exactly one of:
+#   contact_ids: [1, 2, 3]      (or "1,2,3")
+#   tag: "work"
+#   q: "work AND NOT vip"      (tag expression, see tag_expressions.py)
+# and every statement is scoped to the owner, so foreign ids are simply ignored.
+
+MAX_BULK_IDS = 10000
+BULK_CHUNK_SIZE = 500
+
+
+def parse_contact_ids(value):
+    if isinstance(value, str):
+        value = [part for part in value.split(",") if part.strip()]
+    if not isinstance(value, list) or not value:
+        raise ValueError("contact_ids must be a non-empty list")
+    if len(value) > MAX_BULK_IDS:
+        raise ValueError(f"at most {MAX_BULK_IDS} contact_ids per request")
+    try:
+        return [int(contact_id) for contact_id in value]
+    except (TypeError, ValueError):
+        raise ValueError("contact_ids must be numbers")
+
+
+def bulk_targets(data):
+    # The target and edit fields of a bulk request, as plain JSON for a job
+    return {
+        key: data.get(key)
+        for key in ("contact_ids", "tag", "q", "new_tags")
+        if data.get(key)
+    }
+
+
+def bulk_queryset(user, data):
+    if not isinstance(data, dict):
+        raise ValueError("expected a JSON object")
+    contact_ids = data.get("contact_ids")
+    tag = str(data.get("tag") or "").strip().lower()
+    expression = str(data.get("q") or "").strip()
+
+    if sum(1 for target in (contact_ids, tag, expression) if target) != 1:
+        raise ValueError("exactly one of (contact_ids, tag, q) is required")
+
+    contacts = Contact.objects.filter(owner_user_id=user.id)
+    if contact_ids:
+        return contacts.filter(id__in=parse_contact_ids(contact_ids))
+    if tag:
+        return contacts.filter(tag_set__owner_user_id=user.id, tag_set__name=tag)
+    return contacts.filter(tree_to_q(parse_tag_expression(expression), user))
+
+
+def bulk_retag(user, contacts, new_tags, progress=None):
+    # Replace the tags of every matched contact, returns the number of contacts updated.
+    # Ids are read first because the filter may depend on the tags being replaced.
+    # progress(done, total) is called after every chunk (background jobs).
+    contact_ids = list(contacts.values_list("id", flat=True))
+    names = parse_tags(new_tags)
+
+    updated = 0
+    with transaction.atomic():
+        for start in range(0, len(contact_ids), BULK_CHUNK_SIZE):
+            chunk = contact_ids[start : start + BULK_CHUNK_SIZE]
+            updated += Contact.objects.filter(
+                owner_user_id=user.id, id__in=chunk
+            ).update(
+                tags=new_tags, version=F("version") + 1, updated_at=timezone.now()
+            )
+            sync_contact_tags(user.id, {contact_id: names for contact_id in chunk})
+            record_changes(user.id, chunk)
+            if progress:
+                progress(start + len(chunk), len(contact_ids))
+    return updated
+
+
+def bulk_delete(user, contacts, progress=None):
+    # Delete every matched contact and leave a tombstone for /api/contact/sync/,
+    # returns the number of contacts deleted.
+    deleted = 0
+    with transaction.atomic(savepoint=False):
+        contact_ids = list(contacts.values_list("id", flat=True))
+        for start in range(0, len(contact_ids), BULK_CHUNK_SIZE):
+            chunk = contact_ids[start : start + BULK_CHUNK_SIZE]
+            targets = Contact.objects.filter(owner_user_id=user.id, id__in=chunk)
+            deleted += delete_contacts(user.id, targets)
+            if progress:
+                progress(start + len(chunk), len(contact_ids))
+        record_changes(user.id, contact_ids, deleted=True)
+    return deleted
@@ -0,0 +1,385 @@
+import hashlib
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.http import quote_etag
+
+from SmartContact import async_cache
+from SmartContact.db_router import apin_to_primary, pin_to_primary
+from SmartContact.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# Per-user, version-stamped cache namespace for contact reads.
+#
+# Every key embeds the user's current generation:
+#     user_<id>_contacts_v<generation>_<kind>_<parts...>
+# Invalidating a user is a single atomic INCR of the generation; old keys are
+# never looked up again and simply expire on their own TTL. This replaces
+# cache.delete_pattern(), which SCANs the whole Redis keyspace.
+# The same keys give cheap ETags: a conditional GET is answered with 304
+# after reading the generation only.
+#
+# Two tiers: an optional in-process LRU (L1, bounded by bytes and entries)
+# in front of the shared cache (L2, Redis). L1 also remembers each user's
+# generation, so a hot user is served without any network I/O. Workers learn
+# about another worker's invalidation through Redis pub/sub; L1
+# VERSION_TIMEOUT bounds how stale a generation can get if a message is lost.
+#
+# Settings (all optional):
+#     CONTACT_CACHE = {
+#         "TIMEOUT": 300,                  # default TTL of cached reads
+#         "TIMEOUTS": {"page": 60},        # per-kind overrides
+#         "VERSION_TIMEOUT": 2592000,      # TTL of the generation counters
+#         "L1": {                          # omit to disable the L1 tier
+#             "MAX_BYTES": 64 * 1024 * 1024,
+#             "MAX_ENTRIES": 5000,
+#             "TIMEOUT": 60,
+#             "VERSION_TIMEOUT": 5,
+#         },
+#     }
+#
+# The a*() methods are the same operations for the async views, on the
+# non-blocking client of SmartContact/async_cache.py (same keys).
+# L1 values are shared between requests: callers must not mutate them.
+
+DEFAULT_TIMEOUT = 60 * 5
+DEFAULT_VERSION_TIMEOUT = 60 * 60 * 24 * 30
+MAX_KEY_LENGTH = 200
+
+DEFAULT_L1_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_L1_MAX_ENTRIES = 5000
+DEFAULT_L1_TIMEOUT = 60
+DEFAULT_L1_VERSION_TIMEOUT = 5
+
+
+class LocalCache:
+    # Bounded in-process LRU with per-entry expiry and a byte budget
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, _, value = entry
+            if expires_at < time.monotonic():
+                self.pop(key)
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout, size=0, max_bytes=None, max_entries=None):
+        if max_bytes is not None and size > max_bytes:
+            return
+        with self.lock:
+            self.pop(key)
+            self.entries[key] = (time.monotonic() + timeout, size, value)
+            self.size += size
+            while (max_bytes is not None and self.size > max_bytes) or (
+                max_entries is not None and len(self.entries) > max_entries
+            ):
+                _, (_, evicted_size, _) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def pop(self, key):
+        # Caller holds the lock
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def delete(self, key):
+        with self.lock:
+            self.pop(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def usage(self):
+        with self.lock:
+            return len(self.entries), self.size
+
+
+class VersionedCache:
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.lock = threading.Lock()
+        self.counters = {
+            "l1_hits": 0,
+            "l1_misses": 0,
+            "l2_hits": 0,
+            "l2_misses": 0,
+            "sets": 0,
+            "invalidations": 0,
+        }
+        self.local = LocalCache()
+        self.local_versions = LocalCache()
+        # Bumped by every invalidation this process hears of, so a generation
+        # read from Redis while one arrives is not kept in L1
+        self.invalidation_seq = 0
+        self.listener = None
+
+    @property
+    def config(self):
+        return getattr(settings, "CONTACT_CACHE", {})
+
+    @property
+    def l1_config(self):
+        return self.config.get("L1") or {}
+
+    @property
+    def channel(self):
+        return f"{self.namespace}_cache_invalidations"
+
+    def timeout(self, kind):
+        timeouts = self.config.get("TIMEOUTS", {})
+        return timeouts.get(kind, self.config.get("TIMEOUT", DEFAULT_TIMEOUT))
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        # Counters of this process
+        with self.lock:
+            stats = dict(self.counters)
+        for tier in ("l1", "l2"):
+            lookups = stats[f"{tier}_hits"] + stats[f"{tier}_misses"]
+            stats[f"{tier}_hit_rate"] = (
+                stats[f"{tier}_hits"] / lookups if lookups else 0.0
+            )
+        stats["l1_entries"], stats["l1_bytes"] = self.local.usage()
+        return stats
+
+    def clear_local(self):
+        self.local.clear()
+        self.local_versions.clear()
+
+    # Generations
+
+    def version_key(self, user_id):
+        return f"user_{user_id}_{self.namespace}_version"
+
+    def version_timeout(self):
+        return self.config.get("VERSION_TIMEOUT", DEFAULT_VERSION_TIMEOUT)
+
+    def local_version(self, user_id):
+        if not self.l1_config:
+            return None
+        self.start_listener()
+        return self.local_versions.get(user_id)
+
+    def remember_version(self, user_id, version, seq):
+        if self.l1_config and version is not None and seq == self.invalidation_seq:
+            self.local_versions.set(
+                user_id,
+                version,
+                self.l1_config.get("VERSION_TIMEOUT", DEFAULT_L1_VERSION_TIMEOUT),
+                max_entries=self.l1_config.get("MAX_ENTRIES", DEFAULT_L1_MAX_ENTRIES),
+            )
+
+    def forget_version(self, user_id):
+        with self.lock:
+            self.invalidation_seq += 1
+        self.local_versions.delete(user_id)
+
+    def get_version(self, user_id):
+        version = self.local_version(user_id)
+        if version is not None:
+            return version
+
+        seq = self.invalidation_seq
+        key = self.version_key(user_id)
+        started = time.perf_counter()
+        version = cache.get(key)
+        record_cache(
+            "contact_versions", version is not None, time.perf_counter() - started
+        )
+        if version is None:
+            # Start from the clock, not from 1, so a lost counter can never
+            # point back at a generation whose keys are still alive
+            cache.add(key, int(time.time() * 1000), timeout=self.version_timeout())
+            version = cache.get(key)
+        self.remember_version(user_id, version, seq)
+        return version
+
+    async def aget_version(self, user_id):
+        version = self.local_version(user_id)
+        if version is not None:
+            return version
+
+        seq = self.invalidation_seq
+        key = self.version_key(user_id)
+        started = time.perf_counter()
+        version = await async_cache.aget(key)
+        record_cache(
+            "contact_versions", version is not None, time.perf_counter() - started
+        )
+        if version is None:
+            await async_cache.aadd(
+                key, int(time.time() * 1000), timeout=self.version_timeout()
+            )
+            version = await async_cache.aget(key)
+        self.remember_version(user_id, version, seq)
+        return version
+
+    # Keys and values
+
+    def build_key(self, user_id, version, kind, parts):
+        suffix = "_".join(str(part) for part in parts)
+        if len(suffix) > MAX_KEY_LENGTH:
+            suffix = hashlib.sha1(suffix.encode()).hexdigest()
+        return f"user_{user_id}_{self.namespace}_v{version}_{kind}_{suffix}"
+
+    def make_key(self, user_id, kind, *parts):
+        return self.build_key(user_id, self.get_version(user_id), kind, parts)
+
+    async def amake_key(self, user_id, kind, *parts):
+        return self.build_key(user_id, await self.aget_version(user_id), kind, parts)
+
+    def etag(self, key):
+        # A key changes with every write of the user, so it doubles as an ETag
+        return quote_etag(hashlib.sha1(key.encode()).hexdigest()[:20])
+
+    def get_local(self, key):
+        # get() and aget() record both tiers as caches "contacts_l1" and
+        # "contacts" in the request metrics (SmartContact/metrics.py)
+        if not self.l1_config:
+            return None
+        started = time.perf_counter()
+        value = self.local.get(key)
+        record_cache("contacts_l1", value is not None, time.perf_counter() - started)
+        self.count("l1_misses" if value is None else "l1_hits")
+        return value
+
+    def set_local(self, key, value, timeout):
+        if not self.l1_config:
+            return
+        # Size as stored in Redis; only pickled when filling L1
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        self.local.set(
+            key,
+            value,
+            min(timeout, self.l1_config.get("TIMEOUT", DEFAULT_L1_TIMEOUT)),
+            size,
+            self.l1_config.get("MAX_BYTES", DEFAULT_L1_MAX_BYTES),
+            self.l1_config.get("MAX_ENTRIES", DEFAULT_L1_MAX_ENTRIES),
+        )
+
+    def get(self, key, kind):
+        # key comes from make_key(..., kind, ...); returns None on a miss
+        value = self.get_local(key)
+        if value is not None:
+            return value
+        started = time.perf_counter()
+        value = cache.get(key)
+        record_cache("contacts", value is not None, time.perf_counter() - started)
+        self.count("l2_misses" if value is None else "l2_hits")
+        if value is not None:
+            self.set_local(key, value, self.timeout(kind))
+        return value
+
+    async def aget(self, key, kind):
+        value = self.get_local(key)
+        if value is not None:
+            return value
+        started = time.perf_counter()
+        value = await async_cache.aget(key)
+        record_cache("contacts", value is not None, time.perf_counter() - started)
+        self.count("l2_misses" if value is None else "l2_hits")
+        if value is not None:
+            self.set_local(key, value, self.timeout(kind))
+        return value
+
+    def set(self, key, kind, value):
+        cache.set(key, value, timeout=self.timeout(kind))
+        self.set_local(key, value, self.timeout(kind))
+        self.count("sets")
+
+    async def aset(self, key, kind, value):
+        await async_cache.aset(key, value, timeout=self.timeout(kind))
+        self.set_local(key, value, self.timeout(kind))
+        self.count("sets")
+
+    # Invalidation
+
+    def invalidate(self, user_id):
+        # Pinned first: a reader seeing the new version also sees the pin
+        pin_to_primary(user_id)
+        key = self.version_key(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # No counter yet: nothing was cached under a version for this user
+            pass
+        self.forget_version(user_id)
+        if self.l1_config and async_cache.uses_redis():
+            from django_redis import get_redis_connection
+
+            get_redis_connection("default").publish(self.channel, user_id)
+        self.count("invalidations")
+
+    async def ainvalidate(self, user_id):
+        await apin_to_primary(user_id)
+        try:
+            await async_cache.aincr(self.version_key(user_id))
+        except ValueError:
+            pass
+        self.forget_version(user_id)
+        if self.l1_config and async_cache.uses_redis():
+            await async_cache.apublish(self.channel, user_id)
+        self.count("invalidations")
+
+    def start_listener(self):
+        # One daemon thread per process, started on first use (so after a fork)
+        if self.listener is not None or not async_cache.uses_redis():
+            return
+        with self.lock:
+            if self.listener is not None:
+                return
+            self.listener = threading.Thread(
+                target=self.listen, name=self.channel, daemon=True
+            )
+        self.listener.start()
+
+    def listen(self):
+        from django_redis import get_redis_connection
+
+        while True:
+            try:
+                pubsub = get_redis_connection("default").pubsub(
+                    ignore_subscribe_messages=True
+                )
+                pubsub.subscribe(self.channel)
+                # Messages may have been missed while not subscribed
+                self.local_versions.clear()
+                for message in pubsub.listen():
+                    self.forget_version(int(message["data"]))
+            except Exception:
+                # Keep the thread alive whatever Redis does; until it is back
+                # L1 generations only live for their VERSION_TIMEOUT
+                logger.warning("contact cache listener lost Redis", exc_info=True)
+                self.local_versions.clear()
+                time.sleep(1)
+
+
+contact_cache = VersionedCache("contacts")
+
+
+@receiver(setting_changed)
+def clear_local_tiers(*, setting, **kwargs):
+    # The L1 tier must not outlive the cache it sits in front of (tests)
+    if setting in ("CACHES", "CONTACT_CACHE"):
+        contact_cache.clear_local()
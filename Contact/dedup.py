@@ -0,0 +1,275 @@
+import re
+import unicodedata
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .caching import contact_cache
+from .models import (
+    TAG_SEPARATOR,
+    Contact,
+    delete_contacts,
+    parse_tags,
+    record_changes,
+    sync_contact_tags,
+)
+
+# Duplicate detection and merging used by /api/contact/duplicates/ and
+# /api/contact/merge/.
+#
+# Two contacts of one owner are duplicates when they have the same number
+# (the stored phone_digits column) or very similar names. Names are never
+# compared all against all: every contact is put in a few blocks and only
+# contacts sharing a block are compared:
+#   - the normalized name itself ("smith john" for "John Smith", "Smith, John")
+#   - the first BLOCK_PREFIX letters of each name token
+# Blocks bigger than MAX_BLOCK_SIZE (very common first names) are skipped,
+# so the work stays bounded however big the address book is. Matches are
+# joined transitively into groups (union-find).
+#
+# The report is cached per cache generation (see caching.py), so it is built
+# at most once between two writes; the find_duplicates command builds it
+# ahead of time for large address books.
+#
+# Settings (all optional):
+#     CONTACT_DEDUP = {
+#         "NAME_SIMILARITY": 0.88,   # SequenceMatcher ratio of normalized names
+#         "MAX_BLOCK_SIZE": 200,
+#         "MAX_GROUPS": 1000,        # groups returned by the report
+#     }
+
+DEFAULT_NAME_SIMILARITY = 0.88
+DEFAULT_MAX_BLOCK_SIZE = 200
+DEFAULT_MAX_GROUPS = 1000
+BLOCK_PREFIX = 4
+MIN_PHONE_DIGITS = 6
+MAX_MERGE_IDS = 100
+DEDUP_CHUNK_SIZE = 2000
+
+NAME_TOKEN_RE = re.compile(r"[^\w]+")
+
+
+def get_config():
+    return getattr(settings, "CONTACT_DEDUP", {})
+
+
+def normalize_name(name):
+    # "  Smith, José " -> "jose smith": no accents, case or punctuation, token order
+    name = unicodedata.normalize("NFKD", str(name or ""))
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    tokens = [token for token in NAME_TOKEN_RE.split(name.lower()) if token]
+    return " ".join(sorted(tokens))
+
+
+def name_blocks(normalized):
+    blocks = {f"n:{normalized}"}
+    for token in normalized.split():
+        if len(token) >= BLOCK_PREFIX:
+            blocks.add(f"p:{token[:BLOCK_PREFIX]}")
+    return blocks
+
+
+def similar_names(first, second, threshold):
+    if first == second:
+        return True
+    matcher = SequenceMatcher(None, first, second, autojunk=False)
+    # Cheap upper bounds first, the full ratio only when they pass
+    return (
+        matcher.real_quick_ratio() >= threshold
+        and matcher.quick_ratio() >= threshold
+        and matcher.ratio() >= threshold
+    )
+
+
+class DisjointSet:
+    def __init__(self):
+        self.parents = {}
+
+    def find(self, item):
+        parent = self.parents.setdefault(item, item)
+        while parent != self.parents[parent]:
+            self.parents[parent] = self.parents[self.parents[parent]]
+            parent = self.parents[parent]
+        self.parents[item] = parent
+        return parent
+
+    def union(self, first, second):
+        first, second = self.find(first), self.find(second)
+        if first != second:
+            self.parents[max(first, second)] = min(first, second)
+
+
+def find_duplicate_groups(user_id, progress=None):
+    # Returns {"groups": [{"contacts": [...], "reasons": [...]}], "total": int,
+    # "skipped_blocks": int}. Only ids, names and the digits column are loaded.
+    # progress(done, total) is called all along (counted in name blocks), so a
+    # queued build keeps its lease however long it takes.
+    config = get_config()
+    threshold = config.get("NAME_SIMILARITY", DEFAULT_NAME_SIMILARITY)
+    max_block_size = config.get("MAX_BLOCK_SIZE", DEFAULT_MAX_BLOCK_SIZE)
+
+    def beat(done, total=None):
+        if progress:
+            progress(done, total)
+
+    names = {}
+    by_phone = {}
+    blocks = {}
+    rows = (
+        Contact.objects.filter(owner_user_id=user_id)
+        .order_by("id")
+        .values_list("id", "name", "phone_digits")
+    )
+    for index, (contact_id, name, digits) in enumerate(
+        rows.iterator(chunk_size=DEDUP_CHUNK_SIZE)
+    ):
+        if index % DEDUP_CHUNK_SIZE == 0:
+            beat(0)
+        names[contact_id] = normalize_name(name)
+        if len(digits) >= MIN_PHONE_DIGITS:
+            by_phone.setdefault(digits, []).append(contact_id)
+        if names[contact_id]:
+            for block in name_blocks(names[contact_id]):
+                blocks.setdefault(block, []).append(contact_id)
+
+    # One step per block, plus one for the report itself
+    steps = len(blocks) + 1
+    beat(0, steps)
+    groups = DisjointSet()
+    reasons = {}
+
+    def link(first, second, reason):
+        groups.union(first, second)
+        reasons.setdefault(reason, set()).update((first, second))
+
+    for contact_ids in by_phone.values():
+        for contact_id in contact_ids[1:]:
+            link(contact_ids[0], contact_id, "phone")
+
+    compared = set()
+    skipped_blocks = 0
+    for done, contact_ids in enumerate(blocks.values()):
+        beat(done)
+        if len(contact_ids) > max_block_size:
+            skipped_blocks += 1
+            continue
+        for index, first in enumerate(contact_ids):
+            for second in contact_ids[index + 1 :]:
+                if (first, second) in compared:
+                    continue
+                compared.add((first, second))
+                if similar_names(names[first], names[second], threshold):
+                    link(first, second, "name")
+
+    members = {}
+    for contact_id in groups.parents:
+        members.setdefault(groups.find(contact_id), []).append(contact_id)
+    found = sorted(
+        (sorted(ids) for ids in members.values() if len(ids) > 1),
+        key=lambda ids: (-len(ids), ids[0]),
+    )
+    total = len(found)
+    found = found[: config.get("MAX_GROUPS", DEFAULT_MAX_GROUPS)]
+
+    wanted = [contact_id for contact_ids in found for contact_id in contact_ids]
+    contacts = {}
+    for start in range(0, len(wanted), DEDUP_CHUNK_SIZE):
+        beat(len(blocks))
+        for contact in Contact.objects.filter(
+            owner_user_id=user_id, id__in=wanted[start : start + DEDUP_CHUNK_SIZE]
+        ).values("id", "name", "phone_e164", "tags"):
+            contacts[contact["id"]] = contact
+    report = []
+    for contact_ids in found:
+        report.append(
+            {
+                "contacts": [
+                    {
+                        "id": contact_id,
+                        "name": contacts[contact_id]["name"],
+                        "phone_number": contacts[contact_id]["phone_e164"],
+                        "tags": contacts[contact_id]["tags"],
+                    }
+                    for contact_id in contact_ids
+                    if contact_id in contacts
+                ],
+                "reasons": sorted(
+                    reason
+                    for reason, linked in reasons.items()
+                    if linked.intersection(contact_ids)
+                ),
+            }
+        )
+    beat(steps)
+    return {"groups": report, "total": total, "skipped_blocks": skipped_blocks}
+
+
+def duplicate_report(user_id, build=True, progress=None):
+    # Returns (cache key, report); the key doubles as the report's ETag.
+    # build=False only looks in the cache (report is None on a miss).
+    cache_key = contact_cache.make_key(user_id, "duplicates")
+    report = contact_cache.get(cache_key, "duplicates")
+    if report is None and build:
+        report = find_duplicate_groups(user_id, progress=progress)
+        contact_cache.set(cache_key, "duplicates", report)
+    return cache_key, report
+
+
+def parse_merge(data):
+    # Returns (keep_id, merge_ids) of a merge/ request
+    keep_id = data.get("keep_id")
+    merge_ids = data.get("merge_ids")
+    if not keep_id or not isinstance(merge_ids, list) or not merge_ids:
+        raise ValueError("(keep_id, merge_ids) are required, merge_ids is a list")
+    if len(merge_ids) > MAX_MERGE_IDS:
+        raise ValueError(f"at most {MAX_MERGE_IDS} merge_ids per request")
+    try:
+        keep_id = int(keep_id)
+        merge_ids = {int(contact_id) for contact_id in merge_ids} - {keep_id}
+    except (TypeError, ValueError):
+        raise ValueError("(keep_id, merge_ids) must be numbers")
+    if not merge_ids:
+        raise ValueError("merge_ids must name other contacts than keep_id")
+    return keep_id, sorted(merge_ids)
+
+
+def merge_contacts(user_id, keep_id, merge_ids):
+    # Fold the merge_ids contacts into keep_id: its tags become the union of
+    # all tags, the others are deleted (with sync tombstones). One transaction.
+    # Returns the number of contacts merged away, None if keep_id is not the
+    # user's. Ids of other users are ignored, like the bulk endpoints do.
+    with transaction.atomic():
+        tags = dict(
+            Contact.objects.select_for_update()
+            .filter(owner_user_id=user_id, id__in=[keep_id, *merge_ids])
+            .values_list("id", "tags")
+        )
+        if keep_id not in tags:
+            return None
+        merged_ids = [contact_id for contact_id in merge_ids if contact_id in tags]
+        if not merged_ids:
+            return 0
+
+        names = []
+        for contact_id in [keep_id, *merged_ids]:
+            for name in parse_tags(tags[contact_id]):
+                if name not in names:
+                    names.append(name)
+        if len(names) > 1 and "none" in names:
+            # The placeholder of contacts created without tags
+            names.remove("none")
+
+        Contact.objects.filter(id=keep_id).update(
+            tags=TAG_SEPARATOR.join(names),
+            version=F("version") + 1,
+            updated_at=timezone.now(),
+        )
+        sync_contact_tags(user_id, {keep_id: names})
+        merged = Contact.objects.filter(owner_user_id=user_id, id__in=merged_ids)
+        delete_contacts(user_id, merged)
+        record_changes(user_id, [keep_id])
+        record_changes(user_id, merged_ids, deleted=True)
+    return len(merged_ids)
@@ -0,0 +1,140 @@
+import csv
+import io
+import json
+
+from django.db import transaction
+
+from .models import (
+    Contact,
+    count_added_contacts,
+    parse_tags,
+    record_changes,
+    sync_contact_tags,
+)
+from .phones import parse_phone, phone_digits
+
+# Bulk import used by /api/contact/import/.
+# Rows are validated and inserted in chunks (one bulk_create per chunk) inside
+# a single transaction, so a big import costs a handful of queries per
+# IMPORT_CHUNK_SIZE rows instead of several per contact.
+
+IMPORT_CHUNK_SIZE = 1000
+# Only the first errors are reported back, the rest are just counted
+MAX_REPORTED_ERRORS = 1000
+
+IMPORT_FIELDS = ["name", "phone_number", "tags"]
+
+
+def json_rows(data):
+    # Body is either a list of contacts or {"contacts": [...]}
+    if isinstance(data, dict):
+        data = data.get("contacts")
+    if not isinstance(data, list):
+        raise ValueError("expected a list of contacts")
+    return data
+
+
+def iter_json_rows(data):
+    return iter(json_rows(data))
+
+
+def iter_csv_rows(uploaded_file):
+    text = io.TextIOWrapper(uploaded_file, encoding="utf-8-sig", newline="")
+    return csv.DictReader(text)
+
+
+def iter_ndjson_rows(uploaded_file):
+    text = io.TextIOWrapper(uploaded_file, encoding="utf-8-sig")
+    for line in text:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # Reported as an invalid row by import_contacts
+            yield None
+
+
+FILE_READERS = {
+    "csv": iter_csv_rows,
+    "ndjson": iter_ndjson_rows,
+}
+
+
+def validate_row(row):
+    # Returns (contact fields, None) or (None, error message)
+    if not isinstance(row, dict):
+        return None, "row is not an object"
+
+    name = str(row.get("name") or "").strip()
+    phone_number = row.get("phone_number")
+    tags = str(row.get("tags") or "").strip() or "none"
+
+    if not name or not phone_number:
+        return None, "(name, phone_number) are required"
+    if len(name) > Contact._meta.get_field("name").max_length:
+        return None, "name is too long"
+    try:
+        parse_tags(tags)
+    except ValueError as e:
+        return None, f"{e}"
+
+    # Memoized across rows and imports, see phones.py
+    phone_e164 = parse_phone(phone_number)
+    if phone_e164 is None:
+        return None, "phone_number is not valid"
+
+    return {
+        "name": name,
+        "phone_number": phone_e164,
+        "phone_e164": phone_e164,
+        "phone_digits": phone_digits(phone_e164),
+        "tags": tags,
+    }, None
+
+
+def insert_chunk(user, chunk):
+    contacts = Contact.objects.bulk_create(
+        [Contact(owner_user_id=user.id, **fields) for fields in chunk]
+    )
+    sync_contact_tags(
+        user.id,
+        {contact.id: parse_tags(contact.tags) for contact in contacts},
+        replace=False,
+    )
+    record_changes(user.id, [contact.id for contact in contacts])
+    count_added_contacts(user.id, len(contacts))
+    return len(contacts)
+
+
+def import_contacts(user, rows, progress=None):
+    # Returns {"created": int, "failed": int, "errors": [{"row": n, "error": str}]}
+    # progress(rows done) is called after every chunk (background jobs)
+    created = 0
+    failed = 0
+    errors = []
+    chunk = []
+
+    with transaction.atomic():
+        for row_number, row in enumerate(rows, start=1):
+            fields, error = validate_row(row)
+            if error:
+                failed += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"row": row_number, "error": error})
+                continue
+
+            chunk.append(fields)
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                created += insert_chunk(user, chunk)
+                chunk = []
+                if progress:
+                    progress(row_number)
+
+        if chunk:
+            created += insert_chunk(user, chunk)
+        if progress:
+            progress(created + failed, created + failed)
+
+    return {"created": created, "failed": failed, "errors": errors}
@@ -0,0 +1,60 @@
+import json
+
+from Jobs.queue import open_input, register
+from .bulk import bulk_delete, bulk_queryset, bulk_retag
+from .caching import contact_cache
+from .dedup import duplicate_report
+from .importer import FILE_READERS, import_contacts, json_rows
+
+# Background versions of the slow contact operations (see Jobs/queue.py).
+# The views queue them for large inputs and answer 202; each handler does
+# exactly what the inline view does and returns its response body as the
+# job result. Registered by ContactConfig.ready().
+
+
+@register("contacts.import")
+def import_job(job, progress):
+    payload = job.payload
+    # The upload or JSON body, saved by the view in the jobs storage
+    with open_input(payload["input_file"]) as file:
+        if payload["input"] == "json":
+            rows = json_rows(json.load(file))
+            progress(0, len(rows))
+            rows = iter(rows)
+        else:
+            rows = FILE_READERS[payload["input"]](file)
+        result = import_contacts(job.owner_user, rows, progress=progress)
+    if result["created"]:
+        contact_cache.invalidate(job.owner_user_id)
+    return result
+
+
+@register("contacts.bulk_edit")
+def bulk_edit_job(job, progress):
+    user = job.owner_user
+    updated = bulk_retag(
+        user,
+        bulk_queryset(user, job.payload),
+        job.payload["new_tags"],
+        progress=progress,
+    )
+    if updated:
+        contact_cache.invalidate(user.id)
+    return {"msg": "Contacts updated", "updated": updated}
+
+
+@register("contacts.bulk_delete")
+def bulk_delete_job(job, progress):
+    user = job.owner_user
+    deleted = bulk_delete(user, bulk_queryset(user, job.payload), progress=progress)
+    if deleted:
+        contact_cache.invalidate(user.id)
+    return {"deleted": deleted}
+
+
+@register("contacts.duplicates")
+def duplicates_job(job, progress):
+    # Builds and caches the report, duplicates/ then answers from the cache.
+    # The build reports its progress, so a long one keeps its lease.
+    _, report = duplicate_report(job.owner_user_id, progress=progress)
+    return {"total": report["total"], "skipped_blocks": report["skipped_blocks"]}
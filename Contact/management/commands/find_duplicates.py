@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from Contact.dedup import duplicate_report
+from Contact.models import Contact
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the duplicates/ report ahead of time for large address books, "
+        "so the request only reads it from the cache"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="user_ids",
+            help="Only this user id (repeatable)",
+        )
+        parser.add_argument(
+            "--min-contacts",
+            type=int,
+            default=5000,
+            help="Skip users with fewer contacts (ignored with --user)",
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options["user_ids"]
+        if not user_ids:
+            user_ids = (
+                Contact.objects.values("owner_user_id")
+                .annotate(contacts=Count("id"))
+                .filter(contacts__gte=options["min_contacts"])
+                .values_list("owner_user_id", flat=True)
+            )
+
+        for user_id in user_ids:
+            # A report that is already cached for the current generation is kept
+            _, report = duplicate_report(user_id)
+            self.stdout.write(
+                f"user {user_id}: {report['total']} duplicate groups"
+                f" ({report['skipped_blocks']} oversized blocks skipped)"
+            )
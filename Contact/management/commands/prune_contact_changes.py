@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from Contact.models import ContactChange
+from Contact.sync import get_config, DEFAULT_RETENTION_DAYS
+
+PRUNE_BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = "Delete sync change-log rows older than CONTACT_SYNC['RETENTION_DAYS']"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=None,
+            help="Retention in days (defaults to the CONTACT_SYNC setting)",
+        )
+
+    def handle(self, *args, **options):
+        days = options["days"]
+        if days is None:
+            days = get_config().get("RETENTION_DAYS", DEFAULT_RETENTION_DAYS)
+        cutoff = timezone.now() - timedelta(days=days)
+
+        # Small batches keep each DELETE (and its lock) short
+        total = 0
+        while True:
+            ids = list(
+                ContactChange.objects.filter(created_at__lt=cutoff)
+                .order_by("id")
+                .values_list("id", flat=True)[:PRUNE_BATCH_SIZE]
+            )
+            if not ids:
+                break
+            total += ContactChange.objects.filter(id__in=ids).delete()[0]
+
+        self.stdout.write(f"Deleted {total} change rows older than {days} days")
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from AuthenticationSystem.models import CustomUser
+from Contact.caching import contact_cache
+from Contact.stats import get_stats, prune_daily_stats, reconcile_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the stats/ counters (total, per-tag and recent contact counts) "
+        "from the contacts, reporting the users whose counters had drifted"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="user_ids",
+            help="Only this user id (repeatable)",
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options["user_ids"]
+        if not user_ids:
+            user_ids = CustomUser.objects.order_by("id").values_list("id", flat=True)
+
+        users = 0
+        drifted = 0
+        for user_id in user_ids:
+            before = reconcile_stats(user_id)
+            after = get_stats(user_id)
+            users += 1
+            if before != after:
+                drifted += 1
+                # stats/ answers from the contact cache until the next write
+                contact_cache.invalidate(user_id)
+                self.stdout.write(
+                    f"user {user_id}: total {before['total']} -> {after['total']}"
+                )
+
+        pruned = prune_daily_stats()
+        self.stdout.write(
+            f"{users} users reconciled, {drifted} had drifted"
+            f" ({pruned} old daily rows pruned)"
+        )
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Contact', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('owner_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tags', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ContactTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('contact', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contact_tags', to='Contact.contact')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contact_tags', to='Contact.tag')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='tag_set',
+            field=models.ManyToManyField(blank=True, related_name='contacts', through='Contact.ContactTag', to='Contact.tag'),
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('owner_user', 'name'), name='unique_tag_per_owner'),
+        ),
+        migrations.AddIndex(
+            model_name='contacttag',
+            index=models.Index(fields=['tag', 'contact'], name='contacttag_tag_contact_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='contacttag',
+            constraint=models.UniqueConstraint(fields=('contact', 'tag'), name='unique_contact_tag'),
+        ),
+    ]
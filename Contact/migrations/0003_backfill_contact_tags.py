@@ -0,0 +1,66 @@
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def split_tags(tags):
+    # Frozen copy of Contact.models.parse_tags
+    names = []
+    for name in str(tags or "").split("-"):
+        name = name.strip().lower()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def backfill_batch(Tag, ContactTag, batch):
+    wanted = {(owner_id, name) for _, owner_id, names in batch for name in names}
+    Tag.objects.bulk_create(
+        [Tag(owner_user_id=owner_id, name=name) for owner_id, name in wanted],
+        ignore_conflicts=True,
+    )
+
+    owner_ids = {owner_id for owner_id, _ in wanted}
+    tag_names = {name for _, name in wanted}
+    tag_ids = {
+        (owner_id, name): tag_id
+        for tag_id, owner_id, name in Tag.objects.filter(
+            owner_user_id__in=owner_ids, name__in=tag_names
+        ).values_list("id", "owner_user_id", "name")
+    }
+
+    ContactTag.objects.bulk_create(
+        [
+            ContactTag(contact_id=contact_id, tag_id=tag_ids[(owner_id, name)])
+            for contact_id, owner_id, names in batch
+            for name in names
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def backfill_contact_tags(apps, schema_editor):
+    Contact = apps.get_model("Contact", "Contact")
+    Tag = apps.get_model("Contact", "Tag")
+    ContactTag = apps.get_model("Contact", "ContactTag")
+
+    batch = []
+    rows = Contact.objects.values_list("id", "owner_user_id", "tags").order_by("id")
+    for contact_id, owner_id, tags in rows.iterator(chunk_size=BATCH_SIZE):
+        batch.append((contact_id, owner_id, split_tags(tags)))
+        if len(batch) >= BATCH_SIZE:
+            backfill_batch(Tag, ContactTag, batch)
+            batch = []
+    if batch:
+        backfill_batch(Tag, ContactTag, batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Contact", "0002_tag_contacttag"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_contact_tags, migrations.RunPython.noop),
+    ]
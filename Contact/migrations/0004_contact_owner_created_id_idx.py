@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Contact', '0003_backfill_contact_tags'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['owner_user', 'created_at', 'id'], name='contact_owner_created_id_idx'),
+        ),
+    ]
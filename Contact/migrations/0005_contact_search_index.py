@@ -0,0 +1,96 @@
+from django.db import migrations
+
+# Search indexes for Contact/search.py, created per database vendor.
+
+# Frozen copy of Contact.search.SQLITE_SEARCH_TRIGGERS
+SQLITE_SEARCH_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS "Contact_contact_search_ai"
+    AFTER INSERT ON "Contact_contact"
+    BEGIN
+        INSERT INTO "Contact_contact_search" (rowid, name, phone_number, owner)
+        VALUES (new.id, new.name, new.phone_number, '#' || new.owner_user_id || '#');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "Contact_contact_search_ad"
+    AFTER DELETE ON "Contact_contact"
+    BEGIN
+        DELETE FROM "Contact_contact_search" WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "Contact_contact_search_au"
+    AFTER UPDATE OF name, phone_number, owner_user_id ON "Contact_contact"
+    BEGIN
+        UPDATE "Contact_contact_search"
+        SET name = new.name,
+            phone_number = new.phone_number,
+            owner = '#' || new.owner_user_id || '#'
+        WHERE rowid = old.id;
+    END
+    """,
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE "Contact_contact_search" USING fts5(
+        name, phone_number, owner, tokenize = 'trigram'
+    )
+    """,
+    """
+    INSERT INTO "Contact_contact_search" (rowid, name, phone_number, owner)
+    SELECT id, name, phone_number, '#' || owner_user_id || '#' FROM "Contact_contact"
+    """,
+    *SQLITE_SEARCH_TRIGGERS,
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS "Contact_contact_search_au"',
+    'DROP TRIGGER IF EXISTS "Contact_contact_search_ad"',
+    'DROP TRIGGER IF EXISTS "Contact_contact_search_ai"',
+    'DROP TABLE IF EXISTS "Contact_contact_search"',
+]
+
+POSTGRESQL_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE INDEX IF NOT EXISTS contact_name_trgm_idx
+    ON "Contact_contact" USING gin (UPPER(name) gin_trgm_ops)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS contact_phone_trgm_idx
+    ON "Contact_contact" USING gin (phone_number gin_trgm_ops)
+    """,
+]
+
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS contact_phone_trgm_idx",
+    "DROP INDEX IF EXISTS contact_name_trgm_idx",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Contact", "0004_contact_owner_created_id_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(
+                {"sqlite": SQLITE_FORWARD, "postgresql": POSTGRESQL_FORWARD}
+            ),
+            run_for_vendor(
+                {"sqlite": SQLITE_BACKWARD, "postgresql": POSTGRESQL_BACKWARD}
+            ),
+        ),
+    ]
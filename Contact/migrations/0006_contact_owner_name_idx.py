@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 06:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Contact', '0005_contact_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['owner_user', 'name'], name='contact_owner_name_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Contact", "0006_contact_owner_name_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="contact",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="contact",
+            name="version",
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
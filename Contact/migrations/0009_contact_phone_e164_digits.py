@@ -0,0 +1,69 @@
+# Generated by Django 5.2.4 on 2026-10-18 07:11
+
+import Contact.phones
+from django.conf import settings
+from django.db import migrations, models
+from phonenumber_field.phonenumber import PhoneNumber, to_python
+
+BATCH_SIZE = 1000
+
+
+def e164_of(stored):
+    # Frozen copy of Contact.phones.phone_columns for a stored phone_number
+    phone_number = to_python(stored)
+    if isinstance(phone_number, PhoneNumber) and phone_number.is_valid():
+        return phone_number.as_e164
+    return str(stored or "")
+
+
+def backfill_phone_columns(apps, schema_editor):
+    Contact = apps.get_model("Contact", "Contact")
+
+    batch = []
+    rows = Contact.objects.values_list("id", "phone_number").order_by("id")
+    for contact_id, stored in rows.iterator(chunk_size=BATCH_SIZE):
+        e164 = e164_of(stored)
+        digits = "".join(char for char in e164 if char.isdigit())
+        batch.append(Contact(id=contact_id, phone_e164=e164, phone_digits=digits))
+        if len(batch) >= BATCH_SIZE:
+            Contact.objects.bulk_update(batch, ["phone_e164", "phone_digits"])
+            batch = []
+    if batch:
+        Contact.objects.bulk_update(batch, ["phone_e164", "phone_digits"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Contact', '0008_contactchange'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Same column, stored through the memoized parser (no schema change)
+        migrations.AlterField(
+            model_name='contact',
+            name='phone_number',
+            field=Contact.phones.PhoneNumberField(max_length=128, region=None),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='phone_digits',
+            field=models.CharField(default='', editable=False, max_length=128),
+        ),
+        migrations.AddField(
+            model_name='contact',
+            name='phone_e164',
+            field=models.CharField(default='', editable=False, max_length=128),
+        ),
+        # Filled before the indexes are built, so they are built once
+        migrations.RunPython(backfill_phone_columns, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['owner_user', 'phone_e164'], name='contact_owner_e164_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['owner_user', 'phone_digits'], name='contact_owner_digits_idx'),
+        ),
+    ]
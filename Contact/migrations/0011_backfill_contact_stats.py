@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+BATCH_SIZE = 1000
+# Frozen copy of Contact.models.RECENT_DAYS
+RECENT_DAYS = 30
+
+
+def backfill_contact_stats(apps, schema_editor):
+    Contact = apps.get_model("Contact", "Contact")
+    ContactTag = apps.get_model("Contact", "ContactTag")
+    Tag = apps.get_model("Contact", "Tag")
+    ContactStats = apps.get_model("Contact", "ContactStats")
+    ContactDailyStats = apps.get_model("Contact", "ContactDailyStats")
+
+    ContactStats.objects.bulk_create(
+        (
+            ContactStats(owner_user_id=owner_id, total=total)
+            for owner_id, total in Contact.objects.values("owner_user_id")
+            .annotate(total=Count("id"))
+            .values_list("owner_user_id", "total")
+            .order_by()
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+    links = (
+        ContactTag.objects.filter(tag_id=OuterRef("pk"))
+        .values("tag_id")
+        .annotate(count=Count("id"))
+        .values("count")
+    )
+    Tag.objects.update(contact_count=Coalesce(Subquery(links), 0))
+
+    since = timezone.localdate() - timedelta(days=RECENT_DAYS - 1)
+    ContactDailyStats.objects.bulk_create(
+        (
+            ContactDailyStats(owner_user_id=owner_id, day=day, added=added)
+            for owner_id, day, added in Contact.objects.annotate(
+                day=TruncDate("created_at")
+            )
+            .filter(day__gte=since)
+            .values("owner_user_id", "day")
+            .annotate(added=Count("id"))
+            .values_list("owner_user_id", "day", "added")
+            .order_by()
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Contact", "0010_contact_stats"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_contact_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.4 on 2026-10-18 08:12
+
+import Contact.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Contact', '0011_backfill_contact_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contactchange',
+            name='txid',
+            field=models.BigIntegerField(db_default=Contact.models.CurrentTransactionId(), null=True),
+        ),
+        migrations.AddIndex(
+            model_name='contactchange',
+            index=models.Index(fields=['owner_user', 'txid'], name='contactchange_owner_txid_idx'),
+        ),
+    ]
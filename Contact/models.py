@@ -1,17 +1,332 @@
-from django.db import models
-from phonenumber_field.modelfields import PhoneNumberField
+from collections import Counter
+from datetime import timedelta
+
+from django.db import models, transaction
+from django.db.models import Case, F, Func, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
 from AuthenticationSystem.models import CustomUser
+from .phones import PhoneNumberField, phone_columns
+
+
+# Tags are sent by clients as a single string separated by "-"
+TAG_SEPARATOR = "-"
+MAX_TAG_LENGTH = 100
+
 
+def parse_tags(tags):
+    # Split a "-" separated tags string into unique, normalized (lowercase) names.
+    # Raises ValueError for a name longer than a Tag can store.
+    names = []
+    for name in str(tags or "").split(TAG_SEPARATOR):
+        name = name.strip().lower()
+        if len(name) > MAX_TAG_LENGTH:
+            raise ValueError(f"tag names are at most {MAX_TAG_LENGTH} characters")
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+class Tag(models.Model):
+    owner_user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name="tags"
+    )
+    # Always stored lowercase (see parse_tags)
+    name = models.CharField(max_length=MAX_TAG_LENGTH)
+    # Contacts linked to the tag, kept up to date by sync_contact_tags() and
+    # delete_contacts() (see stats.py)
+    contact_count = models.PositiveIntegerField(default=0)
 
-# class Tag(models.Model):
-#     title = models.CharField(max_length=50, unique=True)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner_user", "name"], name="unique_tag_per_owner"
+            ),
+        ]
+
+    def __str__(self):
+        return self.name
 
 
 class Contact(models.Model):
     name = models.CharField(max_length=100)
     phone_number = PhoneNumberField()
+    # Derived from phone_number on every write (see phones.py)
+    phone_e164 = models.CharField(max_length=128, default="", editable=False)
+    phone_digits = models.CharField(max_length=128, default="", editable=False)
     owner_user = models.ForeignKey(
         CustomUser, on_delete=models.CASCADE, related_name="contacts"
     )
+    # Raw "-" separated string, kept for the existing API.
+    # The normalized copy lives in tag_set and is used for filtering.
     tags = models.TextField(null=True, blank=True, default="none")
+    tag_set = models.ManyToManyField(
+        Tag, through="ContactTag", related_name="contacts", blank=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Bumped on every change, used for compare-and-swap edits and ETags
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of all/ walks (created_at, id) per owner,
+            # also serves (owner_user, created_at) filters
+            models.Index(
+                fields=["owner_user", "created_at", "id"],
+                name="contact_owner_created_id_idx",
+            ),
+            # Per-owner lookups / ordering by name
+            models.Index(fields=["owner_user", "name"], name="contact_owner_name_idx"),
+            # Per-owner exact number lookups, normalized or digits only
+            models.Index(
+                fields=["owner_user", "phone_e164"], name="contact_owner_e164_idx"
+            ),
+            models.Index(
+                fields=["owner_user", "phone_digits"], name="contact_owner_digits_idx"
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        if not adding:
+            self.version += 1
+        self.phone_e164, self.phone_digits = phone_columns(self.phone_number)
+        # The row, its tag links, the change log and the stats commit together
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            self.sync_tags()
+            record_changes(self.owner_user_id, [self.id])
+            if adding:
+                count_added_contacts(self.owner_user_id, 1)
+
+    def sync_tags(self):
+        # Rebuild the Contact <-> Tag rows from the raw tags string
+        sync_contact_tags(self.owner_user_id, {self.id: parse_tags(self.tags)})
+
+
+class ContactTag(models.Model):
+    contact = models.ForeignKey(
+        Contact, on_delete=models.CASCADE, related_name="contact_tags"
+    )
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name="contact_tags")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["contact", "tag"], name="unique_contact_tag"
+            ),
+        ]
+        indexes = [
+            # by-tag lookups go tag -> contacts
+            models.Index(fields=["tag", "contact"], name="contacttag_tag_contact_idx"),
+        ]
+
+
+def sync_contact_tags(owner_user_id, names_by_contact_id, replace=True):
+    # Link many contacts of one owner to their tags with a fixed number of queries.
+    # names_by_contact_id: {contact_id: [normalized tag names]}
+    # replace=False skips removing old links (for freshly created contacts)
+    all_names = {name for names in names_by_contact_id.values() for name in names}
+    removed = Counter()
+    if replace:
+        removed.update(
+            ContactTag.objects.filter(
+                contact_id__in=names_by_contact_id
+            ).values_list("tag_id", flat=True)
+        )
+
+    Tag.objects.bulk_create(
+        [Tag(owner_user_id=owner_user_id, name=name) for name in all_names],
+        ignore_conflicts=True,
+    )
+    tag_ids = dict(
+        Tag.objects.filter(owner_user_id=owner_user_id, name__in=all_names)
+        .values_list("name", "id")
+    )
+
+    if removed:
+        ContactTag.objects.filter(contact_id__in=names_by_contact_id).delete()
+    ContactTag.objects.bulk_create(
+        [
+            ContactTag(contact_id=contact_id, tag_id=tag_ids[name])
+            for contact_id, names in names_by_contact_id.items()
+            for name in names
+        ],
+        ignore_conflicts=True,
+    )
+
+    # Per-tag contact counts move by the difference of the links
+    added = Counter(
+        tag_ids[name] for names in names_by_contact_id.values() for name in names
+    )
+    added.subtract(removed)
+    add_to_tag_counts(added)
+
+
+class CurrentTransactionId(Func):
+    # Id of the inserting transaction on PostgreSQL, NULL elsewhere
+    output_field = models.BigIntegerField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        return "NULL", []
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return "(pg_current_xact_id()::text::bigint)", []
+
+
+class ContactChange(models.Model):
+    # Append-only change log for /api/contact/sync/.
+    # The auto id is the change sequence; rows are never updated and old
+    # ones are removed by the prune_contact_changes command.
+    owner_user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name="contact_changes"
+    )
+    # Not a ForeignKey: the row has to outlive the deleted contact (tombstone)
+    contact_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Filled in by the database, see sync.py
+    txid = models.BigIntegerField(null=True, db_default=CurrentTransactionId())
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["owner_user", "id"], name="contactchange_owner_seq_idx"),
+            models.Index(
+                fields=["owner_user", "txid"], name="contactchange_owner_txid_idx"
+            ),
+        ]
+
+
+def record_changes(owner_user_id, contact_ids, deleted=False):
+    # One INSERT for any number of changed (or deleted) contacts
+    ContactChange.objects.bulk_create(
+        [
+            ContactChange(
+                owner_user_id=owner_user_id, contact_id=contact_id, deleted=deleted
+            )
+            for contact_id in contact_ids
+        ]
+    )
+
+
+# Days of ContactDailyStats kept for the "recent" counts of stats/
+RECENT_DAYS = 30
+
+
+class ContactStats(models.Model):
+    # Denormalized contact count of a user, see stats.py
+    owner_user = models.OneToOneField(
+        CustomUser,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="contact_stats",
+    )
+    total = models.PositiveIntegerField(default=0)
+
+
+class ContactDailyStats(models.Model):
+    # Contacts of a user by creation day, only the last RECENT_DAYS days
+    owner_user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name="contact_daily_stats"
+    )
+    day = models.DateField()
+    added = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner_user", "day"], name="unique_contact_day_per_owner"
+            ),
+        ]
+
+
+def add_to_tag_counts(deltas):
+    # {tag_id: delta}, in one UPDATE
+    by_delta = {}
+    for tag_id, delta in deltas.items():
+        if delta:
+            by_delta.setdefault(delta, []).append(tag_id)
+    if not by_delta:
+        return
+    change = Case(
+        *[When(id__in=ids, then=Value(delta)) for delta, ids in by_delta.items()]
+    )
+    tag_ids = [tag_id for tag_id, delta in deltas.items() if delta]
+    Tag.objects.filter(id__in=tag_ids).update(
+        contact_count=Greatest(F("contact_count") + change, 0)
+    )
+
+
+def add_to_counter(rows, row, field, delta):
+    # rows: the queryset of one counter row, created as `row` on first use
+    if not rows.update(**{field: F(field) + delta}):
+        type(row).objects.bulk_create([row], ignore_conflicts=True)
+        rows.update(**{field: F(field) + delta})
+
+
+def count_added_contacts(owner_user_id, count):
+    # After creating `count` contacts (created today); their tag links are
+    # counted by sync_contact_tags()
+    if not count:
+        return
+    add_to_counter(
+        ContactStats.objects.filter(owner_user_id=owner_user_id),
+        ContactStats(owner_user_id=owner_user_id),
+        "total",
+        count,
+    )
+    today = timezone.localdate()
+    add_to_counter(
+        ContactDailyStats.objects.filter(owner_user_id=owner_user_id, day=today),
+        ContactDailyStats(owner_user_id=owner_user_id, day=today),
+        "added",
+        count,
+    )
+
+
+def delete_contacts(owner_user_id, contacts):
+    # Deletes `contacts` (a queryset of the owner's contacts) and moves the
+    # stats counters, in the caller's transaction. Returns the number deleted.
+    # Counters never go below 0, so drifted stats (see
+    # manage.py reconcile_contact_stats) cannot fail a delete.
+    # One SELECT (a row per tag link, tag_id None for a contact without tags)
+    # feeds the counters and doubles as the delete's id lookup: links and rows
+    # are then deleted by id, without the delete collector's own SELECT
+    # (ContactTag is the only relation of Contact, and no signal listens).
+    created = {}
+    links = Counter()
+    for contact_id, created_at, tag_id in contacts.values_list(
+        "id", "created_at", "contact_tags__tag_id"
+    ):
+        created[contact_id] = created_at
+        if tag_id is not None:
+            links[tag_id] -= 1
+    if not created:
+        return 0
+
+    if links:
+        ContactTag.objects.filter(contact_id__in=list(created)).delete()
+    deleted = Contact.objects.filter(
+        owner_user_id=owner_user_id, id__in=list(created)
+    )._raw_delete(contacts.db)
+
+    ContactStats.objects.filter(owner_user_id=owner_user_id).update(
+        total=Greatest(F("total") - deleted, 0)
+    )
+    since = timezone.localdate() - timedelta(days=RECENT_DAYS - 1)
+    days = Counter(
+        day
+        for day in map(timezone.localdate, created.values())
+        if day >= since
+    )
+    if days:
+        delta = Case(
+            *[When(day=day, then=Value(count)) for day, count in days.items()]
+        )
+        ContactDailyStats.objects.filter(
+            owner_user_id=owner_user_id, day__in=list(days)
+        ).update(added=Greatest(F("added") - delta, 0))
+    add_to_tag_counts(links)
+    return deleted
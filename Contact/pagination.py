@@ -0,0 +1,71 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+# Keyset (cursor) pagination over (created_at, id).
+# The cursor points at the last contact of the previous page, so every page
+# is an index range scan on (owner_user, created_at, id) no matter how deep it is.
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def parse_page_size(value):
+    if value in (None, ""):
+        return DEFAULT_PAGE_SIZE
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("limit must be a number")
+    if size < 1 or size > MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return size
+
+
+def encode_cursor(contact):
+    raw = json.dumps([contact.created_at.isoformat(), contact.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        created_at, contact_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(contact_id)
+    except (ValueError, TypeError):
+        raise ValueError("cursor is not valid")
+
+
+def page_queryset(queryset, cursor, limit):
+    queryset = queryset.order_by("created_at", "id")
+
+    after = decode_cursor(cursor)
+    if after:
+        created_at, contact_id = after
+        queryset = queryset.filter(created_at__gte=created_at).filter(
+            Q(created_at__gt=created_at) | Q(id__gt=contact_id)
+        )
+
+    # Fetch one extra row to know whether there is a next page
+    return queryset[: limit + 1]
+
+
+def split_page(page, limit):
+    if len(page) <= limit:
+        return page, None
+    page = page[:limit]
+    return page, encode_cursor(page[-1])
+
+
+def paginate(queryset, cursor, limit):
+    # Returns (page, next_cursor); next_cursor is None on the last page
+    return split_page(list(page_queryset(queryset, cursor, limit)), limit)
+
+
+async def apaginate(queryset, cursor, limit):
+    return split_page(
+        [contact async for contact in page_queryset(queryset, cursor, limit)], limit
+    )
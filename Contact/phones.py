@@ -0,0 +1,69 @@
+from functools import lru_cache
+
+from django.conf import settings
+from phonenumber_field import modelfields
+from phonenumber_field.phonenumber import PhoneNumber, to_python
+
+# Phone number normalization shared by the write paths.
+#
+# Parsing a number with libphonenumber is by far the most expensive step of
+# writing a contact, and bulk inputs repeat the same numbers (and the same
+# national formats of one region) over and over. parse_phone() memoizes the
+# result per (raw input, default region) in a bounded, process-wide LRU, so
+# every distinct input is parsed once per process.
+#
+# Contact.phone_number is stored through the same cache (PhoneNumberField
+# below), so a write does not validate and format the number a second time.
+#
+# Contacts also store the result in two indexed columns, computed once on write:
+#   phone_e164    the number in E.164 ("+12025550100"); for a number that
+#                 does not parse, the stored raw value, like phone_number
+#   phone_digits  phone_e164 reduced to digits ("12025550100"), the key for
+#                 digit-only lookups
+# Reads that only need the text (list pages, export) use phone_e164 and skip
+# re-parsing phone_number on every row.
+
+PARSE_CACHE_SIZE = 20000
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_cached(raw, region):
+    # The E.164 string of a valid number, otherwise None.
+    # Only immutable values are cached: PhoneNumber objects are mutable.
+    phone_number = to_python(raw, region=region)
+    if isinstance(phone_number, PhoneNumber) and phone_number.is_valid():
+        return phone_number.as_e164
+    return None
+
+
+def parse_phone(raw):
+    return parse_cached(
+        str(raw).strip(), getattr(settings, "PHONENUMBER_DEFAULT_REGION", None)
+    )
+
+
+def phone_digits(value):
+    return "".join(char for char in str(value) if char.isdigit())
+
+
+def phone_columns(value):
+    # (phone_e164, phone_digits) for a phone_number value (str or PhoneNumber)
+    if isinstance(value, PhoneNumber) and value.is_valid():
+        e164 = value.as_e164
+    else:
+        raw = value.raw_input if isinstance(value, PhoneNumber) else value
+        e164 = parse_phone(raw or "") or str(raw or "")
+    return e164, phone_digits(e164)
+
+
+class PhoneNumberField(modelfields.PhoneNumberField):
+    # Stores a number the way the parent field does, through parse_phone()
+    def get_prep_value(self, value):
+        raw = value.raw_input if isinstance(value, PhoneNumber) else value
+        if (
+            not raw
+            or not isinstance(raw, str)
+            or getattr(settings, "PHONENUMBER_DB_FORMAT", "E164") != "E164"
+        ):
+            return super().get_prep_value(value)
+        return parse_phone(raw) or raw
@@ -0,0 +1,169 @@
+import re
+
+from django.db import connection, connections
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import Contact
+
+# Search over contact names and phone numbers used by /api/contact/search/.
+#
+# Every whitespace separated term must match the name or the phone number
+# (case-insensitive substring). Phone terms are reduced to digits first, so
+# "(202) 555" finds "+12025550100".
+#
+# Index backing (created by migration 0005_contact_search_index):
+#   - SQLite: FTS5 table with the trigram tokenizer, kept in sync by triggers.
+#     The owner is stored as an indexed "#<id>#" token so the MATCH itself is
+#     owner-scoped.
+#   - PostgreSQL: pg_trgm GIN indexes on UPPER(name) and phone_number, which
+#     serve Django's icontains / contains lookups.
+# Terms shorter than 3 characters cannot use trigrams and fall back to plain
+# owner-scoped LIKE filters.
+#
+# Results are ranked: name prefix matches first, then other name matches,
+# then phone matches, then by name.
+
+SEARCH_TABLE = "Contact_contact_search"
+
+# SQLite rebuilds a table (and drops its triggers) for many schema changes,
+# so these are re-applied after every migrate (see apps.py)
+SQLITE_SEARCH_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS "Contact_contact_search_ai"
+    AFTER INSERT ON "Contact_contact"
+    BEGIN
+        INSERT INTO "Contact_contact_search" (rowid, name, phone_number, owner)
+        VALUES (new.id, new.name, new.phone_number, '#' || new.owner_user_id || '#');
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "Contact_contact_search_ad"
+    AFTER DELETE ON "Contact_contact"
+    BEGIN
+        DELETE FROM "Contact_contact_search" WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS "Contact_contact_search_au"
+    AFTER UPDATE OF name, phone_number, owner_user_id ON "Contact_contact"
+    BEGIN
+        UPDATE "Contact_contact_search"
+        SET name = new.name,
+            phone_number = new.phone_number,
+            owner = '#' || new.owner_user_id || '#'
+        WHERE rowid = old.id;
+    END
+    """,
+]
+
+MIN_TRIGRAM_LENGTH = 3
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+MAX_SEARCH_TERMS = 8
+
+PHONE_TERM_RE = re.compile(r"^[\d\s()+.\-]+$")
+
+
+def parse_terms(query):
+    # "Jo (202) 555" -> ["jo", "202555"]
+    query = (query or "").strip().lower()
+    if PHONE_TERM_RE.match(query) and any(char.isdigit() for char in query):
+        # The whole query is a phone number, however it is formatted
+        return [re.sub(r"\D", "", query)]
+
+    terms = []
+    for term in query.split():
+        if PHONE_TERM_RE.match(term):
+            term = re.sub(r"\D", "", term)
+        if term and term not in terms:
+            terms.append(term)
+    if len(terms) > MAX_SEARCH_TERMS:
+        raise ValueError(f"at most {MAX_SEARCH_TERMS} search terms")
+    return terms
+
+
+def rank_expression(first_term):
+    return Case(
+        When(name__istartswith=first_term, then=Value(3)),
+        When(name__icontains=first_term, then=Value(2)),
+        When(phone_number__contains=first_term, then=Value(1)),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def fts_match_expression(user_id, terms):
+    def quote(text):
+        return '"' + text.replace('"', '""') + '"'
+
+    parts = [f"owner : {quote(f'#{user_id}#')}"]
+    parts += [f"{{name phone_number}} : {quote(term)}" for term in terms]
+    return " AND ".join(parts)
+
+
+def search_with_fts(user_id, terms, limit, offset):
+    # One query: owner-scoped trigram MATCH joined back to the contact rows
+    first = terms[0].replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    sql = f"""
+        SELECT c.*
+        FROM "{SEARCH_TABLE}" s
+        JOIN "Contact_contact" c ON c.id = s.rowid
+        WHERE "{SEARCH_TABLE}" MATCH %s
+        ORDER BY
+            CASE
+                WHEN c.name LIKE %s ESCAPE '\\' THEN 3
+                WHEN c.name LIKE %s ESCAPE '\\' THEN 2
+                ELSE 1
+            END DESC,
+            s.rank,
+            c.name
+        LIMIT %s OFFSET %s
+    """
+    params = [
+        fts_match_expression(user_id, terms),
+        f"{first}%",
+        f"%{first}%",
+        limit,
+        offset,
+    ]
+    return list(Contact.objects.raw(sql, params))
+
+
+def search_with_orm(user_id, terms, limit, offset):
+    contacts = Contact.objects.filter(owner_user_id=user_id)
+    for term in terms:
+        contacts = contacts.filter(
+            Q(name__icontains=term) | Q(phone_number__contains=term)
+        )
+    contacts = contacts.annotate(search_rank=rank_expression(terms[0])).order_by(
+        "-search_rank", "name", "id"
+    )
+    return list(contacts[offset : offset + limit])
+
+
+def use_fts(terms):
+    return connection.vendor == "sqlite" and all(
+        len(term) >= MIN_TRIGRAM_LENGTH for term in terms
+    )
+
+
+def install_search_triggers(using="default", **kwargs):
+    # post_migrate receiver, a no-op outside SQLite or before the search table exists
+    db = connections[using]
+    if db.vendor != "sqlite" or SEARCH_TABLE not in db.introspection.table_names():
+        return
+    with db.cursor() as cursor:
+        for statement in SQLITE_SEARCH_TRIGGERS:
+            cursor.execute(statement)
+
+
+def search_contacts(user_id, query, limit, offset):
+    # Returns (contacts, has_more)
+    terms = parse_terms(query)
+    if not terms:
+        raise ValueError("q parameter is required")
+
+    search = search_with_fts if use_fts(terms) else search_with_orm
+    # One extra row tells whether there is a next page
+    contacts = search(user_id, terms, limit + 1, offset)
+    return contacts[:limit], len(contacts) > limit
@@ -11,10 +11,69 @@ from .models import Contact
 class ContactSerializer(serializers.ModelSerializer):
     class Meta:
         model = Contact
-        fields = "__all__"
+        # Listed explicitly so the tag_set M2M is not serialized per contact
+        fields = [
+            "id",
+            "name",
+            "phone_number",
+            "owner_user",
+            "tags",
+            "created_at",
+            "updated_at",
+            "version",
+        ]
 
 
 class ContactListSerializer(serializers.ModelSerializer):
+    # Fields a client may ask for with ?fields=...
+    ALLOWED_FIELDS = [
+        "id",
+        "name",
+        "phone_number",
+        "owner_user",
+        "tags",
+        "created_at",
+        "updated_at",
+        "version",
+    ]
+    DEFAULT_FIELDS = ["id", "name"]
+    MODEL_FIELDS = {"phone_number": "phone_e164"}
+    # Served from the stored E.164 column, so rows are not re-parsed on load
+    phone_number = serializers.CharField(source="phone_e164", read_only=True)
+
     class Meta:
         model = Contact
-        fields = "name"
+        fields = [
+            "id",
+            "name",
+            "phone_number",
+            "owner_user",
+            "tags",
+            "created_at",
+            "updated_at",
+            "version",
+        ]
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        for field_name in set(self.fields) - set(fields or self.DEFAULT_FIELDS):
+            self.fields.pop(field_name)
+
+    @classmethod
+    def model_fields(cls, fields):
+        # Columns to load (.only()) for the given output fields
+        return [cls.MODEL_FIELDS.get(name, name) for name in fields]
+
+    @classmethod
+    def parse_fields(cls, value):
+        # "name,id" -> ["name", "id"]; empty -> DEFAULT_FIELDS
+        if not value:
+            return cls.DEFAULT_FIELDS
+        fields = []
+        for field_name in value.split(","):
+            field_name = field_name.strip()
+            if field_name not in cls.ALLOWED_FIELDS:
+                raise ValueError(f"unknown field '{field_name}'")
+            if field_name not in fields:
+                fields.append(field_name)
+        return fields
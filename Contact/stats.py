@@ -0,0 +1,100 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import (
+    RECENT_DAYS,
+    Contact,
+    ContactDailyStats,
+    ContactStats,
+    ContactTag,
+    Tag,
+)
+
+# Per-user contact statistics for /api/contact/stats/: total contacts,
+# contacts per tag and contacts added recently.
+#
+# Served from denormalized counters instead of scanning the address book:
+#   ContactStats.total          contacts of the user
+#   Tag.contact_count           contacts linked to each tag
+#   ContactDailyStats.added     contacts by creation day (last RECENT_DAYS)
+# They move in the same transaction as every write: Contact.save() and the
+# importer count new contacts, sync_contact_tags() the change of tag links,
+# delete_contacts() deletions (delete/, bulk-delete/, merge/). All moves are
+# F() increments, so concurrent writes of a user never lose one.
+#
+# Writes that bypass these paths (raw SQL, benchmarks/seed.py before it
+# reconciled, a crash of an older version) make the counters drift:
+# reconcile_stats() rebuilds them from the contacts
+# (manage.py reconcile_contact_stats).
+
+RECENT_WINDOWS = [1, 7, RECENT_DAYS]
+
+
+def recent_since():
+    return timezone.localdate() - timedelta(days=RECENT_DAYS - 1)
+
+
+def get_stats(user_id):
+    # {"total": int, "tags": {name: count}, "recent": {"last_<n>_days": count}}
+    # Three indexed lookups, whatever the size of the address book
+    stats = ContactStats.objects.filter(owner_user_id=user_id).first()
+    tags = dict(
+        Tag.objects.filter(owner_user_id=user_id, contact_count__gt=0)
+        .order_by("name")
+        .values_list("name", "contact_count")
+    )
+    today = timezone.localdate()
+    days = dict(
+        ContactDailyStats.objects.filter(
+            owner_user_id=user_id, day__gte=recent_since()
+        ).values_list("day", "added")
+    )
+    recent = {}
+    for window in RECENT_WINDOWS:
+        since = today - timedelta(days=window - 1)
+        recent[f"last_{window}_days"] = sum(
+            added for day, added in days.items() if day >= since
+        )
+    return {"total": stats.total if stats else 0, "tags": tags, "recent": recent}
+
+
+def reconcile_stats(user_id):
+    # Rebuild the counters of a user from the contacts; returns the stats
+    # that were stored before, to report drift
+    before = get_stats(user_id)
+    with transaction.atomic():
+        contacts = Contact.objects.filter(owner_user_id=user_id)
+        ContactStats.objects.update_or_create(
+            owner_user_id=user_id, defaults={"total": contacts.count()}
+        )
+
+        links = (
+            ContactTag.objects.filter(tag_id=OuterRef("pk"))
+            .values("tag_id")
+            .annotate(count=Count("id"))
+            .values("count")
+        )
+        Tag.objects.filter(owner_user_id=user_id).update(
+            contact_count=Coalesce(Subquery(links), 0)
+        )
+
+        ContactDailyStats.objects.filter(owner_user_id=user_id).delete()
+        ContactDailyStats.objects.bulk_create(
+            ContactDailyStats(owner_user_id=user_id, day=day, added=added)
+            for day, added in contacts.annotate(day=TruncDate("created_at"))
+            .filter(day__gte=recent_since())
+            .values("day")
+            .annotate(added=Count("id"))
+            .values_list("day", "added")
+            .order_by()
+        )
+    return before
+
+
+def prune_daily_stats():
+    # Days past the recent windows are never read again
+    return ContactDailyStats.objects.filter(day__lt=recent_since()).delete()[0]
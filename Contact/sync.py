@@ -0,0 +1,210 @@
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections, router
+from django.db.models import Max, Q
+
+from .models import Contact, ContactChange
+
+# Delta sync used by /api/contact/sync/?token=...
+#
+# A client first pulls a snapshot of its contacts (paged by id), then only
+# asks for what changed since its last sync token:
+#     {"contacts": [...], "deleted": [ids], "token": "...", "has_more": bool}
+# "contacts" are created or updated rows to upsert, "deleted" are tombstones.
+#
+# Changes come from ContactChange, an append-only log written by every
+# contact write path. Its auto id is the change sequence and is indexed per
+# owner, so a delta costs one range scan plus one fetch of the changed rows,
+# however large the address book is.
+#
+# With concurrent writers, ids are allocated in insert order but become
+# visible in commit order: a transaction that commits late can land below a
+# sequence already handed out. On PostgreSQL every change also records the id
+# of its transaction (txid), and a token carries the snapshot xmin taken when
+# its round of pages started: every transaction below it had finished, the
+# others may still commit. The next round scans the changes past the sequence
+# plus those of transactions >= xmin, so late commits are picked up (changes
+# of transactions that were already visible may be sent twice; contacts are
+# sent as they are now, so a repeat is harmless). SQLite serializes writers
+# and skips the extra scan.
+#
+# Tokens are signed (not encrypted) and opaque to clients:
+#     {"mode": "snapshot", "seq": <log position>, "xmin": ..., "at": ...,
+#      "after": <last contact id>}
+#     {"mode": "delta", "seq": <log position>, "xmin": ..., "at": ...}
+# plus "after" / "next_xmin" / "next_at" while a delta round has more pages.
+# "at" is never later than the oldest change the client has not read yet: a
+# token whose "at" is older than the log retention may point at pruned
+# changes, gets 410 and the client starts a new snapshot.
+#
+# Settings (all optional):
+#     CONTACT_SYNC = {
+#         "PAGE_SIZE": 500,
+#         "MAX_PAGE_SIZE": 2000,
+#         "RETENTION_DAYS": 30,   # prune_contact_changes drops older log rows
+#     }
+
+DEFAULT_SYNC_PAGE_SIZE = 500
+MAX_SYNC_PAGE_SIZE = 2000
+DEFAULT_RETENTION_DAYS = 30
+
+TOKEN_SALT = "Contact.sync"
+
+
+class SyncTokenExpired(Exception):
+    pass
+
+
+def get_config():
+    return getattr(settings, "CONTACT_SYNC", {})
+
+
+def retention_seconds():
+    return get_config().get("RETENTION_DAYS", DEFAULT_RETENTION_DAYS) * 24 * 60 * 60
+
+
+def parse_sync_limit(value):
+    default = get_config().get("PAGE_SIZE", DEFAULT_SYNC_PAGE_SIZE)
+    maximum = get_config().get("MAX_PAGE_SIZE", MAX_SYNC_PAGE_SIZE)
+    if value in (None, ""):
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("limit must be a number")
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, maximum)
+
+
+def encode_token(state):
+    return signing.dumps(state, salt=TOKEN_SALT, compress=True)
+
+
+def decode_token(token):
+    try:
+        state = signing.loads(token, salt=TOKEN_SALT)
+    except signing.BadSignature:
+        raise ValueError("invalid sync token")
+    if not isinstance(state, dict) or state.get("mode") not in ("snapshot", "delta"):
+        raise ValueError("invalid sync token")
+    if state["mode"] == "delta" and state["at"] < time.time() - retention_seconds():
+        raise SyncTokenExpired()
+    return state
+
+
+def delta_token(seq, xmin, at):
+    return encode_token({"mode": "delta", "seq": seq, "xmin": xmin, "at": at})
+
+
+def snapshot_xmin():
+    # Oldest transaction still running (PostgreSQL): changes of lower txids
+    # are all committed and visible, the others may still show up.
+    # None on databases without concurrent writers.
+    connection = connections[router.db_for_read(ContactChange)]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")
+        return cursor.fetchone()[0]
+
+
+def sync_snapshot(user_id, state, limit):
+    # Pages of current contacts by id. The log position is taken before the
+    # first page, so writes made while paging are replayed by the first delta.
+    if "seq" not in state:
+        state = {
+            "mode": "snapshot",
+            "xmin": snapshot_xmin(),
+            "at": int(time.time()),
+        }
+        state["seq"] = (
+            ContactChange.objects.filter(owner_user_id=user_id).aggregate(
+                seq=Max("id")
+            )["seq"]
+            or 0
+        )
+    contacts = list(
+        Contact.objects.filter(owner_user_id=user_id, id__gt=state.get("after", 0))
+        .order_by("id")[: limit + 1]
+    )
+    has_more = len(contacts) > limit
+    contacts = contacts[:limit]
+
+    if has_more:
+        token = encode_token({**state, "after": contacts[-1].id})
+    else:
+        # Tokens issued before "at" was added start their first delta now
+        at = state.get("at", int(time.time()))
+        token = delta_token(state["seq"], state.get("xmin"), at)
+    return contacts, [], token, has_more
+
+
+def sync_delta(user_id, state, limit):
+    # One round scans the changes after "seq" (and of transactions >= "xmin")
+    # in pages by id; the next round starts from the snapshot taken when this
+    # one started
+    seq = state["seq"]
+    after = state.get("after", 0)
+    if "next_at" in state:
+        next_xmin, next_at = state["next_xmin"], state["next_at"]
+    else:
+        next_xmin, next_at = snapshot_xmin(), int(time.time())
+
+    unread = Q(id__gt=seq)
+    if state.get("xmin") is not None:
+        unread |= Q(txid__gte=state["xmin"])
+    changes = list(
+        ContactChange.objects.filter(unread, owner_user_id=user_id, id__gt=after)
+        .order_by("id")
+        .values_list("id", "contact_id", "deleted", "created_at")[: limit + 1]
+    )
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    if has_more:
+        token = encode_token(
+            {
+                **state,
+                "after": changes[-1][0],
+                "next_xmin": next_xmin,
+                "next_at": next_at,
+                # The unread changes are the ones after this page
+                "at": int(changes[-1][3].timestamp()),
+            }
+        )
+    else:
+        last = changes[-1][0] if changes else 0
+        token = delta_token(max(seq, after, last), next_xmin, next_at)
+    if not changes:
+        return [], [], token, False
+
+    # The latest change of a contact wins
+    deleted_by_contact = {}
+    for _, contact_id, deleted, _ in changes:
+        deleted_by_contact[contact_id] = deleted
+
+    changed_ids = [
+        contact_id
+        for contact_id, deleted in deleted_by_contact.items()
+        if not deleted
+    ]
+    # A contact deleted after this page is missing here; its tombstone
+    # comes with a later page
+    contacts = list(
+        Contact.objects.filter(owner_user_id=user_id, id__in=changed_ids).order_by("id")
+    ) if changed_ids else []
+    deleted_ids = sorted(
+        contact_id for contact_id, deleted in deleted_by_contact.items() if deleted
+    )
+    return contacts, deleted_ids, token, has_more
+
+
+def sync_contacts(user_id, token, limit):
+    # Returns (contacts, deleted_ids, next_token, has_more)
+    state = decode_token(token) if token else {"mode": "snapshot"}
+    if state["mode"] == "snapshot":
+        return sync_snapshot(user_id, state, limit)
+    return sync_delta(user_id, state, limit)
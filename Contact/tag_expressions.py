@@ -0,0 +1,171 @@
+import re
+
+from django.db.models import Exists, OuterRef, Q
+
+from .models import ContactTag
+
+# Tag expressions used by /api/contact/by-tag/?q=...
+#
+#   work AND vip NOT archived
+#   (work OR home) AND NOT archived
+#   "best friend" OR family
+#
+# Operators are case-insensitive, NOT binds tightest, then AND, then OR.
+# Two terms next to each other are joined with AND ("work vip" == "work AND vip").
+# Tags with spaces can be quoted.
+
+MAX_EXPRESSION_TAGS = 20
+# Bounds of the parse: the parser and the tree walkers recurse once per
+# parenthesis / NOT, so deep input must be turned away before it hits
+# Python's recursion limit
+MAX_EXPRESSION_TOKENS = 200
+MAX_EXPRESSION_DEPTH = 20
+
+TOKEN_RE = re.compile(r'\(|\)|"[^"]*"|[^\s()"]+')
+OPERATORS = {"AND", "OR", "NOT"}
+
+
+def tokenize(expression):
+    tokens = []
+    for token in TOKEN_RE.findall(expression or ""):
+        if token.upper() in OPERATORS:
+            tokens.append(token.upper())
+        elif token in ("(", ")"):
+            tokens.append(token)
+        else:
+            name = token.strip('"').strip().lower()
+            if not name:
+                raise ValueError("empty tag in expression")
+            tokens.append(("TAG", name))
+        if len(tokens) > MAX_EXPRESSION_TOKENS:
+            raise ValueError(f"at most {MAX_EXPRESSION_TOKENS} terms per expression")
+    return tokens
+
+
+class Parser:
+    # Recursive descent parser producing a small tuple tree:
+    #   ("tag", name) | ("not", node) | ("and", [nodes]) | ("or", [nodes])
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+        self.depth = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("tag expression is empty")
+        node = self.parse_or()
+        if self.peek() is not None:
+            raise ValueError(f"unexpected token {self.describe(self.peek())}")
+        return node
+
+    def parse_or(self):
+        nodes = [self.parse_and()]
+        while self.peek() == "OR":
+            self.take()
+            nodes.append(self.parse_and())
+        return nodes[0] if len(nodes) == 1 else ("or", nodes)
+
+    def parse_and(self):
+        nodes = [self.parse_not()]
+        while self.peek() not in (None, "OR", ")"):
+            if self.peek() == "AND":
+                self.take()
+            nodes.append(self.parse_not())
+        return nodes[0] if len(nodes) == 1 else ("and", nodes)
+
+    def enter(self):
+        self.depth += 1
+        if self.depth > MAX_EXPRESSION_DEPTH:
+            raise ValueError(
+                f"at most {MAX_EXPRESSION_DEPTH} nested parentheses / NOTs"
+            )
+
+    def parse_not(self):
+        if self.peek() == "NOT":
+            self.take()
+            self.enter()
+            node = ("not", self.parse_not())
+            self.depth -= 1
+            return node
+        return self.parse_atom()
+
+    def parse_atom(self):
+        token = self.take()
+        if token == "(":
+            self.enter()
+            node = self.parse_or()
+            if self.take() != ")":
+                raise ValueError("missing closing parenthesis")
+            self.depth -= 1
+            return node
+        if isinstance(token, tuple):
+            return ("tag", token[1])
+        raise ValueError(f"unexpected token {self.describe(token)}")
+
+    @staticmethod
+    def describe(token):
+        if token is None:
+            return "end of expression"
+        if isinstance(token, tuple):
+            return f"'{token[1]}'"
+        return f"'{token}'"
+
+
+def parse_tag_expression(expression):
+    tree = Parser(tokenize(expression)).parse()
+    if len(tag_names(tree)) > MAX_EXPRESSION_TAGS:
+        raise ValueError(f"at most {MAX_EXPRESSION_TAGS} tags per expression")
+    return tree
+
+
+def tag_names(tree):
+    kind, value = tree
+    if kind == "tag":
+        return {value}
+    if kind == "not":
+        return tag_names(value)
+    return set().union(*(tag_names(node) for node in value))
+
+
+def canonical(tree):
+    # Stable text form of an expression, used in cache keys
+    kind, value = tree
+    if kind == "tag":
+        return value
+    if kind == "not":
+        return f"not({canonical(value)})"
+    return f"{kind}({','.join(canonical(node) for node in value)})"
+
+
+def tree_to_q(tree, user):
+    # Every tag becomes an EXISTS on the (tag, contact) index, so the whole
+    # expression runs as a single query against Contact
+    kind, value = tree
+    if kind == "tag":
+        return Q(
+            Exists(
+                ContactTag.objects.filter(
+                    contact=OuterRef("pk"),
+                    tag__owner_user_id=user.id,
+                    tag__name=value,
+                )
+            )
+        )
+    if kind == "not":
+        return ~tree_to_q(value, user)
+
+    q = tree_to_q(value[0], user)
+    for node in value[1:]:
+        q = q & tree_to_q(node, user) if kind == "and" else q | tree_to_q(node, user)
+    return q
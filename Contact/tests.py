@@ -1,3 +1,1784 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import time
+import warnings
+from datetime import timedelta
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, router
+from django.db.migrations.executor import MigrationExecutor
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from AuthenticationSystem.authentication import local_user_cache
+from AuthenticationSystem.models import CustomUser
+from AuthenticationSystem.views import get_tokens_for_user
+from .caching import contact_cache
+from .importer import IMPORT_CHUNK_SIZE, import_contacts
+from .models import Contact, ContactChange, Tag, parse_tags, sync_contact_tags
+from .pagination import decode_cursor, encode_cursor
+from .phones import parse_cached
+from .search import parse_terms, search_with_fts, search_with_orm, use_fts
+from .stats import get_stats, reconcile_stats
+from .sync import encode_token
+from .tag_expressions import canonical, parse_tag_expression
+from SmartContact import metrics
+from SmartContact.db_router import pin_key, pin_to_primary, replica_reads
+
+
+# Local memory cache so the tests do not need a running Redis
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class ContactWriteQueryCountTests(TestCase):
+    # Query-count regression tests for the single-contact write paths.
+    # force_authenticate keeps authentication out of the counts.
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(user_name="owner", password="pw")
+        self.other = CustomUser.objects.create_user(user_name="other", password="pw")
+        self.contact = Contact.objects.create(
+            name="Alice",
+            phone_number="+12025550100",
+            owner_user=self.user,
+            tags="family-friends",
+        )
+        self.foreign_contact = Contact.objects.create(
+            name="Bob",
+            phone_number="+12025550101",
+            owner_user=self.other,
+            tags="work",
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def edit(self, contact_id, headers=None, **extra):
+        data = {
+            "contact_id": contact_id,
+            "new_name": "Alice Updated",
+            "new_phone_number": "+12025550199",
+            **extra,
+        }
+        return self.client.put(
+            "/api/contact/edit/", data, format="json", headers=headers
+        )
+
+    def test_edit_is_one_update(self):
+        # UPDATE + change-log INSERT
+        with self.assertNumQueries(2):
+            response = self.edit(self.contact.id)
+
+        self.assertEqual(response.status_code, 200)
+        self.contact.refresh_from_db()
+        self.assertEqual(self.contact.name, "Alice Updated")
+        self.assertEqual(str(self.contact.phone_number), "+12025550199")
+        self.assertEqual(self.contact.tags, "family-friends")
+
+    def test_edit_with_tags_relinks_tags(self):
+        # UPDATE + change log + old links, tag upsert, tag ids, unlink, link
+        # + one UPDATE of the per-tag counts. Retagging is not the one-statement
+        # path (an edit without new_tags is): the links and the stats/
+        # counters move in the same transaction so stats/ never scans.
+        with self.assertNumQueries(8):
+            response = self.edit(self.contact.id, new_tags="Work-VIP")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(self.contact.tag_set.values_list("name", flat=True)),
+            ["vip", "work"],
+        )
+
+    def test_edit_foreign_contact_is_not_allowed(self):
+        with self.assertNumQueries(2):
+            response = self.edit(self.foreign_contact.id)
+
+        self.assertEqual(response.status_code, 405)
+        self.foreign_contact.refresh_from_db()
+        self.assertEqual(self.foreign_contact.name, "Bob")
+
+    def test_edit_missing_contact(self):
+        self.assertEqual(self.edit(999999).status_code, 404)
+
+    def test_edit_with_stale_version_conflicts(self):
+        self.assertEqual(self.edit(self.contact.id, version=1).status_code, 200)
+
+        response = self.edit(self.contact.id, version=1, new_name="Lost update")
+
+        self.assertEqual(response.status_code, 409)
+        self.contact.refresh_from_db()
+        self.assertEqual(self.contact.name, "Alice Updated")
+        self.assertEqual(self.contact.version, 2)
+
+    def test_edit_with_if_match(self):
+        etag = f'"c{self.contact.id}-v1"'
+        response = self.edit(self.contact.id, headers={"If-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], f'"c{self.contact.id}-v2"')
+
+        stale = self.edit(self.contact.id, headers={"If-Match": etag})
+        self.assertEqual(stale.status_code, 409)
+
+        # Any version
+        response = self.edit(self.contact.id, headers={"If-Match": "*"})
+        self.assertEqual(response.status_code, 200)
+        self.contact.refresh_from_db()
+        self.assertEqual(self.contact.version, 3)
+
+    def test_edit_with_a_foreign_or_bad_if_match(self):
+        for if_match in [
+            f'"c{self.foreign_contact.id}-v1"',
+            f'W/"c{self.contact.id}-v1"',
+            f'"c{self.contact.id}-vx"',
+        ]:
+            response = self.edit(self.contact.id, headers={"If-Match": if_match})
+            self.assertEqual(response.status_code, 412, if_match)
+        response = self.edit(self.contact.id, headers={"If-Match": "c1-v1"})
+        self.assertEqual(response.status_code, 400)
+        self.contact.refresh_from_db()
+        self.assertEqual(self.contact.version, 1)
+
+    def test_non_numeric_contact_id_is_rejected(self):
+        for headers in [None, {"If-None-Match": '"c1-v1"'}]:
+            response = self.client.get(
+                "/api/contact/detail/?contact_id=abc", headers=headers
+            )
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            self.client.delete("/api/contact/delete/?contact_id=abc").status_code, 400
+        )
+        self.assertEqual(self.edit("abc").status_code, 400)
+
+    def test_delete(self):
+        # SELECT of the row and its tag links (ids and stats in one) + DELETE
+        # tag links + DELETE contact + tombstone, no owner fetch. The stats/
+        # counters cost three small UPDATEs (total, day, per-tag) on three
+        # tables, the price of never scanning the address book for stats/.
+        with self.assertNumQueries(7):
+            response = self.client.delete(
+                f"/api/contact/delete/?contact_id={self.contact.id}"
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Contact.objects.filter(id=self.contact.id).exists())
+
+    def test_delete_foreign_contact_is_not_allowed(self):
+        response = self.client.delete(
+            f"/api/contact/delete/?contact_id={self.foreign_contact.id}"
+        )
+
+        self.assertEqual(response.status_code, 405)
+        self.assertTrue(Contact.objects.filter(id=self.foreign_contact.id).exists())
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class ContactSyncTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(user_name="owner", password="pw")
+        self.other = CustomUser.objects.create_user(user_name="other", password="pw")
+        self.contacts = [
+            Contact.objects.create(
+                name=f"Contact {number}",
+                phone_number=f"+1202555010{number}",
+                owner_user=self.user,
+                tags="work",
+            )
+            for number in range(3)
+        ]
+        Contact.objects.create(
+            name="Foreign", phone_number="+12025550109", owner_user=self.other
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def sync(self, token=None, **params):
+        if token:
+            params["token"] = token
+        response = self.client.get("/api/contact/sync/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_requires_authentication(self):
+        response = APIClient().get("/api/contact/sync/")
+
+        self.assertEqual(response.status_code, 401)
+
+    def full_sync(self):
+        token = None
+        names = []
+        while True:
+            data = self.sync(token, limit=2)
+            names += [contact["name"] for contact in data["contacts"]]
+            token = data["token"]
+            if not data["has_more"]:
+                return names, token
+
+    def test_snapshot_pages_own_contacts(self):
+        names, _ = self.full_sync()
+
+        self.assertEqual(names, ["Contact 0", "Contact 1", "Contact 2"])
+
+    def test_delta_returns_changes_and_tombstones(self):
+        _, token = self.full_sync()
+        self.assertEqual(self.sync(token)["contacts"], [])
+
+        self.client.put(
+            "/api/contact/edit/",
+            {
+                "contact_id": self.contacts[0].id,
+                "new_name": "Renamed",
+                "new_phone_number": "+12025550100",
+            },
+            format="json",
+        )
+        self.client.delete(f"/api/contact/delete/?contact_id={self.contacts[1].id}")
+        Contact.objects.create(
+            name="New", phone_number="+12025550108", owner_user=self.user
+        )
+
+        data = self.sync(token)
+
+        self.assertEqual(
+            sorted(contact["name"] for contact in data["contacts"]), ["New", "Renamed"]
+        )
+        self.assertEqual(data["deleted"], [self.contacts[1].id])
+        self.assertFalse(data["has_more"])
+        self.assertEqual(self.sync(data["token"])["contacts"], [])
+
+    def test_delta_of_deleted_contact_is_only_a_tombstone(self):
+        _, token = self.full_sync()
+        contact_id = self.contacts[2].id
+        self.client.put(
+            "/api/contact/edit/",
+            {
+                "contact_id": contact_id,
+                "new_name": "Gone soon",
+                "new_phone_number": "+12025550102",
+            },
+            format="json",
+        )
+        self.client.delete(f"/api/contact/delete/?contact_id={contact_id}")
+
+        data = self.sync(token)
+
+        self.assertEqual(data["contacts"], [])
+        self.assertEqual(data["deleted"], [contact_id])
+
+    def test_delta_is_two_queries(self):
+        _, token = self.full_sync()
+        Contact.objects.create(
+            name="New", phone_number="+12025550108", owner_user=self.user
+        )
+
+        # change-log range scan + changed rows
+        with self.assertNumQueries(2):
+            self.sync(token)
+
+    def test_tampered_token_is_rejected(self):
+        response = self.client.get("/api/contact/sync/", {"token": "not-a-token"})
+
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(CONTACT_SYNC={"RETENTION_DAYS": 0})
+    def test_expired_token_is_gone(self):
+        _, token = self.full_sync()
+        ContactChange.objects.all().delete()
+
+        response = self.client.get("/api/contact/sync/", {"token": token})
+
+        self.assertEqual(response.status_code, 410)
+
+    def test_late_commit_below_the_token_is_not_lost(self):
+        # A change whose transaction was still running (txid >= the token's
+        # xmin) commits at or below the sequence the client already has
+        late = ContactChange.objects.create(
+            owner_user=self.user, contact_id=self.contacts[1].id
+        )
+        ContactChange.objects.filter(id=late.id).update(txid=150)
+        Contact.objects.create(
+            name="New", phone_number="+12025550108", owner_user=self.user
+        )
+        token = encode_token(
+            {"mode": "delta", "seq": late.id, "xmin": 100, "at": int(time.time())}
+        )
+
+        data = self.sync(token)
+
+        self.assertEqual(
+            [contact["name"] for contact in data["contacts"]], ["Contact 1", "New"]
+        )
+        self.assertEqual(self.sync(data["token"])["contacts"], [])
+
+    def test_unread_changes_older_than_the_retention_are_gone(self):
+        _, token = self.full_sync()
+        for contact in self.contacts:
+            contact.name += " renamed"
+            contact.save()
+        ContactChange.objects.update(created_at=timezone.now() - timedelta(days=31))
+
+        # The token of the second page points at changes that may be pruned
+        data = self.sync(token, limit=1)
+        self.assertTrue(data["has_more"])
+        response = self.client.get("/api/contact/sync/", {"token": data["token"]})
+
+        self.assertEqual(response.status_code, 410)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    ROOT_URLCONF="SmartContact.asgi_urls",
+)
+class AsyncContactViewTests(TestCase):
+    # The async views (async_views.py) against the same expectations as views.py
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(user_name="owner", password="pw")
+        access = get_tokens_for_user(self.user)["access"]
+        self.headers = {"Authorization": f"Bearer {access}"}
+
+    async def create(self, name, phone_number):
+        return await self.async_client.post(
+            "/api/contact/create/",
+            {"name": name, "phone_number": phone_number, "tags": "work"},
+            content_type="application/json",
+            headers=self.headers,
+        )
+
+    async def test_requires_authentication(self):
+        response = await self.async_client.get("/api/contact/all/")
+
+        self.assertEqual(response.status_code, 401)
+
+    async def test_create_and_list_with_etag(self):
+        self.assertEqual((await self.create("Alice", "+12025550100")).status_code, 201)
+
+        response = await self.async_client.get(
+            "/api/contact/all/?fields=id,name,tags", headers=self.headers
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [contact["name"] for contact in response.json()["contacts"]], ["Alice"]
+        )
+
+        cached = await self.async_client.get(
+            "/api/contact/all/?fields=id,name,tags",
+            headers={**self.headers, "If-None-Match": response.headers["ETag"]},
+        )
+        self.assertEqual(cached.status_code, 304)
+
+        await self.create("Bob", "+12025550101")
+        response = await self.async_client.get(
+            "/api/contact/all/?fields=id,name,tags", headers=self.headers
+        )
+        self.assertEqual(len(response.json()["contacts"]), 2)
+
+    async def test_non_numeric_contact_id_is_rejected(self):
+        for headers in [self.headers, {**self.headers, "If-None-Match": '"c1-v1"'}]:
+            response = await self.async_client.get(
+                "/api/contact/detail/?contact_id=abc", headers=headers
+            )
+            self.assertEqual(response.status_code, 400)
+        response = await self.async_client.delete(
+            "/api/contact/delete/?contact_id=abc", headers=self.headers
+        )
+        self.assertEqual(response.status_code, 400)
+
+    async def test_detail_edit_and_delete(self):
+        await self.create("Alice", "+12025550100")
+        contact = await Contact.objects.aget(owner_user_id=self.user.id)
+
+        detail = await self.async_client.get(
+            f"/api/contact/detail/?contact_id={contact.id}", headers=self.headers
+        )
+        self.assertEqual(detail.json()["name"], "Alice")
+
+        edit = {
+            "contact_id": contact.id,
+            "new_name": "Alice Updated",
+            "new_phone_number": "+12025550199",
+        }
+        response = await self.async_client.put(
+            "/api/contact/edit/",
+            edit,
+            content_type="application/json",
+            headers={**self.headers, "If-Match": detail.headers["ETag"]},
+        )
+        self.assertEqual(response.status_code, 200)
+        stale = await self.async_client.put(
+            "/api/contact/edit/",
+            edit,
+            content_type="application/json",
+            headers={**self.headers, "If-Match": detail.headers["ETag"]},
+        )
+        self.assertEqual(stale.status_code, 409)
+
+        response = await self.async_client.delete(
+            f"/api/contact/delete/?contact_id={contact.id}", headers=self.headers
+        )
+        self.assertEqual(response.status_code, 200)
+        missing = await self.async_client.delete(
+            f"/api/contact/delete/?contact_id={contact.id}", headers=self.headers
+        )
+        self.assertEqual(missing.status_code, 404)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class TwoTierCacheTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(user_name="owner", password="pw")
+        Contact.objects.create(
+            name="Alice", phone_number="+12025550100", owner_user=self.user
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def names(self):
+        response = self.client.get("/api/contact/all/")
+        return [contact["name"] for contact in response.data["contacts"]]
+
+    def test_hot_read_is_served_from_l1(self):
+        self.names()
+        before = contact_cache.stats()
+
+        # The generation and the page both come from L1: no cache or DB access
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names(), ["Alice"])
+
+        after = contact_cache.stats()
+        self.assertEqual(after["l1_hits"] - before["l1_hits"], 1)
+        self.assertEqual(after["l2_hits"] - before["l2_hits"], 0)
+        self.assertGreater(after["l1_bytes"], 0)
+
+    def test_write_invalidates_l1(self):
+        self.assertEqual(self.names(), ["Alice"])
+
+        self.client.post(
+            "/api/contact/create/",
+            {"name": "Bob", "phone_number": "+12025550101", "tags": "work"},
+            format="json",
+        )
+
+        self.assertEqual(self.names(), ["Alice", "Bob"])
+
+    @override_settings(CONTACT_CACHE={"TIMEOUTS": {"page": 5}, "L1": {"TIMEOUT": 60}})
+    def test_l2_hit_fills_l1_with_the_kind_timeout(self):
+        key = contact_cache.make_key(self.user.id, "page", "x")
+        cache.set(key, {"contacts": []})
+
+        self.assertEqual(contact_cache.get(key, "page"), {"contacts": []})
+
+        expires_at, _, _ = contact_cache.local.entries[key]
+        self.assertLessEqual(expires_at - time.monotonic(), 5)
+
+    @override_settings(CONTACT_CACHE={"L1": None})
+    def test_l1_can_be_disabled(self):
+        self.names()
+        before = contact_cache.stats()
+
+        self.names()
+
+        after = contact_cache.stats()
+        self.assertEqual(after["l1_hits"], before["l1_hits"])
+        self.assertEqual(after["l2_hits"] - before["l2_hits"], 1)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class PhoneColumnsTests(TestCase):
+
+    def setUp(self):
+        parse_cached.cache_clear()
+        self.user = CustomUser.objects.create_user(user_name="owner", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_create_stores_normalized_columns(self):
+        contact = Contact.objects.create(
+            name="Alice", phone_number="+1 (202) 555-0100", owner_user=self.user
+        )
+
+        contact.refresh_from_db()
+        self.assertEqual(str(contact.phone_number), "+12025550100")
+        self.assertEqual(contact.phone_e164, "+12025550100")
+        self.assertEqual(contact.phone_digits, "12025550100")
+
+    def test_edit_updates_columns(self):
+        contact = Contact.objects.create(
+            name="Alice", phone_number="+12025550100", owner_user=self.user
+        )
+
+        self.client.put(
+            "/api/contact/edit/",
+            {
+                "contact_id": contact.id,
+                "new_name": "Alice",
+                "new_phone_number": "+1 202 555 0199",
+            },
+            format="json",
+        )
+
+        contact.refresh_from_db()
+        self.assertEqual(contact.phone_e164, "+12025550199")
+        self.assertEqual(contact.phone_digits, "12025550199")
+
+    def test_import_parses_each_number_once(self):
+        rows = [
+            {"name": f"Contact {number}", "phone_number": "+12025550100"}
+            for number in range(50)
+        ]
+        rows.append({"name": "Broken", "phone_number": "12"})
+
+        response = self.client.post("/api/contact/import/", rows, format="json")
+
+        self.assertEqual(response.data["created"], 50)
+        self.assertEqual(response.data["failed"], 1)
+        self.assertEqual(parse_cached.cache_info().misses, 2)
+        self.assertEqual(
+            set(Contact.objects.values_list("phone_e164", "phone_digits")),
+            {("+12025550100", "12025550100")},
+        )
+
+    def test_list_serves_stored_e164(self):
+        Contact.objects.create(
+            name="Alice", phone_number="+12025550100", owner_user=self.user
+        )
+
+        response = self.client.get("/api/contact/all/?fields=name,phone_number")
+
+        self.assertEqual(
+            response.data["contacts"],
+            [{"name": "Alice", "phone_number": "+12025550100"}],
+        )
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class DuplicateContactTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        contact_cache.clear_local()
+        self.user = CustomUser.objects.create_user(user_name="owner", password="pw")
+        self.other = CustomUser.objects.create_user(user_name="other", password="pw")
+        self.john = self.add("John Smith", "+12025550100", "work")
+        self.smith = self.add("Smith, John", "+12025550101", "family")
+        self.jon = self.add("Jon Smith", "+12025550102")
+        self.alice = self.add("Alice", "+12025550103", "work-vip")
+        self.alice_work = self.add("Alice (office)", "+1 202 555 0103", "office")
+        self.bob = self.add("Bob", "+12025550104")
+        self.foreign = self.add("John Smith", "+12025550100", owner=self.other)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def add(self, name, phone_number, tags="none", owner=None):
+        return Contact.objects.create(
+            name=name,
+            phone_number=phone_number,
+            owner_user=owner or self.user,
+            tags=tags,
+        )
+
+    def groups(self):
+        response = self.client.get("/api/contact/duplicates/")
+        self.assertEqual(response.status_code, 200)
+        return {
+            tuple(contact["id"] for contact in group["contacts"]): group["reasons"]
+            for group in response.data["groups"]
+        }
+
+    def test_groups_by_phone_and_similar_name(self):
+        self.assertEqual(
+            self.groups(),
+            {
+                (self.john.id, self.smith.id, self.jon.id): ["name"],
+                (self.alice.id, self.alice_work.id): ["phone"],
+            },
+        )
+
+    def test_report_is_cached_until_a_write(self):
+        first = self.client.get("/api/contact/duplicates/")
+
+        with self.assertNumQueries(0):
+            cached = self.client.get(
+                "/api/contact/duplicates/", headers={"If-None-Match": first["ETag"]}
+            )
+        self.assertEqual(cached.status_code, 304)
+
+        self.client.post(
+            "/api/contact/create/",
+            {"name": "Bobby", "phone_number": "+12025550104", "tags": "x"},
+            format="json",
+        )
+        bobby = Contact.objects.get(name="Bobby")
+        self.assertEqual(self.groups()[(self.bob.id, bobby.id)], ["phone"])
+
+    def test_merge_unions_tags_and_deletes_the_others(self):
+        response = self.client.post(
+            "/api/contact/merge/",
+            {"keep_id": self.john.id, "merge_ids": [self.smith.id, self.jon.id]},
+            format="json",
+        )
+
+        self.assertEqual(response.data["merged"], 2)
+        self.john.refresh_from_db()
+        self.assertEqual(self.john.tags, "work-family")
+        self.assertEqual(self.john.version, 2)
+        self.assertEqual(
+            sorted(self.john.tag_set.values_list("name", flat=True)),
+            ["family", "work"],
+        )
+        self.assertFalse(
+            Contact.objects.filter(id__in=[self.smith.id, self.jon.id]).exists()
+        )
+        self.assertEqual(
+            set(
+                ContactChange.objects.filter(deleted=True).values_list(
+                    "contact_id", flat=True
+                )
+            ),
+            {self.smith.id, self.jon.id},
+        )
+        self.assertEqual(self.groups(), {(self.alice.id, self.alice_work.id): ["phone"]})
+
+    def test_merge_ignores_foreign_contacts(self):
+        response = self.client.post(
+            "/api/contact/merge/",
+            {"keep_id": self.john.id, "merge_ids": [self.foreign.id]},
+            format="json",
+        )
+        self.assertEqual(response.data["merged"], 0)
+        self.assertTrue(Contact.objects.filter(id=self.foreign.id).exists())
+
+        response = self.client.post(
+            "/api/contact/merge/",
+            {"keep_id": self.foreign.id, "merge_ids": [self.john.id]},
+            format="json",
+        )
+        # Same answer as the other endpoints for a contact of another user
+        self.assertEqual(response.status_code, 405)
+        self.assertTrue(Contact.objects.filter(id=self.john.id).exists())
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    CONTACT_CACHE={"L1": None},
+    JWT_USER_CACHE={"BACKEND": "local", "TIMEOUT": 30},
+    METRICS={},
+)
+class RequestMetricsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        local_user_cache.clear()
+        metrics.reset()
+        self.user = CustomUser.objects.create_user(user_name="owner", password="pw")
+        Contact.objects.create(
+            name="Alice", phone_number="+12025550100", owner_user=self.user
+        )
+        access = get_tokens_for_user(self.user)["access"]
+        self.headers = {"Authorization": f"Bearer {access}"}
+
+    def scrape(self, **kwargs):
+        response = self.client.get("/metrics", **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode().splitlines()
+
+    def test_requests_are_recorded_per_endpoint(self):
+        self.client.get("/api/contact/all/", headers=self.headers)
+        self.client.get("/api/contact/all/", headers=self.headers)
+
+        lines = self.scrape()
+        endpoint = 'endpoint="/api/contact/all/"'
+
+        def lookups(name, result, count):
+            return (
+                "smartcontact_cache_lookups_total"
+                f'{{{endpoint},cache="{name}",result="{result}"}} {count}'
+            )
+
+        self.assertIn(
+            "smartcontact_request_duration_seconds_count"
+            f'{{{endpoint},method="GET",status="200"}} 2',
+            lines,
+        )
+        self.assertIn(f"smartcontact_request_db_queries_count{{{endpoint}}} 2", lines)
+        self.assertIn(lookups("contacts", "miss", 1), lines)
+        self.assertIn(lookups("contacts", "hit", 1), lines)
+        # The user row is loaded once, then comes from the JWT user cache
+        self.assertIn(lookups("jwt_user", "hit", 1), lines)
+        # The cached page is not serialized again
+        for name, count in [("serialize", 1), ("jwt_decode", 2)]:
+            self.assertIn(
+                "smartcontact_span_duration_seconds_count"
+                f'{{{endpoint},span="{name}"}} {count}',
+                lines,
+            )
+        self.assertIn('smartcontact_jobs{status="queued"} 0', lines)
+        # Contact cache counters only grow, sizes and rates are gauges
+        self.assertIn("# TYPE smartcontact_contact_cache_l2_hits_total counter", lines)
+        self.assertIn("# TYPE smartcontact_contact_cache_l1_bytes gauge", lines)
+        typed = {line.split()[2] for line in lines if line.startswith("# TYPE")}
+        helped = {line.split()[2] for line in lines if line.startswith("# HELP")}
+        self.assertEqual(typed, helped)
+        # Scrapes are not recorded themselves
+        self.assertNotIn('endpoint="/metrics"', "\n".join(self.scrape()))
+
+    def test_password_hashing_is_timed(self):
+        self.client.post(
+            "/api/auth/manual-login/",
+            {"user_name": "owner", "password": "pw"},
+            content_type="application/json",
+        )
+
+        self.assertIn(
+            "smartcontact_span_duration_seconds_count"
+            '{endpoint="/api/auth/manual-login/",span="password_hash"} 1',
+            self.scrape(),
+        )
+
+    @override_settings(METRICS={"TOKEN": "secret"})
+    def test_token_protects_the_endpoint(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        self.scrape(headers={"Authorization": "Bearer secret"})
+
+    @override_settings(METRICS={"SLOW_REQUEST_SECONDS": 0})
+    def test_slow_requests_are_logged_with_their_sql(self):
+        with self.assertLogs("SmartContact.metrics", "WARNING") as logs:
+            self.client.get("/api/contact/all/", headers=self.headers)
+
+        self.assertIn("slow request GET /api/contact/all/ 200", logs.output[0])
+        self.assertIn('FROM "Contact_contact"', logs.output[0])
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class ContactStatsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        contact_cache.clear_local()
+        self.user = CustomUser.objects.create_user(user_name="owner", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def create(self, name, phone_number, tags):
+        response = self.client.post(
+            "/api/contact/create/",
+            {"name": name, "phone_number": phone_number, "tags": tags},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        return Contact.objects.get(owner_user=self.user, name=name)
+
+    def assertCountersMatchContacts(self):
+        # reconcile_stats() returns the counters as they were before the rebuild
+        self.assertEqual(reconcile_stats(self.user.id), get_stats(self.user.id))
+
+    def test_counters_follow_every_write(self):
+        alice = self.create("Alice", "+12025550100", "work-friends")
+        bob = self.create("Bob", "+12025550101", "work")
+        self.client.post(
+            "/api/contact/import/",
+            [
+                {"name": "Carol", "phone_number": "+12025550102", "tags": "family"},
+                {"name": "Dan", "phone_number": "+12025550103"},
+            ],
+            format="json",
+        )
+        self.assertEqual(
+            self.client.get("/api/contact/stats/").data,
+            {
+                "total": 4,
+                "tags": {"family": 1, "friends": 1, "none": 1, "work": 2},
+                "recent": {"last_1_days": 4, "last_7_days": 4, "last_30_days": 4},
+            },
+        )
+
+        self.client.put(
+            "/api/contact/edit/",
+            {
+                "contact_id": bob.id,
+                "new_name": "Bob",
+                "new_phone_number": "+12025550101",
+                "new_tags": "family-vip",
+            },
+            format="json",
+        )
+        self.client.post(
+            "/api/contact/merge/",
+            {"keep_id": alice.id, "merge_ids": [bob.id]},
+            format="json",
+        )
+        self.client.delete("/api/contact/bulk-delete/?tag=none")
+
+        self.assertCountersMatchContacts()
+        self.assertEqual(
+            self.client.get("/api/contact/stats/").data,
+            {
+                "total": 2,
+                "tags": {"family": 2, "friends": 1, "vip": 1, "work": 1},
+                "recent": {"last_1_days": 2, "last_7_days": 2, "last_30_days": 2},
+            },
+        )
+
+    def test_stats_are_cached_until_the_next_write(self):
+        self.create("Alice", "+12025550100", "work")
+        first = self.client.get("/api/contact/stats/")
+
+        with self.assertNumQueries(0):
+            second = self.client.get("/api/contact/stats/")
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(
+            self.client.get(
+                "/api/contact/stats/", HTTP_IF_NONE_MATCH=first["ETag"]
+            ).status_code,
+            304,
+        )
+
+        self.create("Bob", "+12025550101", "work")
+        self.assertEqual(self.client.get("/api/contact/stats/").data["total"], 2)
+
+    def test_recent_counts_are_by_creation_day(self):
+        old = self.create("Alice", "+12025550100", "work")
+        self.create("Bob", "+12025550101", "work")
+        Contact.objects.filter(id=old.id).update(
+            created_at=timezone.now() - timedelta(days=10)
+        )
+        reconcile_stats(self.user.id)
+
+        self.assertEqual(
+            get_stats(self.user.id)["recent"],
+            {"last_1_days": 1, "last_7_days": 1, "last_30_days": 2},
+        )
+
+    def test_reconcile_command_repairs_drifted_counters(self):
+        self.create("Alice", "+12025550100", "work")
+        # Bypasses the counters, like a raw SQL import would
+        Contact.objects.bulk_create(
+            [Contact(name="Bob", phone_number="+12025550101", owner_user=self.user)]
+        )
+        self.assertEqual(self.client.get("/api/contact/stats/").data["total"], 1)
+
+        out = io.StringIO()
+        call_command("reconcile_contact_stats", user_ids=[self.user.id], stdout=out)
+
+        self.assertIn(f"user {self.user.id}: total 1 -> 2", out.getvalue())
+        self.assertEqual(self.client.get("/api/contact/stats/").data["total"], 2)
+
+
+class TagExpressionTests(SimpleTestCase):
+
+    def parse(self, expression):
+        return canonical(parse_tag_expression(expression))
+
+    def test_precedence(self):
+        # NOT binds tightest, then AND, then OR
+        self.assertEqual(self.parse("a OR b AND NOT c"), "or(a,and(b,not(c)))")
+        self.assertEqual(self.parse("a b OR c"), "or(and(a,b),c)")
+
+    def test_parentheses_and_quotes(self):
+        self.assertEqual(
+            self.parse('(Work OR "Best Friend") and not archived'),
+            "and(or(work,best friend),not(archived))",
+        )
+        self.assertEqual(self.parse("((a))"), "a")
+
+    def test_not(self):
+        self.assertEqual(self.parse("NOT NOT a"), "not(not(a))")
+        self.assertEqual(self.parse("NOT (a OR b)"), "not(or(a,b))")
+
+    def test_malformed_input(self):
+        for expression in ["", "a AND", "(a OR b", "a)", "NOT", "OR a", '""', "()"]:
+            with self.subTest(expression=expression):
+                with self.assertRaises(ValueError):
+                    parse_tag_expression(expression)
+
+    def test_limits(self):
+        self.assertEqual(self.parse("(" * 20 + "a" + ")" * 20), "a")
+        for expression in [
+            "(" * 21 + "a" + ")" * 21,
+            "(" * 300 + "a" + ")" * 300,
+            "NOT " * 1200 + "a",
+            "a " * 201,
+            " OR ".join(f"t{number}" for number in range(21)),
+        ]:
+            with self.subTest(expression=expression[:20]):
+                with self.assertRaises(ValueError):
+                    parse_tag_expression(expression)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class TagExpressionEndpointTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(user_name="owner", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_deep_expressions_are_rejected(self):
+        deep = "(" * 300 + "a" + ")" * 300
+        negated = "NOT%20" * 1200 + "a"
+        for response in [
+            self.client.get("/api/contact/by-tag/", {"q": deep}),
+            self.client.get("/api/contact/export/", {"q": deep}),
+            self.client.delete(f"/api/contact/bulk-delete/?q={negated}"),
+        ]:
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("error", response.json())
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class ContactTagTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(user_name="owner", password="pw")
+        self.contact = Contact.objects.create(
+            name="Alice", phone_number="+12025550100", owner_user=self.user, tags="x"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def tags_of(self, contact):
+        return sorted(contact.tag_set.values_list("name", flat=True))
+
+    def counts(self):
+        return dict(
+            Tag.objects.filter(owner_user=self.user).values_list(
+                "name", "contact_count"
+            )
+        )
+
+    def test_parse_tags(self):
+        self.assertEqual(parse_tags(" Work - vip--work- "), ["work", "vip"])
+        self.assertEqual(parse_tags(None), [])
+        self.assertEqual(parse_tags("a" * 100), ["a" * 100])
+        with self.assertRaises(ValueError):
+            parse_tags("work-" + "a" * 101)
+
+    def test_sync_contact_tags(self):
+        bob = Contact.objects.create(
+            name="Bob", phone_number="+12025550101", owner_user=self.user, tags="x"
+        )
+
+        sync_contact_tags(
+            self.user.id, {self.contact.id: ["work", "vip"], bob.id: ["work"]}
+        )
+        self.assertEqual(self.tags_of(self.contact), ["vip", "work"])
+        self.assertEqual(self.tags_of(bob), ["work"])
+        self.assertEqual(self.counts(), {"x": 0, "work": 2, "vip": 1})
+
+        # replace=False only adds links
+        sync_contact_tags(self.user.id, {bob.id: ["home"]}, replace=False)
+        self.assertEqual(self.tags_of(bob), ["home", "work"])
+        self.assertEqual(self.counts()["home"], 1)
+
+    def test_tags_are_per_owner(self):
+        other = CustomUser.objects.create_user(user_name="other", password="pw")
+        Contact.objects.create(
+            name="Bob", phone_number="+12025550101", owner_user=other, tags="x"
+        )
+
+        self.assertEqual(Tag.objects.filter(name="x").count(), 2)
+        self.assertEqual(self.counts(), {"x": 1})
+
+    def test_long_tag_names_are_rejected(self):
+        long_tags = "work-" + "a" * 101
+
+        create = self.client.post(
+            "/api/contact/create/",
+            {"name": "Bob", "phone_number": "+12025550101", "tags": long_tags},
+            format="json",
+        )
+        edit = self.client.put(
+            "/api/contact/edit/",
+            {
+                "contact_id": self.contact.id,
+                "new_name": "Alice",
+                "new_phone_number": "+12025550100",
+                "new_tags": long_tags,
+            },
+            format="json",
+        )
+        bulk_edit = self.client.put(
+            "/api/contact/bulk-edit/",
+            {"contact_ids": [self.contact.id], "new_tags": long_tags},
+            format="json",
+        )
+        imported = self.client.post(
+            "/api/contact/import/",
+            [{"name": "Bob", "phone_number": "+12025550101", "tags": long_tags}],
+            format="json",
+        )
+
+        self.assertEqual(create.status_code, 400)
+        self.assertEqual(edit.status_code, 400)
+        self.assertEqual(bulk_edit.status_code, 400)
+        self.assertEqual(imported.data["failed"], 1)
+        self.assertIn("at most 100 characters", imported.data["errors"][0]["error"])
+        self.assertEqual(Contact.objects.count(), 1)
+        self.assertEqual(self.tags_of(self.contact), ["x"])
+
+
+class BackfillContactTagsMigrationTests(TransactionTestCase):
+    # 0003 links the contacts that existed before the Tag tables
+    before = [("Contact", "0002_tag_contacttag")]
+    after = [("Contact", "0003_backfill_contact_tags")]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        self.addCleanup(self.migrate_to_latest)
+
+    def migrate_to_latest(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_backfill(self):
+        executor = MigrationExecutor(connection)
+        apps = executor.loader.project_state(self.before).apps
+        User = apps.get_model("AuthenticationSystem", "CustomUser")
+        Contact = apps.get_model("Contact", "Contact")
+        owner = User.objects.create(user_name="owner", password="-")
+        other = User.objects.create(user_name="other", password="-")
+        alice = Contact.objects.create(
+            name="Alice",
+            phone_number="+12025550100",
+            owner_user=owner,
+            tags="Work- vip -work",
+        )
+        bob = Contact.objects.create(
+            name="Bob", phone_number="+12025550101", owner_user=other, tags="work"
+        )
+
+        executor.loader.build_graph()
+        executor.migrate(self.after)
+
+        apps = executor.loader.project_state(self.after).apps
+        ContactTag = apps.get_model("Contact", "ContactTag")
+        links = sorted(
+            ContactTag.objects.values_list(
+                "contact_id", "tag__owner_user_id", "tag__name"
+            )
+        )
+        self.assertEqual(
+            links,
+            [
+                (alice.id, owner.id, "vip"),
+                (alice.id, owner.id, "work"),
+                (bob.id, other.id, "work"),
+            ],
+        )
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class ContactSearchTests(TestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(user_name="owner", password="pw")
+        self.other = CustomUser.objects.create_user(user_name="other", password="pw")
+        for name, phone_number in [
+            ("Alice Smith", "+12025550100"),
+            ("Malice Jones", "+12025550101"),
+            ("Bob Alison", "+13125550102"),
+            ("Al Green", "+14155550103"),
+        ]:
+            Contact.objects.create(
+                name=name, phone_number=phone_number, owner_user=self.user, tags="x"
+            )
+        Contact.objects.create(
+            name="Alice Foreign", phone_number="+12025550109", owner_user=self.other
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def search(self, query, **params):
+        response = self.client.get("/api/contact/search/", {"q": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [contact["name"] for contact in response.data["contacts"]]
+
+    def test_parse_terms(self):
+        self.assertEqual(parse_terms("(202) 555-0100"), ["2025550100"])
+        self.assertEqual(parse_terms("Jo 202 jo"), ["jo", "202"])
+        with self.assertRaises(ValueError):
+            parse_terms("a b c d e f g h i")
+
+    def test_fts_search_is_owner_scoped_and_ranked(self):
+        self.assertTrue(use_fts(parse_terms("ali")))
+
+        # Name prefix first, then other name matches, then by name
+        self.assertEqual(
+            self.search("ali"), ["Alice Smith", "Bob Alison", "Malice Jones"]
+        )
+        self.assertEqual(self.search("alice smith"), ["Alice Smith"])
+        self.assertEqual(self.search("(312) 555"), ["Bob Alison"])
+
+    def test_fts_and_icontains_agree(self):
+        for query in ["ali", "lic", "2025550", "smith ali"]:
+            terms = parse_terms(query)
+            with self.subTest(query=query):
+                self.assertEqual(
+                    [c.id for c in search_with_fts(self.user.id, terms, 10, 0)],
+                    [c.id for c in search_with_orm(self.user.id, terms, 10, 0)],
+                )
+
+    def test_short_terms_use_icontains(self):
+        self.assertFalse(use_fts(parse_terms("al")))
+
+        self.assertEqual(
+            self.search("al"),
+            ["Al Green", "Alice Smith", "Bob Alison", "Malice Jones"],
+        )
+        self.assertEqual(self.search("al gre"), ["Al Green"])
+
+    def test_index_follows_writes(self):
+        contact = Contact.objects.get(name="Alice Smith")
+        self.client.put(
+            "/api/contact/edit/",
+            {
+                "contact_id": contact.id,
+                "new_name": "Zelda Smith",
+                "new_phone_number": "+12025550100",
+            },
+            format="json",
+        )
+        self.assertEqual(self.search("zelda"), ["Zelda Smith"])
+        self.assertNotIn("Alice Smith", self.search("alice"))
+
+        self.client.delete(f"/api/contact/delete/?contact_id={contact.id}")
+        self.assertEqual(self.search("zelda"), [])
+
+    def test_paging_and_errors(self):
+        response = self.client.get("/api/contact/search/", {"q": "ali", "limit": 2})
+        self.assertEqual(response.data["next_offset"], 2)
+        self.assertEqual(self.search("ali", offset=2), ["Malice Jones"])
+
+        self.assertEqual(self.client.get("/api/contact/search/").status_code, 400)
+        response = self.client.get("/api/contact/search/", {"q": "ali", "limit": 0})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class ReplicaRoutingTests(TestCase):
+    # Only the routing decisions: "replica_0" is configured but never queried
+
+    def setUp(self):
+        cache.clear()
+        databases = {**settings.DATABASES, "replica_0": settings.DATABASES["default"]}
+        replicas = override_settings(DATABASES=databases)
+        with warnings.catch_warnings():
+            # Overriding DATABASES warns, the connections are left alone
+            warnings.simplefilter("ignore")
+            replicas.enable()
+        self.addCleanup(self.disable, replicas)
+        self.user = CustomUser.objects.create_user(user_name="owner", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def disable(self, replicas):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            replicas.disable()
+
+    def read_alias(self, before_first_read=None):
+        # The alias a @replica_reads view of the user reads from
+        @replica_reads
+        def view(request):
+            if before_first_read:
+                before_first_read()
+            return router.db_for_read(Contact)
+
+        return view(type("Request", (), {"user": self.user})())
+
+    def test_reads_of_replica_views_go_to_a_replica(self):
+        self.assertEqual(self.read_alias(), "replica_0")
+        self.assertEqual(router.db_for_read(Contact), "default")
+        self.assertEqual(router.db_for_write(Contact), "default")
+
+    def test_pinned_users_read_from_the_primary(self):
+        pin_to_primary(self.user.id)
+
+        self.assertEqual(self.read_alias(), "default")
+
+    def test_pin_is_checked_at_the_first_read(self):
+        # A write landing between the start of the request and its first query
+        self.assertEqual(
+            self.read_alias(lambda: pin_to_primary(self.user.id)), "default"
+        )
+
+    def test_writes_pin_before_invalidating(self):
+        version_key = contact_cache.version_key(self.user.id)
+        cache.set(version_key, 1)
+        seen = []
+        original = cache.incr
+
+        def incr(key, *args, **kwargs):
+            if key == version_key:
+                seen.append(cache.get(pin_key(self.user.id)))
+            return original(key, *args, **kwargs)
+
+        cache.incr = incr
+        self.addCleanup(delattr, cache, "incr")
+
+        response = self.client.post(
+            "/api/contact/create/",
+            {"name": "Alice", "phone_number": "+12025550100", "tags": "work"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(seen, [True])
+        self.assertEqual(self.read_alias(), "default")
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class BulkRequestTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(user_name="owner", password="pw")
+        self.other = CustomUser.objects.create_user(user_name="other", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.work = self.create(self.user, "John", "+12025550100", "work")
+        self.vip = self.create(self.user, "Jane", "+12025550101", "work-vip")
+        self.family = self.create(self.user, "Mum", "+12025550102", "family")
+        self.foreign = self.create(self.other, "Foreign", "+12025550199", "work")
+
+    def create(self, owner, name, phone_number, tags):
+        return Contact.objects.create(
+            name=name, phone_number=phone_number, owner_user=owner, tags=tags
+        )
+
+    def remaining(self):
+        return set(Contact.objects.values_list("id", flat=True))
+
+    def tags(self, contact):
+        contact.refresh_from_db()
+        return contact.tags, sorted(contact.tag_set.values_list("name", flat=True))
+
+    def test_bodies_that_are_not_objects_are_rejected(self):
+        for body in [[1, 2], "contact_ids", 3]:
+            for response in [
+                self.client.delete("/api/contact/bulk-delete/", body, format="json"),
+                self.client.put("/api/contact/bulk-edit/", body, format="json"),
+            ]:
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {"error": "expected a JSON object"})
+        self.assertEqual(Contact.objects.count(), 4)
+
+    def test_delete_by_ids_skips_other_users_contacts(self):
+        response = self.client.delete(
+            "/api/contact/bulk-delete/",
+            {"contact_ids": [self.work.id, self.foreign.id]},
+            format="json",
+        )
+
+        self.assertEqual(response.data, {"deleted": 1})
+        self.assertEqual(
+            self.remaining(), {self.vip.id, self.family.id, self.foreign.id}
+        )
+        self.assertEqual(get_stats(self.user.id)["total"], 2)
+        # The ids may come in the query string too
+        response = self.client.delete(
+            f"/api/contact/bulk-delete/?contact_ids={self.vip.id},{self.family.id}"
+        )
+        self.assertEqual(response.data, {"deleted": 2})
+
+    def test_delete_by_tag(self):
+        response = self.client.delete("/api/contact/bulk-delete/?tag=Work")
+
+        self.assertEqual(response.data, {"deleted": 2})
+        self.assertEqual(self.remaining(), {self.family.id, self.foreign.id})
+
+    def test_delete_by_expression(self):
+        response = self.client.delete(
+            "/api/contact/bulk-delete/", {"q": "work AND NOT vip"}, format="json"
+        )
+
+        self.assertEqual(response.data, {"deleted": 1})
+        self.assertEqual(
+            self.remaining(), {self.vip.id, self.family.id, self.foreign.id}
+        )
+
+    def test_edit_by_ids_skips_other_users_contacts(self):
+        response = self.client.put(
+            "/api/contact/bulk-edit/",
+            {"contact_ids": [self.work.id, self.foreign.id], "new_tags": "Archived"},
+            format="json",
+        )
+
+        self.assertEqual(response.data["updated"], 1)
+        self.assertEqual(self.tags(self.work), ("Archived", ["archived"]))
+        self.assertEqual(self.tags(self.foreign), ("work", ["work"]))
+
+    def test_edit_by_tag_and_by_expression(self):
+        response = self.client.put(
+            "/api/contact/bulk-edit/",
+            {"tag": "vip", "new_tags": "vip-gold"},
+            format="json",
+        )
+        self.assertEqual(response.data["updated"], 1)
+        self.assertEqual(self.tags(self.vip), ("vip-gold", ["gold", "vip"]))
+
+        response = self.client.put(
+            "/api/contact/bulk-edit/",
+            {"q": "work OR family", "new_tags": "home"},
+            format="json",
+        )
+        self.assertEqual(response.data["updated"], 2)
+        self.assertEqual(self.tags(self.work), ("home", ["home"]))
+        self.assertEqual(self.tags(self.family), ("home", ["home"]))
+        self.assertEqual(self.tags(self.foreign), ("work", ["work"]))
+
+    def test_exactly_one_target(self):
+        for body in [
+            {"new_tags": "x"},
+            {"new_tags": "x", "tag": "work", "q": "vip"},
+            {"new_tags": "x", "contact_ids": ["a"]},
+            {"tag": "work"},
+        ]:
+            response = self.client.put("/api/contact/bulk-edit/", body, format="json")
+            self.assertEqual(response.status_code, 400, body)
+        response = self.client.delete("/api/contact/bulk-delete/")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Contact.objects.count(), 4)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class ContactPaginationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(user_name="owner", password="pw")
+        self.other = CustomUser.objects.create_user(user_name="other", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        for number in range(7):
+            Contact.objects.create(
+                name=f"Contact {number}",
+                phone_number=f"+1202555010{number}",
+                owner_user=self.user,
+            )
+        Contact.objects.create(
+            name="Foreign", phone_number="+12025550199", owner_user=self.other
+        )
+        # Ties on created_at are broken by id
+        now = timezone.now()
+        ids = list(Contact.objects.order_by("id").values_list("id", flat=True))
+        Contact.objects.filter(id__in=ids[:4]).update(created_at=now)
+        Contact.objects.filter(id__in=ids[4:]).update(
+            created_at=now - timedelta(days=1)
+        )
+
+    def pages(self, limit, **params):
+        cursor, pages = "", []
+        while True:
+            response = self.client.get(
+                "/api/contact/all/", {"limit": limit, "cursor": cursor, **params}
+            )
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data["contacts"])
+            cursor = response.data["next_cursor"]
+            if cursor is None:
+                return pages
+
+    def test_cursor_round_trip(self):
+        contact = Contact.objects.filter(owner_user=self.user).first()
+
+        self.assertEqual(
+            decode_cursor(encode_cursor(contact)), (contact.created_at, contact.id)
+        )
+        self.assertIsNone(decode_cursor(""))
+
+    def test_pages_walk_created_at_then_id_without_gaps(self):
+        expected = list(
+            Contact.objects.filter(owner_user=self.user)
+            .order_by("created_at", "id")
+            .values_list("id", flat=True)
+        )
+
+        pages = self.pages(2)
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        walked = [contact["id"] for page in pages for contact in page]
+        self.assertEqual(walked, expected)
+
+    def test_last_page_has_no_cursor(self):
+        pages = self.pages(7)
+
+        self.assertEqual([len(page) for page in pages], [7])
+
+    def test_fields_projection(self):
+        pages = self.pages(10, fields="name,phone_number")
+
+        self.assertEqual(set(pages[0][0]), {"name", "phone_number"})
+        self.assertTrue(pages[0][0]["phone_number"].startswith("+1202555"))
+        response = self.client.get("/api/contact/all/", {"fields": "password"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_cursors_and_limits(self):
+        def encoded(value):
+            return base64.urlsafe_b64encode(value.encode()).decode()
+
+        for params in [
+            {"cursor": "not a cursor"},
+            {"cursor": encoded("[1]")},
+            {"cursor": encoded("5")},
+            {"cursor": encoded('["yesterday", 1]')},
+            {"cursor": encoded("[null, 1]")},
+            {"limit": 0},
+            {"limit": 1001},
+            {"limit": "ten"},
+        ]:
+            response = self.client.get("/api/contact/all/", params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn("error", response.data)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class ContactExportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(user_name="owner", password="pw")
+        self.other = CustomUser.objects.create_user(user_name="other", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.work = self.create("Smith, John", "+12025550100", "work")
+        self.vip = self.create("Jane", "+12025550101", "work-vip")
+        self.family = self.create("Mum", "+12025550102", "family")
+        Contact.objects.filter(id=self.family.id).update(
+            created_at=timezone.now() - timedelta(days=30)
+        )
+        Contact.objects.create(
+            name="Foreign",
+            phone_number="+12025550199",
+            owner_user=self.other,
+            tags="work",
+        )
+
+    def create(self, name, phone_number, tags):
+        contact = Contact.objects.create(
+            name=name, phone_number=phone_number, owner_user=self.user, tags=tags
+        )
+        sync_contact_tags(self.user.id, {contact.id: parse_tags(tags)})
+        return contact
+
+    def export(self, **params):
+        response = self.client.get("/api/contact/export/", params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def ndjson_ids(self, **params):
+        lines = self.export(**params).splitlines()
+        return [json.loads(line)["id"] for line in lines]
+
+    def test_ndjson_is_the_default(self):
+        response = self.client.get("/api/contact/export/")
+
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(
+            response["Content-Disposition"], 'attachment; filename="contacts.ndjson"'
+        )
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).decode().splitlines()
+        ]
+        self.assertEqual(
+            [row["id"] for row in rows], [self.work.id, self.vip.id, self.family.id]
+        )
+        self.assertEqual(
+            set(rows[0]), {"id", "name", "phone_number", "tags", "created_at"}
+        )
+        self.assertEqual(rows[0]["phone_number"], "+12025550100")
+
+    def test_csv(self):
+        response = self.client.get("/api/contact/export/", {"output": "csv"})
+        self.assertEqual(response["Content-Type"], "text/csv")
+
+        text = b"".join(response.streaming_content).decode()
+        rows = list(csv.DictReader(io.StringIO(text)))
+        self.assertEqual(
+            list(rows[0]), ["id", "name", "phone_number", "tags", "created_at"]
+        )
+        self.assertEqual(len(rows), 3)
+        # Quoted, so names with commas survive
+        self.assertEqual(rows[0]["name"], "Smith, John")
+        self.assertEqual(rows[0]["tags"], "work")
+
+    def test_filters(self):
+        # "work-vip" is tagged work and vip
+        self.assertEqual(self.ndjson_ids(tag="work"), [self.work.id, self.vip.id])
+        self.assertEqual(self.ndjson_ids(q="work AND NOT vip"), [self.work.id])
+        self.assertEqual(
+            self.ndjson_ids(q="vip OR family"), [self.vip.id, self.family.id]
+        )
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        self.assertEqual(
+            self.ndjson_ids(created_after=since), [self.work.id, self.vip.id]
+        )
+        self.assertEqual(self.ndjson_ids(created_before=since), [self.family.id])
+        lines = self.export(output="csv", q="family").splitlines()
+        self.assertEqual(len(lines), 2)
+
+    def test_bad_parameters(self):
+        for params in [
+            {"output": "xml"},
+            {"q": "work AND"},
+            {"created_after": "yesterday"},
+        ]:
+            response = self.client.get("/api/contact/export/", params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn("error", response.data)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class ContactImportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        contact_cache.clear_local()
+        self.user = CustomUser.objects.create_user(user_name="owner", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def upload(self, name, content, input_type=None):
+        path = "/api/contact/import/"
+        if input_type:
+            path += f"?input={input_type}"
+        return self.client.post(
+            path, {"file": SimpleUploadedFile(name, content)}, format="multipart"
+        )
+
+    def test_rows_are_validated_one_by_one(self):
+        rows = [
+            {"name": "Alice", "phone_number": "+12025550100", "tags": "work-vip"},
+            {"name": "No phone"},
+            {"name": "Bad phone", "phone_number": "12"},
+            "not an object",
+            {"name": "x" * 101, "phone_number": "+12025550101"},
+            {"name": "Long tag", "phone_number": "+12025550102", "tags": "t" * 101},
+        ]
+
+        response = self.client.post("/api/contact/import/", rows, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data["created"], response.data["failed"]), (1, 5))
+        self.assertEqual(
+            response.data["errors"],
+            [
+                {"row": 2, "error": "(name, phone_number) are required"},
+                {"row": 3, "error": "phone_number is not valid"},
+                {"row": 4, "error": "row is not an object"},
+                {"row": 5, "error": "name is too long"},
+                {"row": 6, "error": "tag names are at most 100 characters"},
+            ],
+        )
+        alice = Contact.objects.get(owner_user=self.user)
+        self.assertEqual(alice.phone_e164, "+12025550100")
+        self.assertEqual(
+            sorted(alice.tag_set.values_list("name", flat=True)), ["vip", "work"]
+        )
+
+    def test_nothing_imported_is_a_400(self):
+        response = self.client.post(
+            "/api/contact/import/", [{"name": "No phone"}], format="json"
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["failed"], 1)
+        response = self.client.post("/api/contact/import/", {"a": 1}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_csv_upload(self):
+        response = self.upload(
+            "contacts.csv",
+            b"\xef\xbb\xbfname,phone_number,tags\n"
+            b'"Smith, John",+12025550100,work\n'
+            b"Jane,+12025550101,\n",
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(
+            dict(Contact.objects.values_list("name", "tags")),
+            {"Smith, John": "work", "Jane": "none"},
+        )
+
+    def test_ndjson_upload(self):
+        response = self.upload(
+            "contacts.txt",
+            b'{"name": "Alice", "phone_number": "+12025550100"}\n'
+            b"\n"
+            b"not json\n",
+            input_type="ndjson",
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual(
+            response.data["errors"], [{"row": 2, "error": "row is not an object"}]
+        )
+        self.assertEqual(self.upload("contacts.xml", b"<a/>").status_code, 400)
+
+    def test_rows_are_inserted_in_chunks(self):
+        rows = [
+            {"name": f"Contact {number}", "phone_number": f"+1202555{number:04d}"}
+            for number in range(IMPORT_CHUNK_SIZE * 2 + 1)
+        ]
+        done = []
+
+        result = import_contacts(
+            self.user, iter(rows), progress=lambda *args: done.append(args)
+        )
+
+        self.assertEqual(result["created"], len(rows))
+        # After each full chunk, then once at the end
+        self.assertEqual(
+            done,
+            [
+                (IMPORT_CHUNK_SIZE,),
+                (IMPORT_CHUNK_SIZE * 2,),
+                (len(rows), len(rows)),
+            ],
+        )
+        self.assertEqual(get_stats(self.user.id)["total"], len(rows))
+
+    def test_an_import_invalidates_the_cache_once(self):
+        version = contact_cache.get_version(self.user.id)
+        before = contact_cache.stats()["invalidations"]
+        rows = [
+            {"name": f"Contact {number}", "phone_number": f"+120255501{number:02d}"}
+            for number in range(3)
+        ]
+
+        self.client.post("/api/contact/import/", rows, format="json")
+
+        self.assertEqual(contact_cache.stats()["invalidations"] - before, 1)
+        self.assertEqual(contact_cache.get_version(self.user.id), version + 1)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    CONTACT_CACHE={"TIMEOUT": 300, "TIMEOUTS": {"page": 60}, "L1": None},
+)
+class VersionedCacheTests(TestCase):
+    # The shared tier alone (L1 off), see caching.py
+
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(user_name="owner", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_a_write_bumps_the_generation(self):
+        version = contact_cache.get_version(self.user.id)
+        key = contact_cache.make_key(self.user.id, "page", "", 100)
+        contact_cache.set(key, "page", {"contacts": []})
+        self.assertEqual(contact_cache.get(key, "page"), {"contacts": []})
+
+        self.client.post(
+            "/api/contact/create/",
+            {"name": "Alice", "phone_number": "+12025550100", "tags": "work"},
+            format="json",
+        )
+
+        self.assertEqual(contact_cache.get_version(self.user.id), version + 1)
+        new_key = contact_cache.make_key(self.user.id, "page", "", 100)
+        self.assertNotEqual(new_key, key)
+        self.assertNotEqual(contact_cache.etag(new_key), contact_cache.etag(key))
+        self.assertIsNone(contact_cache.get(new_key, "page"))
+
+    def names(self):
+        response = self.client.get("/api/contact/all/")
+        return [contact["name"] for contact in response.data["contacts"]]
+
+    def test_reads_miss_after_a_write(self):
+        self.assertEqual(self.names(), [])
+        before = contact_cache.stats()
+
+        self.assertEqual(self.names(), [])
+        Contact.objects.create(
+            name="Alice", phone_number="+12025550100", owner_user=self.user
+        )
+        contact_cache.invalidate(self.user.id)
+        self.assertEqual(self.names(), ["Alice"])
+
+        after = contact_cache.stats()
+        self.assertEqual(after["l2_hits"] - before["l2_hits"], 1)
+        self.assertEqual(after["l2_misses"] - before["l2_misses"], 1)
+
+    def test_each_kind_has_its_timeout(self):
+        timeouts = {}
+        original = cache.set
+
+        def record(key, value, timeout=None, **kwargs):
+            timeouts[key] = timeout
+            return original(key, value, timeout=timeout, **kwargs)
+
+        cache.set = record
+        self.addCleanup(delattr, cache, "set")
+
+        for kind in ["page", "tag"]:
+            contact_cache.set(contact_cache.make_key(self.user.id, kind), kind, [])
+
+        version = contact_cache.get_version(self.user.id)
+        self.assertEqual(
+            timeouts,
+            {
+                f"user_{self.user.id}_contacts_v{version}_page_": 60,
+                f"user_{self.user.id}_contacts_v{version}_tag_": 300,
+            },
+        )
+
+    def test_a_lost_counter_starts_from_the_clock(self):
+        started = int(time.time() * 1000)
+        # No counter: an invalidation does not create one
+        contact_cache.invalidate(self.user.id)
+        self.assertIsNone(cache.get(contact_cache.version_key(self.user.id)))
+
+        version = contact_cache.get_version(self.user.id)
+        self.assertGreaterEqual(version, started)
+
+        contact_cache.invalidate(self.user.id)
+        # Evicted: the next generation is not 1 (whose keys may still live)
+        cache.delete(contact_cache.version_key(self.user.id))
+        self.assertGreaterEqual(contact_cache.get_version(self.user.id), started)
@@ -8,18 +8,83 @@ urlpatterns = [
     # Description: Creates a contact owned by the currently authenticated user
     path("create/", views.create_contact, name="create_contact"),
 
-    # Retrieve all contacts of the authenticated user
+    # Import many contacts at once (requires authentication)
+    # Method: POST
+    # Body: JSON list [{ "name": str, "phone_number": str, "tags": str (optional) }, ...]
+    #       or multipart with "file" = .csv (header: name,phone_number,tags) / .ndjson
+    # Query param: ?input=csv|ndjson (optional, otherwise taken from the file extension)
+    # Description: Validates and inserts rows in chunks inside one transaction and
+    # returns { "created": int, "failed": int, "errors": [{ "row": n, "error": str }] }
+    # Large imports are queued: 202 with a job to poll (see Jobs/urls.py)
+    path("import/", views.bulk_import_contacts, name="bulk_import_contacts"),
+
+    # all/ and by-tag/ send an ETag; If-None-Match with it returns 304 without a body
+
+    # Retrieve all contacts of the authenticated user, one page at a time
     # Method: GET
-    # Description: Returns a list of all contacts owned by the current user
+    # Query params: ?limit=<1..1000, default 100>&cursor=<next_cursor>&fields=<id,name,...>
+    # Description: Returns a page of contacts owned by the current user ordered by
+    # (created_at, id), plus "next_cursor" to fetch the following page (null on the last one)
     path("all/", views.view_all_contacts, name="view_all_contacts"),
 
-    # Retrieve contacts filtered by a specific tag
+    # Retrieve contacts filtered by a specific tag or a tag expression
     # Method: GET
     # Query param: ?tag=<tag_name>
     # Description: Returns only the contacts that contain the given tag
-    # Tags in DB are stored as a single string separated by "-"
+    # Query param: ?q=<expression>  e.g. "work AND vip NOT archived", "(home OR family) NOT old"
+    # Description: Evaluates AND / OR / NOT and parentheses in a single query and
+    # returns { "contacts": [...], "facets": { "<tag>": <count in result>, ... } }
+    # Tags are sent as a single string separated by "-" and stored normalized
+    # (lowercase) in the Tag / ContactTag tables, so this is one indexed join
     path("by-tag/", views.view_contacts_deppents_on_tag, name="view_contacts_by_tag"),
 
+    # Retrieve one contact of the authenticated user
+    # Method: GET
+    # Query param: ?contact_id=<id>
+    # Description: Returns the contact with an ETag ("c<id>-v<version>"); send it back
+    # in If-None-Match to get 304 Not Modified when nothing changed
+    path("detail/", views.view_contact, name="view_contact"),
+
+    # Search contacts by name or phone number
+    # Method: GET
+    # Query params: ?q=<text or digits>&limit=<1..100, default 20>&offset=<n>
+    # Description: Case-insensitive prefix/substring match on name and E.164 phone
+    # number (partial digits work, formatting is ignored), ranked with name prefix
+    # matches first. Returns { "contacts": [...], "next_offset": int | null }
+    path("search/", views.search_contacts_view, name="search_contacts"),
+
+    # Delta sync of the current user's contacts
+    # Method: GET
+    # Query params: ?token=<token from the previous response> (omit for a full sync) &limit=<1..2000>
+    # Description: Without a token pages through all contacts; afterwards returns only
+    # contacts created/updated since the token plus the ids of deleted ones.
+    # Returns { "contacts": [...], "deleted": [ids], "token": str, "has_more": bool };
+    # keep calling while has_more, store the last token. 410 Gone: token too old, resync
+    path("sync/", views.sync_contacts_view, name="sync_contacts"),
+
+    # Report of likely duplicate contacts
+    # Method: GET
+    # Description: Groups the current user's contacts that share a phone number or
+    # have near-identical names. Returns { "groups": [{ "contacts": [...],
+    # "reasons": ["phone", "name"] }], "total": int, "skipped_blocks": int } with an
+    # ETag; the report is cached until the next write. For a large address book it
+    # is built by a background job first: 202 with the job to poll
+    path("duplicates/", views.duplicates_view, name="duplicate_contacts"),
+
+    # Merge duplicate contacts into one
+    # Method: POST
+    # Body: { "keep_id": int, "merge_ids": [int, ...] }
+    # Description: In one transaction keep_id gets the union of all tags and the
+    # merge_ids contacts are deleted. Returns { "msg": ..., "merged": int }
+    path("merge/", views.merge_contacts_view, name="merge_contacts"),
+
+    # Contact statistics of the current user
+    # Method: GET
+    # Description: Returns { "total": int, "tags": { name: count }, "recent":
+    # { "last_1_days": int, "last_7_days": int, "last_30_days": int } } with an ETag,
+    # read from counters kept up to date by every write (no scan of the contacts)
+    path("stats/", views.contact_stats_view, name="contact_stats"),
+
     # Delete a specific contact by ID
     # Method: DELETE
     # Query param: ?contact_id=<id>
@@ -28,7 +93,35 @@ urlpatterns = [
 
     # Edit a specific contact
     # Method: PUT
-    # Body: { "contact_id": int, "new_phone_number": str, "new_name": str, "new_tags": str (optional) }
-    # Description: Updates contact details if it belongs to the current user
+    # Body: { "contact_id": int, "new_phone_number": str, "new_name": str, "new_tags": str (optional),
+    #         "version": int (optional) }
+    # Headers: If-Match: <ETag from detail/> (optional, alternative to "version")
+    # Description: Updates contact details if it belongs to the current user. With a
+    # version / If-Match the update only applies if nobody changed the contact since,
+    # otherwise 409 Conflict
     path("edit/", views.edit_contact, name="edit_contact"),
+
+    # Delete many contacts at once
+    # Method: DELETE
+    # Body (or query params): exactly one of
+    #   { "contact_ids": [int, ...] } | { "tag": str } | { "q": "<tag expression>" }
+    # Description: One owner-scoped delete, returns { "deleted": int }
+    # (202 with a background job for large selections)
+    path("bulk-delete/", views.bulk_delete_contacts, name="bulk_delete_contacts"),
+
+    # Retag many contacts at once
+    # Method: PUT
+    # Body: { "new_tags": str } + exactly one of (contact_ids, tag, q) as in bulk-delete/
+    # Description: Owner-scoped UPDATE of the tags, returns { "msg": ..., "updated": int }
+    # (202 with a background job for large selections)
+    path("bulk-edit/", views.bulk_edit_contacts, name="bulk_edit_contacts"),
+
+    # Export all contacts of the authenticated user as a stream
+    # Method: GET
+    # Query params: ?output=ndjson|csv (default ndjson)
+    #               &tag=<tag> or &q=<tag expression> (optional)
+    #               &created_after=<ISO datetime>&created_before=<ISO datetime> (optional)
+    # Description: Streams rows straight from a DB cursor, memory use does not
+    # depend on the number of contacts
+    path("export/", views.export_contacts, name="export_contacts"),
 ]
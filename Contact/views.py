@@ -1,13 +1,70 @@
+import csv
+import json
+
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags, quote_etag
 
 from .serializers import ContactSerializer, ContactListSerializer
-from .models import Contact
+from .caching import contact_cache
+from .models import (
+    Contact,
+    Tag,
+    delete_contacts,
+    parse_tags,
+    record_changes,
+    sync_contact_tags,
+)
+from .phones import phone_columns
+from .tag_expressions import parse_tag_expression, canonical, tree_to_q
+from .pagination import parse_page_size, decode_cursor, paginate
+from .export import EXPORTERS, EXPORT_CONTENT_TYPES
+from .importer import FILE_READERS, json_rows, import_contacts
+from .bulk import bulk_queryset, bulk_retag, bulk_delete, bulk_targets
+from .search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT, search_contacts
+from .stats import get_stats
+from .sync import SyncTokenExpired, parse_sync_limit, sync_contacts
+from .dedup import (
+    duplicate_report,
+    find_duplicate_groups,
+    merge_contacts,
+    parse_merge,
+)
 from AuthenticationSystem.models import CustomUser
+from SmartContact.db_router import replica_reads
+from SmartContact.metrics import span
+from Jobs.queue import (
+    inline_max_items,
+    inline_max_upload_bytes,
+    run_in_background,
+    save_input,
+)
+from Jobs.views import enqueue_response
+
+
+def not_modified(request, etag):
+    # True when the client's If-None-Match already names this ETag (weak or strong)
+    if_none_match = request.headers.get("If-None-Match")
+    if not if_none_match:
+        return False
+    etags = [tag.removeprefix("W/") for tag in parse_etags(if_none_match)]
+    return "*" in etags or etag in etags
+
+
+def not_modified_response(etag):
+    # No body and no serialization
+    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+
+def contact_etag(contact_id, version):
+    return quote_etag(f"c{contact_id}-v{version}")
 
 
 @api_view(["POST"])
@@ -24,26 +81,23 @@ def create_contact(request):
             },
             status=status.HTTP_400_BAD_REQUEST,
         )
+    try:
+        parse_tags(contact_tags)
+    except ValueError as e:
+        return Response({"error": f"{e}"}, status=status.HTTP_400_BAD_REQUEST)
 
-    user_auth = JWTAuthentication().authenticate(request)
-    if not user_auth:
-        return Response(
-            {"error": "your JWT is not fine"},
-            status=status.HTTP_400_BAD_REQUEST,
-        )
-
-    user, _ = user_auth
+    # Already authenticated once by DRF (DEFAULT_AUTHENTICATION_CLASSES)
+    user = request.user
     contact_owner_user = user
 
     try:
         Contact.objects.create(
             name=contact_name,
             phone_number=contact_phone_number,
-            owner_user=contact_owner_user,
+            owner_user_id=contact_owner_user.id,
             tags=contact_tags,
         )
-        cache.delete(f"user_{user.id}_contacts")
-        cache.delete_pattern(f"user_{user.id}_contacts_tag_*")
+        contact_cache.invalidate(user.id)
         return Response(
             {"msg": "was successfuly"},
             status=status.HTTP_201_CREATED,
@@ -55,83 +109,340 @@ def create_contact(request):
         )
 
 
-@api_view(["GET"])
+@api_view(["POST"])
 @permission_classes([IsAuthenticated])
-def view_all_contacts(request):
-    user_auth = JWTAuthentication().authenticate(request)
-    if not user_auth:
+def bulk_import_contacts(request):
+    user = request.user
+
+    uploaded_file = request.FILES.get("file")
+    try:
+        if uploaded_file:
+            input_type = (
+                request.query_params.get("input")
+                or uploaded_file.name.rsplit(".", 1)[-1]
+            ).lower()
+            if input_type not in FILE_READERS:
+                return Response(
+                    {"error": f"input must be one of ({', '.join(FILE_READERS)})"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            if (
+                run_in_background(request)
+                or uploaded_file.size > inline_max_upload_bytes()
+            ):
+                return enqueue_response(
+                    request,
+                    "contacts.import",
+                    {
+                        "input": input_type,
+                        "input_file": save_input("contacts.import", uploaded_file),
+                    },
+                )
+            rows = FILE_READERS[input_type](uploaded_file)
+        else:
+            rows = json_rows(request.data)
+            if run_in_background(request) or len(rows) > inline_max_items():
+                return enqueue_response(
+                    request,
+                    "contacts.import",
+                    {
+                        "input": "json",
+                        "input_file": save_input(
+                            "contacts.import", json.dumps(rows).encode()
+                        ),
+                    },
+                )
+
+        result = import_contacts(user, iter(rows))
+    except (ValueError, csv.Error) as e:
         return Response(
-            {"error": "your JWT is not fine"},
+            {"error": f"{e}"},
             status=status.HTTP_400_BAD_REQUEST,
         )
-    user, _ = user_auth
 
-    cache_key = f"user_{user.id}_contacts"
-    cached_data = cache.get(cache_key)
-    if cached_data:
+    if not result["created"]:
         return Response(
-            {"msg": "was successful (from cache)", "contacts": cached_data},
-            status=status.HTTP_200_OK,
+            {"error": "no contact was imported", **result},
+            status=status.HTTP_400_BAD_REQUEST,
         )
 
+    # Once for the whole import, not once per row
+    contact_cache.invalidate(user.id)
+    return Response(
+        {"msg": "was successfuly", **result},
+        status=status.HTTP_201_CREATED,
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@replica_reads
+def view_all_contacts(request):
+    user = request.user
+
+    cursor = request.query_params.get("cursor", "")
     try:
-        user_contacts = user.contacts
+        limit = parse_page_size(request.query_params.get("limit"))
+        fields = ContactListSerializer.parse_fields(request.query_params.get("fields"))
+        decode_cursor(cursor)
     except ValueError as e:
         return Response(
             {"error": f"{e}"},
-            status=status.HTTP_404_NOT_FOUND,
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    cache_key = contact_cache.make_key(
+        user.id, "page", cursor, limit, ",".join(fields)
+    )
+    etag = contact_cache.etag(cache_key)
+    if not_modified(request, etag):
+        return not_modified_response(etag)
+
+    cached_data = contact_cache.get(cache_key, "page")
+    if cached_data is not None:
+        return Response(
+            {"msg": "was successful (from cache)", **cached_data},
+            status=status.HTTP_200_OK,
+            headers={"ETag": etag},
         )
 
-    serialized_data = ContactListSerializer(user_contacts).data
-    cache.set(cache_key, serialized_data, timeout=60 * 5)
+    # Only load the requested columns (+ the cursor columns)
+    user_contacts = Contact.objects.filter(owner_user_id=user.id).only(
+        *ContactListSerializer.model_fields(fields), "created_at"
+    )
+    page, next_cursor = paginate(user_contacts, cursor, limit)
+
+    with span("serialize"):
+        contacts = ContactListSerializer(page, many=True, fields=fields).data
+    serialized_data = {"contacts": contacts, "next_cursor": next_cursor}
+    contact_cache.set(cache_key, "page", serialized_data)
     return Response(
-        {"msg": "was successful", "contacts": serialized_data},
+        {"msg": "was successful", **serialized_data},
         status=status.HTTP_200_OK,
+        headers={"ETag": etag},
     )
 
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def view_contacts_deppents_on_tag(request):
-    user_auth = JWTAuthentication().authenticate(request)
-    if not user_auth:
+    expression = request.query_params.get("q", "").strip()
+    tag = request.query_params.get("tag", "").strip().lower()
+    if not expression and not tag:
         return Response(
-            {"error": "your JWT is not fine"}, status=status.HTTP_400_BAD_REQUEST
+            {"error": "tag or q parameter is required"},
+            status=status.HTTP_400_BAD_REQUEST,
         )
-    tag = request.query_params.get("tag", "").strip().lower()
-    if not tag:
+    user = request.user
+
+    if expression:
+        return view_contacts_by_tag_expression(request, user, expression)
+
+    cache_key = contact_cache.make_key(user.id, "tag", tag)
+    etag = contact_cache.etag(cache_key)
+    if not_modified(request, etag):
+        return not_modified_response(etag)
+
+    cached_data = contact_cache.get(cache_key, "tag")
+    if cached_data is not None:
+        return Response(cached_data, status=status.HTTP_200_OK, headers={"ETag": etag})
+
+    # One indexed join: Tag(owner_user, name) -> ContactTag(tag, contact)
+    final_contacts = Contact.objects.filter(
+        owner_user_id=user.id,
+        tag_set__owner_user_id=user.id,
+        tag_set__name=tag,
+    )
+
+    final_contacts = list(final_contacts)
+    with span("serialize"):
+        data = ContactSerializer(final_contacts, many=True).data
+    contact_cache.set(cache_key, "tag", data)
+    return Response(data, status=status.HTTP_200_OK, headers={"ETag": etag})
+
+
+def view_contacts_by_tag_expression(request, user, expression):
+    try:
+        tree = parse_tag_expression(expression)
+    except ValueError as e:
+        return Response({"error": f"{e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    cache_key = contact_cache.make_key(user.id, "tag_q", canonical(tree))
+    etag = contact_cache.etag(cache_key)
+    if not_modified(request, etag):
+        return not_modified_response(etag)
+
+    cached_data = contact_cache.get(cache_key, "tag_q")
+    if cached_data is not None:
+        return Response(cached_data, status=status.HTTP_200_OK, headers={"ETag": etag})
+
+    # Whole expression is evaluated by the database in a single query
+    final_contacts = Contact.objects.filter(
+        tree_to_q(tree, user), owner_user_id=user.id
+    )
+
+    # Per-tag counts over the same result set (one grouped query)
+    facets = dict(
+        Tag.objects.filter(
+            owner_user_id=user.id, contact_tags__contact__in=final_contacts
+        )
+        .annotate(count=Count("contact_tags"))
+        .values_list("name", "count")
+    )
+
+    final_contacts = list(final_contacts)
+    with span("serialize"):
+        data = {
+            "contacts": ContactSerializer(final_contacts, many=True).data,
+            "facets": facets,
+        }
+    contact_cache.set(cache_key, "tag_q", data)
+    return Response(data, status=status.HTTP_200_OK, headers={"ETag": etag})
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def search_contacts_view(request):
+    user = request.user
+
+    query = request.query_params.get("q", "")
+    try:
+        limit = int(request.query_params.get("limit", DEFAULT_SEARCH_LIMIT))
+        offset = int(request.query_params.get("offset", 0))
+    except ValueError:
+        return Response(
+            {"error": "(limit, offset) must be numbers"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    if not 1 <= limit <= MAX_SEARCH_LIMIT or offset < 0:
         return Response(
-            {"error": "tag parameter is required"}, status=status.HTTP_400_BAD_REQUEST
+            {"error": f"limit must be between 1 and {MAX_SEARCH_LIMIT}"},
+            status=status.HTTP_400_BAD_REQUEST,
         )
-    user, _ = user_auth
 
-    cache_key = f"user_{user.id}_contacts_tag_{tag}"
-    cached_data = cache.get(cache_key)
-    if cached_data:
-        return Response(cached_data, status=status.HTTP_200_OK)
+    try:
+        contacts, has_more = search_contacts(user.id, query, limit, offset)
+    except ValueError as e:
+        return Response({"error": f"{e}"}, status=status.HTTP_400_BAD_REQUEST)
 
-    user_contacts = user.contacts.all()
-    final_contacts = []
-    for contact in user_contacts:
-        tags_of_contact = str(contact.tags)
-        tags_list = [t.strip().lower() for t in tags_of_contact.split("-")]
-        if tag in tags_list:
-            final_contacts.append(contact)
+    return Response(
+        {
+            "contacts": ContactSerializer(contacts, many=True).data,
+            "next_offset": offset + limit if has_more else None,
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def sync_contacts_view(request):
+    user = request.user
+
+    try:
+        limit = parse_sync_limit(request.query_params.get("limit"))
+        contacts, deleted, token, has_more = sync_contacts(
+            user.id, request.query_params.get("token"), limit
+        )
+    except SyncTokenExpired:
+        return Response(
+            {"error": "sync token expired, start again without a token"},
+            status=status.HTTP_410_GONE,
+        )
+    except ValueError as e:
+        return Response({"error": f"{e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(
+        {
+            "contacts": ContactSerializer(contacts, many=True).data,
+            "deleted": deleted,
+            "token": token,
+            "has_more": has_more,
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def duplicates_view(request):
+    user = request.user
+
+    cache_key, report = duplicate_report(user.id, build=False)
+    etag = contact_cache.etag(cache_key)
+    if not_modified(request, etag):
+        return not_modified_response(etag)
+
+    if report is None:
+        if (
+            run_in_background(request)
+            or Contact.objects.filter(owner_user_id=user.id).count()
+            > inline_max_items()
+        ):
+            # Polling clients share the one job that is building the report
+            return enqueue_response(
+                request, "contacts.duplicates", {}, coalesce=True
+            )
+        report = find_duplicate_groups(user.id)
+        contact_cache.set(cache_key, "duplicates", report)
+    return Response(report, status=status.HTTP_200_OK, headers={"ETag": etag})
 
-    serializer = ContactSerializer(final_contacts, many=True)
-    cache.set(cache_key, serializer.data, timeout=60 * 5)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def merge_contacts_view(request):
+    user = request.user
+
+    try:
+        keep_id, merge_ids = parse_merge(request.data)
+    except ValueError as e:
+        return Response({"error": f"{e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    merged = merge_contacts(user.id, keep_id, merge_ids)
+    if merged is None:
+        return contact_missing_response(keep_id)
+
+    if merged:
+        contact_cache.invalidate(user.id)
+    return Response(
+        {"msg": "Contacts merged", "merged": merged}, status=status.HTTP_200_OK
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@replica_reads
+def contact_stats_view(request):
+    # Counters maintained by the writes (stats.py), never a scan of the book
+    user = request.user
+    cache_key = contact_cache.make_key(user.id, "stats", timezone.localdate())
+    etag = contact_cache.etag(cache_key)
+    if not_modified(request, etag):
+        return not_modified_response(etag)
+
+    stats = contact_cache.get(cache_key, "stats")
+    if stats is None:
+        stats = get_stats(user.id)
+        contact_cache.set(cache_key, "stats", stats)
+    return Response(stats, status=status.HTTP_200_OK, headers={"ETag": etag})
+
+
+def delete_owned_contact(user_id, contact_id):
+    # Owner-scoped: no separate fetch of the contact or of its owner row.
+    # Returns the number of contacts deleted (0 or 1), leaves a sync tombstone.
+    contacts = Contact.objects.filter(id=contact_id, owner_user_id=user_id)
+    with transaction.atomic(savepoint=False):
+        deleted = delete_contacts(user_id, contacts)
+        if deleted:
+            record_changes(user_id, [int(contact_id)], deleted=True)
+    return deleted
 
 
 @api_view(["DELETE"])
 @permission_classes([IsAuthenticated])
 def delete_contact(request):
-    user_auth = JWTAuthentication().authenticate(request)
-    if not user_auth:
-        return Response(
-            {"error": "your JWT is not fine"}, status=status.HTTP_400_BAD_REQUEST
-        )
-    user, _ = user_auth
+    user = request.user
     contact_id = request.query_params.get("contact_id")
 
     if not contact_id:
@@ -140,68 +451,285 @@ def delete_contact(request):
             status=status.HTTP_400_BAD_REQUEST,
         )
     try:
-        contact = Contact.objects.get(id=contact_id)
-    except Contact.DoesNotExist:
+        deleted = delete_owned_contact(user.id, contact_id)
+    except ValueError:
         return Response(
-            {"error": "Contact not found"},
-            status=status.HTTP_404_NOT_FOUND,
+            {"error": "(contact_id) must be a number"},
+            status=status.HTTP_400_BAD_REQUEST,
         )
 
-    contact_user = contact.owner_user
-
-    if contact_user != user:
-        return Response(
-            {"error": "you are not allowed"},
-            status=status.HTTP_405_METHOD_NOT_ALLOWED,
-        )
+    if not deleted:
+        return contact_missing_response(contact_id)
 
-    contact.delete()
-    cache.delete(f"user_{user.id}_contacts")
-    cache.delete_pattern(f"user_{user.id}_contacts_tag_*")
+    contact_cache.invalidate(user.id)
     return Response({}, status=status.HTTP_200_OK)
 
 
+def parse_edit(request):
+    # Returns (contact_id, expected_version) of an edit/ request
+    data = request.data
+    contact_id = data.get("contact_id")
+    if not all([data.get("new_phone_number"), contact_id, data.get("new_name")]):
+        raise ValueError("(new_phone_number, contact_id, new_name) are required")
+    # Checked before the UPDATE, so its errors are not taken for the version's
+    parse_tags(data.get("new_tags"))
+
+    # Optional compare-and-swap: "version" in the body or an If-Match ETag
+    expected_version = data.get("version")
+    if expected_version is None and request.headers.get("If-Match"):
+        expected_version = version_from_etag(contact_id, request.headers["If-Match"])
+    return contact_id, expected_version
+
+
+def edit_owned_contact(user_id, contact_id, data, expected_version):
+    # One conditional UPDATE of just these columns, scoped to the owner.
+    # Returns the number of contacts updated (0 or 1).
+    new_tags = data.get("new_tags")
+    phone_e164, phone_digits = phone_columns(data.get("new_phone_number"))
+    changes = {
+        "phone_number": data.get("new_phone_number"),
+        "phone_e164": phone_e164,
+        "phone_digits": phone_digits,
+        "name": data.get("new_name"),
+        "version": F("version") + 1,
+        "updated_at": timezone.now(),
+    }
+    if new_tags:
+        changes["tags"] = new_tags
+
+    contacts = Contact.objects.filter(id=contact_id, owner_user_id=user_id)
+    if expected_version is not None:
+        contacts = contacts.filter(version=expected_version)
+    with transaction.atomic(savepoint=False):
+        updated = contacts.update(**changes)
+        if updated:
+            record_changes(user_id, [int(contact_id)])
+            if new_tags:
+                # Moves the per-tag counts of stats/ in the same transaction
+                sync_contact_tags(user_id, {int(contact_id): parse_tags(new_tags)})
+    return updated
+
+
 @api_view(["PUT"])
 @permission_classes([IsAuthenticated])
 def edit_contact(request):
-    user_auth = JWTAuthentication().authenticate(request)
-    if not user_auth:
+    user = request.user
+
+    try:
+        contact_id, expected_version = parse_edit(request)
+    except PreconditionFailed as e:
+        return Response({"error": f"{e}"}, status=status.HTTP_412_PRECONDITION_FAILED)
+    except ValueError as e:
+        return Response({"error": f"{e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        updated = edit_owned_contact(user.id, contact_id, request.data, expected_version)
+    except ValueError:
         return Response(
-            {"error": "your JWT is not fine"}, status=status.HTTP_400_BAD_REQUEST
+            {"error": "(contact_id, version) must be numbers"},
+            status=status.HTTP_400_BAD_REQUEST,
         )
-    user, _ = user_auth
 
-    new_phone_number = request.data.get("new_phone_number")
-    contact_id = request.data.get("contact_id")
-    new_name = request.data.get("new_name")
-    new_tags = request.data.get("new_tags")
+    if not updated:
+        return contact_missing_response(contact_id, user)
+
+    contact_cache.invalidate(user.id)
+    response = Response({"msg": "Contact updated"}, status=status.HTTP_200_OK)
+    if expected_version is not None:
+        # Nobody else could have changed it in between, the new version is known
+        response["ETag"] = contact_etag(contact_id, int(expected_version) + 1)
+    return response
+
+
+class PreconditionFailed(ValueError):
+    pass
 
-    if not all([new_phone_number, contact_id, new_name]):
+
+def version_from_etag(contact_id, if_match):
+    # '"c12-v3"' -> 3, "*" -> None (any version). ETags of another contact
+    # (or weak ones) can never match: PreconditionFailed, answered with 412.
+    etags = parse_etags(if_match)
+    if etags == ["*"]:
+        return None
+    if not etags:
+        raise ValueError("If-Match must be \"*\" or a list of ETags")
+    prefix = f'"c{contact_id}-v'
+    for etag in etags:
+        version = etag[len(prefix) : -1]
+        if etag.startswith(prefix) and etag.endswith('"') and version.isdigit():
+            return int(version)
+    raise PreconditionFailed("If-Match does not name a version of this contact")
+
+
+def contact_owner_query(contact_id):
+    return Contact.objects.filter(id=contact_id).values_list("owner_user_id", flat=True)
+
+
+def contact_missing_error(owner_user_id, user=None):
+    # Returns (body, status) for a contact the owner-scoped statement did not find
+    if owner_user_id is None:
+        return {"error": "Contact not found"}, status.HTTP_404_NOT_FOUND
+    if user is not None and owner_user_id == int(user.id):
+        return (
+            {"error": "contact was changed by someone else, reload it and retry"},
+            status.HTTP_409_CONFLICT,
+        )
+    return {"error": "you are not allowed"}, status.HTTP_405_METHOD_NOT_ALLOWED
+
+
+def contact_missing_response(contact_id, user=None):
+    # Only on the failure path: tell "does not exist" apart from "not yours"
+    # and, for compare-and-swap edits, from "changed by someone else"
+    body, status_code = contact_missing_error(
+        contact_owner_query(contact_id).first(), user
+    )
+    return Response(body, status=status_code)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def view_contact(request):
+    user = request.user
+    contact_id = request.query_params.get("contact_id")
+    if not contact_id:
+        return Response(
+            {"error": "(contact_id) is required"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    try:
+        contacts = Contact.objects.filter(id=contact_id, owner_user_id=user.id)
+        if request.headers.get("If-None-Match"):
+            # Just the version column, no row load and no serialization
+            version = contacts.values_list("version", flat=True).first()
+            if version is not None:
+                etag = contact_etag(contact_id, version)
+                if not_modified(request, etag):
+                    return not_modified_response(etag)
+        contact = contacts.first()
+    except ValueError:
         return Response(
-            {"error": "(new_phone_number, contact_id, new_name) are required"},
+            {"error": "(contact_id) must be a number"},
             status=status.HTTP_400_BAD_REQUEST,
         )
 
+    if contact is None:
+        return contact_missing_response(contact_id)
+
+    with span("serialize"):
+        data = ContactSerializer(contact).data
+    return Response(
+        data,
+        status=status.HTTP_200_OK,
+        headers={"ETag": contact_etag(contact.id, contact.version)},
+    )
+
+
+@api_view(["DELETE"])
+@permission_classes([IsAuthenticated])
+def bulk_delete_contacts(request):
+    user = request.user
+
+    # Targets may come in the JSON body or in the query string
+    data = request.data or request.query_params
     try:
-        contact = Contact.objects.get(id=contact_id)
-    except Contact.DoesNotExist:
+        contacts = bulk_queryset(user, data)
+        if run_in_background(request) or contacts.count() > inline_max_items():
+            return enqueue_response(request, "contacts.bulk_delete", bulk_targets(data))
+        deleted = bulk_delete(user, contacts)
+    except ValueError as e:
+        return Response({"error": f"{e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if deleted:
+        contact_cache.invalidate(user.id)
+    return Response({"deleted": deleted}, status=status.HTTP_200_OK)
+
+
+@api_view(["PUT"])
+@permission_classes([IsAuthenticated])
+def bulk_edit_contacts(request):
+    user = request.user
+
+    if not isinstance(request.data, dict):
+        return Response(
+            {"error": "expected a JSON object"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    new_tags = request.data.get("new_tags")
+    if not new_tags:
         return Response(
-            {"error": "Contact not found"},
-            status=status.HTTP_404_NOT_FOUND,
+            {"error": "(new_tags) is required"},
+            status=status.HTTP_400_BAD_REQUEST,
         )
 
-    if contact.owner_user != user:
+    try:
+        parse_tags(new_tags)
+        contacts = bulk_queryset(user, request.data)
+        if run_in_background(request) or contacts.count() > inline_max_items():
+            return enqueue_response(
+                request, "contacts.bulk_edit", bulk_targets(request.data)
+            )
+        updated = bulk_retag(user, contacts, new_tags)
+    except ValueError as e:
+        return Response({"error": f"{e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if updated:
+        contact_cache.invalidate(user.id)
+    return Response(
+        {"msg": "Contacts updated", "updated": updated}, status=status.HTTP_200_OK
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def export_contacts(request):
+    user = request.user
+
+    output = request.query_params.get("output", "ndjson").strip().lower()
+    if output not in EXPORTERS:
         return Response(
-            {"error": "you are not allowed"},
-            status=status.HTTP_405_METHOD_NOT_ALLOWED,
+            {"error": f"output must be one of ({', '.join(EXPORTERS)})"},
+            status=status.HTTP_400_BAD_REQUEST,
         )
 
-    contact.phone_number = new_phone_number
-    contact.name = new_name
-    if new_tags:
-        contact.tags = new_tags
+    # All filters are pushed down into the query
+    contacts = Contact.objects.filter(owner_user_id=user.id)
 
-    contact.save()
-    cache.delete(f"user_{user.id}_contacts")
-    cache.delete_pattern(f"user_{user.id}_contacts_tag_*")
-    return Response({"msg": "Contact updated"}, status=status.HTTP_200_OK)
+    tag = request.query_params.get("tag", "").strip().lower()
+    if tag:
+        contacts = contacts.filter(
+            tag_set__owner_user_id=user.id, tag_set__name=tag
+        )
+
+    expression = request.query_params.get("q", "").strip()
+    if expression:
+        try:
+            tree = parse_tag_expression(expression)
+            contacts = contacts.filter(tree_to_q(tree, user))
+        except ValueError as e:
+            return Response({"error": f"{e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    for param, lookup in (
+        ("created_after", "created_at__gte"),
+        ("created_before", "created_at__lt"),
+    ):
+        value = request.query_params.get(param)
+        if not value:
+            continue
+        try:
+            created_at = parse_datetime(value)
+        except ValueError:
+            created_at = None
+        if created_at is None:
+            return Response(
+                {"error": f"{param} must be an ISO 8601 datetime"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        contacts = contacts.filter(**{lookup: created_at})
+
+    response = StreamingHttpResponse(
+        EXPORTERS[output](contacts),
+        content_type=EXPORT_CONTENT_TYPES[output],
+    )
+    response["Content-Disposition"] = f'attachment; filename="contacts.{output}"'
+    return response
@@ -0,0 +1,57 @@
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from Jobs.queue import get_config, work
+
+
+class Command(BaseCommand):
+    help = "Run background jobs (see Jobs/queue.py) until interrupted"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Jobs run at the same time by this process (threads)",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run the queued jobs and exit instead of waiting for more",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        if connection.vendor == "sqlite" and workers > 1:
+            # SQLite has a single writer, parallel jobs would only fail on locks
+            self.stdout.write("SQLite: running one worker, start more on PostgreSQL")
+            workers = 1
+
+        stop = threading.Event()
+        processed = []
+
+        def worker():
+            processed.append(work(stop, once=options["once"]))
+
+        threads = [
+            threading.Thread(target=worker, name=f"jobs-worker-{number}")
+            for number in range(workers)
+        ]
+        backend = get_config().get("BACKEND", "db")
+        self.stdout.write(f"{len(threads)} worker(s) on the {backend} queue")
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                # join() with a timeout so Ctrl+C is not swallowed
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping after the running jobs")
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        self.stdout.write(f"Ran {sum(processed)} job(s)")
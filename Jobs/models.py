@@ -0,0 +1,54 @@
+from django.db import models
+
+from AuthenticationSystem.models import CustomUser
+
+
+class Job(models.Model):
+    # One background operation, see queue.py
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (SUCCEEDED, "Succeeded"),
+        (FAILED, "Failed"),
+    ]
+    FINISHED = (SUCCEEDED, FAILED)
+
+    owner_user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name="jobs"
+    )
+    # Name of the registered handler, e.g. "contacts.import"
+    kind = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    payload = models.JSONField(default=dict)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default="")
+    # Final progress; while running it lives in the cache (see queue.py)
+    done = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    # Client supplied (Idempotency-Key header), unique per owner
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner_user", "idempotency_key"],
+                name="unique_job_idempotency_key",
+            ),
+        ]
+        indexes = [
+            # Workers look for the oldest queued (or stuck running) jobs
+            models.Index(fields=["status", "id"], name="job_status_seq_idx"),
+            # A user's recent jobs
+            models.Index(fields=["owner_user", "id"], name="job_owner_seq_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
@@ -0,0 +1,360 @@
+import logging
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, storages
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Background jobs for operations that are too slow for one request.
+#
+# A view calls enqueue() and answers 202 with the job; a worker
+# (manage.py run_jobs) claims it, runs the handler registered for its kind
+# and stores the result. Clients poll /api/jobs/progress/?job_id=<id>.
+#
+# The Job table is the source of truth for both backends:
+#   - "db":    idle workers poll the table every POLL_INTERVAL
+#   - "redis": job ids are also pushed on a Redis list when the enqueueing
+#              transaction commits, so an idle worker wakes up at once
+#              (BRPOP); the table is still checked on every timeout, so an
+#              id lost between commit and push still gets run
+# Claiming is a compare-and-swap UPDATE (queued -> running), so any number
+# of workers can share the queue, on any database.
+#
+# Handlers usually write inside one transaction, where their own progress
+# updates would stay invisible, so progress goes to the shared cache while
+# a job runs and into the row when it finishes. A running job without
+# progress for LEASE_SECONDS is considered lost (dead worker) and queued
+# again, at most MAX_ATTEMPTS times, so handlers must report progress more
+# often than that.
+#
+# Big inputs (uploaded files, long request bodies) are not kept in the row:
+# save_input() writes them to the "jobs" storage (settings.STORAGES, it must
+# be shared by the web and the run_jobs processes) and the payload holds the
+# file name under "input_file". The file is deleted once the job is finished.
+#
+# Settings (all optional):
+#     JOBS = {
+#         "BACKEND": "db",              # or "redis" (needs django-redis)
+#         "QUEUE": "jobs",              # Redis list name
+#         "POLL_INTERVAL": 1,
+#         "LEASE_SECONDS": 600,
+#         "MAX_ATTEMPTS": 3,
+#         "PROGRESS_INTERVAL": 0.5,     # min seconds between progress writes
+#         "INLINE_MAX_ITEMS": 5000,     # bigger requests go to the queue
+#         "INLINE_MAX_UPLOAD_BYTES": 1024 * 1024,
+#     }
+
+DEFAULT_POLL_INTERVAL = 1
+DEFAULT_LEASE_SECONDS = 60 * 10
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_PROGRESS_INTERVAL = 0.5
+DEFAULT_INLINE_MAX_ITEMS = 5000
+DEFAULT_INLINE_MAX_UPLOAD_BYTES = 1024 * 1024
+CLAIM_CANDIDATES = 10
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+handlers = {}
+
+
+class IdempotencyKeyReused(ValueError):
+    pass
+
+
+def get_config():
+    return getattr(settings, "JOBS", {})
+
+
+def register(kind):
+    # @register("contacts.import") def handler(job, progress) -> JSON result
+    def decorator(handler):
+        handlers[kind] = handler
+        return handler
+
+    return decorator
+
+
+# Backends
+
+
+class DatabaseQueue:
+    def push(self, job_id):
+        pass
+
+    def wait(self, timeout):
+        # Nothing to wake up on, the worker polls the table
+        time.sleep(timeout)
+        return None
+
+
+class RedisQueue:
+    def __init__(self, name):
+        self.name = name
+
+    def connection(self):
+        from django_redis import get_redis_connection
+
+        return get_redis_connection("default")
+
+    def push(self, job_id):
+        self.connection().lpush(self.name, job_id)
+
+    def wait(self, timeout):
+        item = self.connection().brpop(self.name, timeout=max(1, int(timeout)))
+        return int(item[1]) if item else None
+
+
+def get_queue():
+    config = get_config()
+    if config.get("BACKEND", "db") == "redis":
+        return RedisQueue(config.get("QUEUE", "jobs"))
+    return DatabaseQueue()
+
+
+# Inputs
+
+
+def input_storage():
+    if "jobs" in settings.STORAGES:
+        return storages["jobs"]
+    return default_storage
+
+
+def save_input(kind, content):
+    # Stores a File (or bytes) and returns its name for the payload
+    if isinstance(content, bytes):
+        content = ContentFile(content)
+    return input_storage().save(f"{kind}/{uuid.uuid4().hex}", content)
+
+
+def open_input(name):
+    return input_storage().open(name, "rb")
+
+
+def discard_input(payload):
+    name = payload.get("input_file") if isinstance(payload, dict) else None
+    if name:
+        input_storage().delete(name)
+
+
+# Producers
+
+
+def enqueue(user_id, kind, payload, idempotency_key=None, coalesce=False):
+    # Returns (job, created). With an idempotency key an earlier job of the
+    # same user and key is returned instead of queueing the work twice.
+    # coalesce=True returns the user's unfinished job of this kind, if any.
+    if kind not in handlers:
+        raise ValueError(f"unknown job kind '{kind}'")
+    if idempotency_key and len(idempotency_key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise ValueError(
+            f"Idempotency-Key is longer than {MAX_IDEMPOTENCY_KEY_LENGTH} characters"
+        )
+
+    if idempotency_key:
+        job = Job.objects.filter(
+            owner_user_id=user_id, idempotency_key=idempotency_key
+        ).first()
+        if job is not None:
+            discard_input(payload)
+            return check_reuse(job, kind), False
+
+    if coalesce:
+        job = Job.objects.filter(
+            owner_user_id=user_id, kind=kind, status__in=[Job.QUEUED, Job.RUNNING]
+        ).first()
+        if job is not None:
+            discard_input(payload)
+            return job, False
+
+    try:
+        with transaction.atomic():
+            job = Job.objects.create(
+                owner_user_id=user_id,
+                kind=kind,
+                payload=payload,
+                idempotency_key=idempotency_key or None,
+            )
+    except IntegrityError:
+        # The same key was sent twice at once, the other request won
+        discard_input(payload)
+        job = Job.objects.get(owner_user_id=user_id, idempotency_key=idempotency_key)
+        return check_reuse(job, kind), False
+
+    queue = get_queue()
+    transaction.on_commit(lambda: queue.push(job.id))
+    return job, True
+
+
+def check_reuse(job, kind):
+    if job.kind != kind:
+        raise IdempotencyKeyReused(
+            "Idempotency-Key was already used for another request"
+        )
+    return job
+
+
+def inline_max_items():
+    return get_config().get("INLINE_MAX_ITEMS", DEFAULT_INLINE_MAX_ITEMS)
+
+
+def inline_max_upload_bytes():
+    return get_config().get(
+        "INLINE_MAX_UPLOAD_BYTES", DEFAULT_INLINE_MAX_UPLOAD_BYTES
+    )
+
+
+def run_in_background(request):
+    # True when the client asked for a queued job: Prefer: respond-async, or
+    # an Idempotency-Key (only queued jobs remember keys). Views also queue
+    # inputs bigger than inline_max_items().
+    prefer = request.headers.get("Prefer", "").lower()
+    return "respond-async" in prefer or bool(request.headers.get("Idempotency-Key"))
+
+
+# Progress
+
+
+def progress_key(job_id):
+    return f"job_{job_id}_progress"
+
+
+def get_progress(job_id):
+    # {"done": int, "total": int | None, "at": timestamp} while running
+    return cache.get(progress_key(job_id))
+
+
+class Progress:
+    # progress(done, total=None), called by handlers as they go.
+    # Writes are throttled to one per PROGRESS_INTERVAL seconds.
+    def __init__(self, job):
+        self.job = job
+        self.interval = get_config().get(
+            "PROGRESS_INTERVAL", DEFAULT_PROGRESS_INTERVAL
+        )
+        self.written_at = 0
+        self.done = 0
+        self.total = None
+
+    def __call__(self, done, total=None):
+        self.done = done
+        if total is not None:
+            self.total = total
+        now = time.monotonic()
+        if now - self.written_at >= self.interval or done == self.total:
+            self.written_at = now
+            self.beat()
+
+    def beat(self):
+        cache.set(
+            progress_key(self.job.id),
+            {"done": self.done, "total": self.total, "at": time.time()},
+            timeout=lease_seconds() * 2,
+        )
+
+
+def lease_seconds():
+    return get_config().get("LEASE_SECONDS", DEFAULT_LEASE_SECONDS)
+
+
+# Workers
+
+
+def claim(job_id=None):
+    # Take the oldest queued job (or job_id), None if there is none left
+    jobs = Job.objects.filter(status=Job.QUEUED)
+    if job_id is not None:
+        jobs = jobs.filter(id=job_id)
+    for candidate_id in jobs.order_by("id").values_list("id", flat=True)[
+        :CLAIM_CANDIDATES
+    ]:
+        claimed = Job.objects.filter(id=candidate_id, status=Job.QUEUED).update(
+            status=Job.RUNNING,
+            started_at=timezone.now(),
+            attempts=F("attempts") + 1,
+        )
+        if claimed:
+            return Job.objects.get(id=candidate_id)
+    return None
+
+
+def requeue_lost_jobs():
+    # Running jobs of a dead worker: started long ago and no recent progress
+    cutoff = timezone.now() - timedelta(seconds=lease_seconds())
+    requeued = 0
+    for job in Job.objects.filter(status=Job.RUNNING, started_at__lt=cutoff).only(
+        "id", "attempts", "payload"
+    ):
+        progress = get_progress(job.id)
+        if progress and progress["at"] >= cutoff.timestamp():
+            continue
+        if job.attempts >= get_config().get("MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS):
+            changes = {
+                "status": Job.FAILED,
+                "error": "worker lost",
+                "finished_at": timezone.now(),
+            }
+        else:
+            changes = {"status": Job.QUEUED}
+        updated = Job.objects.filter(id=job.id, status=Job.RUNNING).update(**changes)
+        if updated and changes["status"] == Job.FAILED:
+            discard_input(job.payload)
+        requeued += updated
+    return requeued
+
+
+def run_job(job):
+    progress = Progress(job)
+    progress.beat()
+    try:
+        handler = handlers.get(job.kind)
+        if handler is None:
+            raise ValueError(f"unknown job kind '{job.kind}'")
+        result = handler(job, progress)
+    except Exception as e:
+        logger.exception("job %s failed", job.id)
+        changes = {"status": Job.FAILED, "error": f"{e}"}
+    else:
+        changes = {"status": Job.SUCCEEDED, "result": result}
+    Job.objects.filter(id=job.id).update(
+        done=progress.done,
+        total=progress.total,
+        finished_at=timezone.now(),
+        **changes,
+    )
+    cache.delete(progress_key(job.id))
+    discard_input(job.payload)
+
+
+def work(stop, once=False):
+    # One worker loop; returns the number of jobs run.
+    # once=True drains the queue and returns instead of waiting for more.
+    queue = get_queue()
+    poll_interval = get_config().get("POLL_INTERVAL", DEFAULT_POLL_INTERVAL)
+    processed = 0
+    while not stop.is_set():
+        close_old_connections()
+        requeue_lost_jobs()
+        job = claim()
+        if job is None:
+            if once:
+                break
+            job_id = queue.wait(poll_interval)
+            if job_id is None:
+                continue
+            job = claim(job_id)
+            if job is None:
+                continue
+        run_job(job)
+        processed += 1
+    close_old_connections()
+    return processed
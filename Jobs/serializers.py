@@ -0,0 +1,36 @@
+from rest_framework import serializers
+from .models import Job
+
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        # payload is left out: it can be a whole import file
+        fields = [
+            "id",
+            "kind",
+            "status",
+            "result",
+            "error",
+            "done",
+            "total",
+            "attempts",
+            "created_at",
+            "started_at",
+            "finished_at",
+        ]
+
+
+class JobListSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = [
+            "id",
+            "kind",
+            "status",
+            "error",
+            "done",
+            "total",
+            "created_at",
+            "finished_at",
+        ]
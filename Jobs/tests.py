@@ -0,0 +1,257 @@
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from AuthenticationSystem.models import CustomUser
+from Contact.caching import contact_cache
+from Contact.models import Contact
+from .models import Job
+from .queue import (
+    claim,
+    enqueue,
+    handlers,
+    input_storage,
+    requeue_lost_jobs,
+    work,
+)
+
+
+def run_worker():
+    return work(threading.Event(), once=True)
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    JOBS={"BACKEND": "db", "INLINE_MAX_ITEMS": 3, "MAX_ATTEMPTS": 2},
+)
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        contact_cache.clear_local()
+        inputs = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, inputs)
+        self.enterContext(
+            override_settings(
+                STORAGES={
+                    **settings.STORAGES,
+                    "jobs": {
+                        "BACKEND": "django.core.files.storage.FileSystemStorage",
+                        "OPTIONS": {"location": inputs},
+                    },
+                }
+            )
+        )
+        self.user = CustomUser.objects.create_user(user_name="owner", password="pw")
+        self.other = CustomUser.objects.create_user(user_name="other", password="pw")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def rows(self, count):
+        return [
+            {"name": f"Contact {number}", "phone_number": f"+1202555{number:04d}"}
+            for number in range(count)
+        ]
+
+    def test_large_import_is_queued_and_run_by_a_worker(self):
+        response = self.client.post("/api/contact/import/", self.rows(5), format="json")
+
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data["job"]["id"]
+        self.assertEqual(response["Location"], f"/api/jobs/detail/?job_id={job_id}")
+        self.assertEqual(response.data["job"]["status"], Job.QUEUED)
+        self.assertFalse(Contact.objects.exists())
+
+        self.assertEqual(run_worker(), 1)
+
+        progress = self.client.get(f"/api/jobs/progress/?job_id={job_id}")
+        self.assertEqual(
+            progress.data,
+            {"status": Job.SUCCEEDED, "done": 5, "total": 5, "percent": 100.0},
+        )
+        detail = self.client.get(f"/api/jobs/detail/?job_id={job_id}")
+        self.assertEqual(detail.data["result"]["created"], 5)
+        self.assertEqual(Contact.objects.filter(owner_user=self.user).count(), 5)
+
+    def test_queued_inputs_are_kept_in_storage_until_the_job_ends(self):
+        self.client.post("/api/contact/import/", self.rows(5), format="json")
+
+        job = Job.objects.get()
+        self.assertEqual(set(job.payload), {"input", "input_file"})
+        self.assertTrue(input_storage().exists(job.payload["input_file"]))
+
+        run_worker()
+
+        self.assertEqual(Job.objects.get().status, Job.SUCCEEDED)
+        self.assertFalse(input_storage().exists(job.payload["input_file"]))
+
+    def test_queued_upload_is_imported_from_storage(self):
+        upload = SimpleUploadedFile(
+            "contacts.csv",
+            b"\xef\xbb\xbfname,phone_number,tags\nJohn,+12025550100,work\n",
+        )
+        response = self.client.post(
+            "/api/contact/import/",
+            {"file": upload},
+            format="multipart",
+            headers={"Prefer": "respond-async"},
+        )
+        self.assertEqual(response.status_code, 202)
+        name = Job.objects.get().payload["input_file"]
+
+        run_worker()
+
+        job = Job.objects.get()
+        self.assertEqual(job.result["created"], 1)
+        self.assertFalse(input_storage().exists(name))
+
+    def test_reused_job_drops_the_new_input(self):
+        headers = {"Idempotency-Key": "import-1"}
+        for _ in range(2):
+            self.client.post(
+                "/api/contact/import/", self.rows(1), format="json", headers=headers
+            )
+
+        _, files = input_storage().listdir("contacts.import")
+        name = Job.objects.get().payload["input_file"]
+        self.assertEqual(files, [name.rsplit("/", 1)[-1]])
+
+    def test_small_import_stays_inline(self):
+        response = self.client.post("/api/contact/import/", self.rows(2), format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(Job.objects.exists())
+
+    def test_idempotency_key_returns_the_same_job(self):
+        headers = {"Idempotency-Key": "import-1"}
+        first = self.client.post(
+            "/api/contact/import/", self.rows(1), format="json", headers=headers
+        )
+        again = self.client.post(
+            "/api/contact/import/", self.rows(1), format="json", headers=headers
+        )
+
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(again.status_code, 202)
+        self.assertEqual(again.data["job"]["id"], first.data["job"]["id"])
+        self.assertEqual(Job.objects.count(), 1)
+
+        reused = self.client.put(
+            "/api/contact/bulk-edit/",
+            {"new_tags": "x", "tag": "work"},
+            format="json",
+            headers=headers,
+        )
+        self.assertEqual(reused.status_code, 409)
+
+    def test_bulk_edit_in_the_background(self):
+        for number in range(2):
+            Contact.objects.create(
+                name=f"Contact {number}",
+                phone_number=f"+1202555000{number}",
+                owner_user=self.user,
+                tags="work",
+            )
+
+        response = self.client.put(
+            "/api/contact/bulk-edit/",
+            {"new_tags": "archived", "tag": "work"},
+            format="json",
+            headers={"Prefer": "respond-async"},
+        )
+        self.assertEqual(response.status_code, 202)
+
+        run_worker()
+
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result["updated"], 2)
+        self.assertEqual((job.done, job.total), (2, 2))
+        self.assertEqual(
+            set(Contact.objects.values_list("tags", flat=True)), {"archived"}
+        )
+
+    def test_duplicate_report_of_a_large_book_is_built_by_one_job(self):
+        for number in range(4):
+            Contact.objects.create(
+                name="John Smith", phone_number="+12025550100", owner_user=self.user
+            )
+
+        first = self.client.get("/api/contact/duplicates/")
+        again = self.client.get("/api/contact/duplicates/")
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(again.data["job"]["id"], first.data["job"]["id"])
+
+        run_worker()
+
+        with self.assertNumQueries(0):
+            report = self.client.get("/api/contact/duplicates/")
+        self.assertEqual(report.status_code, 200)
+        self.assertEqual(report.data["total"], 1)
+
+    def test_duplicate_report_build_keeps_its_lease(self):
+        for number in range(3):
+            Contact.objects.create(
+                name=f"Contact {number}",
+                phone_number=f"+1202555000{number}",
+                owner_user=self.user,
+            )
+        enqueue(self.user.id, "contacts.duplicates", {})
+        calls = []
+
+        handlers["contacts.duplicates"](
+            claim(), lambda done, total=None: calls.append((done, total))
+        )
+
+        # While loading, before each of the 4 name blocks, while fetching the
+        # grouped contacts and when done
+        self.assertEqual(calls[:2], [(0, None), (0, 5)])
+        self.assertEqual(calls[2:], [(done, None) for done in range(6)])
+
+    def test_a_job_is_claimed_once(self):
+        enqueue(self.user.id, "contacts.duplicates", {})
+
+        job = claim()
+        self.assertEqual((job.status, job.attempts), (Job.RUNNING, 1))
+        self.assertIsNone(claim())
+
+    def test_failed_handler_marks_the_job_failed(self):
+        job, _ = enqueue(self.user.id, "contacts.bulk_edit", {"tag": "work"})
+
+        with self.assertLogs("Jobs.queue", "ERROR"):
+            run_worker()
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.error, "'new_tags'")
+
+    def test_lost_jobs_are_requeued_then_failed(self):
+        job, _ = enqueue(self.user.id, "contacts.duplicates", {})
+        stale = timezone.now() - timedelta(hours=1)
+
+        claim()
+        Job.objects.filter(id=job.id).update(started_at=stale)
+        self.assertEqual(requeue_lost_jobs(), 1)
+        self.assertEqual(Job.objects.get(id=job.id).status, Job.QUEUED)
+
+        claim()
+        Job.objects.filter(id=job.id).update(started_at=stale)
+        requeue_lost_jobs()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.error), (Job.FAILED, "worker lost"))
+
+    def test_jobs_are_private(self):
+        job, _ = enqueue(self.other.id, "contacts.duplicates", {})
+
+        response = self.client.get(f"/api/jobs/progress/?job_id={job.id}")
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get("/api/jobs/all/")
+        self.assertEqual(response.data["jobs"], [])
@@ -0,0 +1,28 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    # Operations that return 202 Accepted (large imports, bulk edits, duplicate
+    # reports) answer with { "msg": ..., "job": {...} } and a Location header
+    # pointing at detail/. Pass an Idempotency-Key header to make a retry return
+    # the same job instead of queueing the work again.
+
+    # One job of the authenticated user
+    # Method: GET
+    # Query param: ?job_id=<id>
+    # Description: Status ("queued" | "running" | "succeeded" | "failed"), progress
+    # (done / total / percent), result and error
+    path("detail/", views.view_job, name="view_job"),
+
+    # Progress only, cheap enough to poll every second
+    # Method: GET
+    # Query param: ?job_id=<id>
+    # Description: Returns { "status": str, "done": int, "total": int | null,
+    # "percent": float | null }
+    path("progress/", views.job_progress, name="job_progress"),
+
+    # Recent jobs of the authenticated user, newest first
+    # Method: GET
+    # Query param: ?limit=<1..100, default 20>
+    path("all/", views.view_all_jobs, name="view_all_jobs"),
+]
@@ -0,0 +1,126 @@
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+
+from .models import Job
+from .queue import IdempotencyKeyReused, enqueue, get_progress
+from .serializers import JobListSerializer, JobSerializer
+
+DEFAULT_JOBS_LIMIT = 20
+MAX_JOBS_LIMIT = 100
+
+
+def job_url(job_id):
+    return f"/api/jobs/detail/?job_id={job_id}"
+
+
+def accepted_response(job, created=True):
+    # 202 for a queued operation; the client polls the Location
+    return Response(
+        {
+            "msg": "accepted" if created else "already accepted",
+            "job": JobSerializer(job).data,
+        },
+        status=status.HTTP_202_ACCEPTED,
+        headers={"Location": job_url(job.id)},
+    )
+
+
+def enqueue_response(request, kind, payload, coalesce=False):
+    # Queue the operation of this request and answer 202 (or 409 / 400)
+    try:
+        job, created = enqueue(
+            request.user.id,
+            kind,
+            payload,
+            request.headers.get("Idempotency-Key"),
+            coalesce=coalesce,
+        )
+    except IdempotencyKeyReused as e:
+        return Response({"error": f"{e}"}, status=status.HTTP_409_CONFLICT)
+    except ValueError as e:
+        return Response({"error": f"{e}"}, status=status.HTTP_400_BAD_REQUEST)
+    return accepted_response(job, created)
+
+
+def owned_jobs(request):
+    job_id = request.query_params.get("job_id")
+    if not job_id:
+        raise ValueError("(job_id) is required")
+    if not job_id.isdigit():
+        raise ValueError("(job_id) must be a number")
+    return Job.objects.filter(id=job_id, owner_user_id=request.user.id)
+
+
+def live_progress(job_id, job_status, done, total):
+    # The row only has the final numbers, a running job reports to the cache
+    if job_status == Job.RUNNING:
+        progress = get_progress(job_id)
+        if progress:
+            done, total = progress["done"], progress["total"]
+    return {
+        "status": job_status,
+        "done": done,
+        "total": total,
+        "percent": round(100 * done / total, 1) if total else None,
+    }
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def view_job(request):
+    try:
+        job = owned_jobs(request).first()
+    except ValueError as e:
+        return Response({"error": f"{e}"}, status=status.HTTP_400_BAD_REQUEST)
+    if job is None:
+        return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    return Response(
+        {
+            **JobSerializer(job).data,
+            **live_progress(job.id, job.status, job.done, job.total),
+        },
+        status=status.HTTP_200_OK,
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def job_progress(request):
+    # Small and cheap, for frequent polling: no result, no payload
+    try:
+        row = owned_jobs(request).values_list("status", "done", "total").first()
+    except ValueError as e:
+        return Response({"error": f"{e}"}, status=status.HTTP_400_BAD_REQUEST)
+    if row is None:
+        return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    return Response(
+        live_progress(int(request.query_params["job_id"]), *row),
+        status=status.HTTP_200_OK,
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def view_all_jobs(request):
+    try:
+        limit = int(request.query_params.get("limit", DEFAULT_JOBS_LIMIT))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_JOBS_LIMIT:
+        return Response(
+            {"error": f"limit must be between 1 and {MAX_JOBS_LIMIT}"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    jobs = (
+        Job.objects.filter(owner_user_id=request.user.id)
+        .defer("payload", "result")
+        .order_by("-id")[:limit]
+    )
+    return Response(
+        {"jobs": JobListSerializer(jobs, many=True).data}, status=status.HTTP_200_OK
+    )
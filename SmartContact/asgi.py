@@ -3,6 +3,8 @@ ASGI config for SmartContact project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+    uvicorn SmartContact.asgi:application --workers 4
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -12,5 +14,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SmartContact.settings')
+# Serve the native async views (see SmartContact/asgi_urls.py); set it to "0"
+# to run the sync views in threads instead
+os.environ.setdefault('SMARTCONTACT_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
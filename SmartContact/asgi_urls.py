@@ -0,0 +1,12 @@
+from django.urls import path, include
+
+from .urls import urlpatterns as sync_urlpatterns
+
+# URLconf used when ASYNC_VIEWS is on (the default under SmartContact/asgi.py).
+# The async views come first and win for their URLs; everything else falls
+# through to the sync views of SmartContact/urls.py.
+urlpatterns = [
+    path("api/auth/", include("AuthenticationSystem.async_urls")),
+    path("api/contact/", include("Contact.async_urls")),
+    *sync_urlpatterns,
+]
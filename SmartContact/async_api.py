@@ -0,0 +1,104 @@
+import json
+from functools import wraps
+
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from AuthenticationSystem.authentication import get_async_authenticators
+
+# Async counterpart of DRF's @api_view for the async views
+# (Contact/async_views.py, AuthenticationSystem/async_views.py).
+#
+# DRF's request / response cycle is sync only, so under ASGI every @api_view
+# runs in a worker thread. async_api_view keeps what the views need with the
+# same wire format:
+#   - request.data (JSON or form body) and request.query_params
+#   - request.user from the configured JWT authentication (aauthenticate())
+#   - permission classes, 401 / 403 / 405 bodies as {"detail": "..."}
+# and the view returns json_response(...) instead of Response(...).
+
+
+def json_response(data=None, status=status.HTTP_200_OK, headers=None):
+    return JsonResponse(
+        {} if data is None else data,
+        status=status,
+        headers=headers,
+        encoder=JSONEncoder,
+        safe=False,
+    )
+
+
+def not_modified_response(etag):
+    return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+
+def error_response(exc, authenticator=None):
+    # The same body and status DRF's exception handler sends
+    detail = exc.detail
+    data = detail if isinstance(detail, (dict, list)) else {"detail": detail}
+    headers = {}
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        if authenticator is None:
+            return json_response(data, status.HTTP_403_FORBIDDEN)
+        headers["WWW-Authenticate"] = authenticator.authenticate_header(None)
+    return json_response(data, exc.status_code, headers)
+
+
+def parse_body(request):
+    if not request.body:
+        return {}
+    if request.content_type == "application/json":
+        try:
+            return json.loads(request.body)
+        except ValueError as e:
+            raise exceptions.ParseError(f"JSON parse error - {e}")
+    return request.POST
+
+
+async def authenticate(request, authenticators):
+    for authenticator in authenticators:
+        result = await authenticator.aauthenticate(request)
+        if result is not None:
+            return result[0]
+    return AnonymousUser()
+
+
+def async_api_view(http_method_names, permission_classes=None):
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in http_method_names:
+                return json_response(
+                    {"detail": f'Method "{request.method}" not allowed.'},
+                    status.HTTP_405_METHOD_NOT_ALLOWED,
+                    {"Allow": ", ".join(http_method_names)},
+                )
+
+            authenticators = get_async_authenticators()
+            challenger = authenticators[0] if authenticators else None
+            try:
+                request.data = parse_body(request)
+                request.query_params = request.GET
+                # Like DRF: authenticated up front, even for AllowAny views
+                request.user = await authenticate(request, authenticators)
+
+                for permission_class in (
+                    permission_classes or api_settings.DEFAULT_PERMISSION_CLASSES
+                ):
+                    if not permission_class().has_permission(request, None):
+                        if not request.user.is_authenticated:
+                            raise exceptions.NotAuthenticated()
+                        raise exceptions.PermissionDenied()
+            except exceptions.APIException as e:
+                return error_response(e, challenger)
+
+            return await view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
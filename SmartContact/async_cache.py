@@ -0,0 +1,121 @@
+import asyncio
+import weakref
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Non-blocking access to the "default" cache for the async views.
+#
+# With django-redis the calls go through a redis.asyncio client that uses the
+# same key format and serialization as django-redis, so sync and async views
+# share every key (cache generations, cached pages, JWT revocations).
+# Any other cache backend falls back to Django's cache.a*() methods.
+#
+# Settings (optional):
+#     ASYNC_CACHE_POOL_KWARGS = {"max_connections": 100}
+
+# INCR only an existing key, like django-redis (which raises ValueError otherwise)
+INCR_EXISTING = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return false
+"""
+
+# redis.asyncio connections belong to the event loop that opened them
+clients = weakref.WeakKeyDictionary()
+
+
+def get_cache():
+    return caches["default"]
+
+
+def uses_redis():
+    return get_cache().__class__.__module__.startswith("django_redis")
+
+
+def get_client():
+    from redis.asyncio import ConnectionPool, Redis
+
+    loop = asyncio.get_running_loop()
+    client = clients.get(loop)
+    if client is None:
+        location = get_cache()._server
+        if isinstance(location, (list, tuple)):
+            location = location[0]
+        pool = ConnectionPool.from_url(
+            location, **getattr(settings, "ASYNC_CACHE_POOL_KWARGS", {})
+        )
+        client = clients[loop] = Redis(connection_pool=pool)
+    return client
+
+
+def make_key(key):
+    return get_cache().client.make_key(key)
+
+
+def encode(value):
+    return get_cache().client.encode(value)
+
+
+def decode(value):
+    return get_cache().client.decode(value)
+
+
+async def aget(key, default=None):
+    if not uses_redis():
+        return await get_cache().aget(key, default)
+    value = await get_client().get(make_key(key))
+    return default if value is None else decode(value)
+
+
+async def aget_many(keys):
+    if not uses_redis():
+        return await get_cache().aget_many(keys)
+    values = await get_client().mget([make_key(key) for key in keys])
+    return {
+        key: decode(value)
+        for key, value in zip(keys, values)
+        if value is not None
+    }
+
+
+async def aset(key, value, timeout):
+    if not uses_redis():
+        return await get_cache().aset(key, value, timeout=timeout)
+    await get_client().set(make_key(key), encode(value), ex=timeout or None)
+
+
+async def aadd(key, value, timeout):
+    if not uses_redis():
+        return await get_cache().aadd(key, value, timeout=timeout)
+    return bool(
+        await get_client().set(
+            make_key(key),
+            encode(value),
+            ex=timeout or None,
+            nx=True,
+        )
+    )
+
+
+async def aincr(key, delta=1):
+    # Raises ValueError when the key does not exist
+    if not uses_redis():
+        return await get_cache().aincr(key, delta)
+    value = await get_client().eval(INCR_EXISTING, 1, make_key(key), delta)
+    if value is None:
+        raise ValueError(f"Key '{key}' not found")
+    return value
+
+
+async def adelete(key):
+    if not uses_redis():
+        return await get_cache().adelete(key)
+    return bool(await get_client().delete(make_key(key)))
+
+
+async def apublish(channel, message):
+    # Redis pub/sub only, a no-op for other backends
+    if uses_redis():
+        await get_client().publish(channel, message)
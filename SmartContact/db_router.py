@@ -0,0 +1,121 @@
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+
+from SmartContact import async_cache
+
+# Read replicas for the read-only list views.
+#
+# Only views wrapped in @replica_reads read from a replica; every other query
+# (writes, and the reads inside write paths) stays on "default". A replica
+# is picked per request and remembered in a context variable, so it follows
+# the request into threads and coroutines.
+#
+# Read-your-writes: every contact write pins its user to the primary for
+# REPLICA_STICKY_SECONDS (pin_to_primary(), called by contact_cache.invalidate()
+# right before it bumps the user's cache generation). The pin lives in the
+# shared cache, so it holds across workers. A @replica_reads request only
+# checks it on its first query, after the view has read the generation: a
+# request that sees the new generation also sees the pin, so a lagging
+# replica never fills a freshly invalidated generation with old rows.
+#
+# Without replicas configured (e.g. SQLite) all of this is a no-op.
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+read_alias = ContextVar("read_alias", default=None)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith("replica_")]
+
+
+def pin_key(user_id):
+    return f"db_pin_{user_id}"
+
+
+def sticky_seconds():
+    return getattr(settings, "REPLICA_STICKY_SECONDS", 5)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        choice = read_alias.get()
+        return choice.resolve() if choice is not None else None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication
+        return db == "default"
+
+
+def pin_to_primary(user_id):
+    if replica_aliases():
+        cache.set(pin_key(user_id), True, timeout=sticky_seconds())
+
+
+async def apin_to_primary(user_id):
+    if replica_aliases():
+        await async_cache.aset(pin_key(user_id), True, timeout=sticky_seconds())
+
+
+class ReplicaChoice:
+    # The replica picked for a @replica_reads request; the user's pin is only
+    # looked up when the first query needs a connection (from the ORM's
+    # thread in async views, hence the sync cache)
+    def __init__(self, alias, user_id):
+        self.alias = alias
+        self.user_id = user_id
+        self.checked = False
+
+    def resolve(self):
+        if not self.checked:
+            self.checked = True
+            if cache.get(pin_key(self.user_id)):
+                self.alias = None
+        return self.alias
+
+
+def replica_reads(view):
+    # Put it under @api_view / @async_api_view: it needs the authenticated user
+    if iscoroutinefunction(view):
+
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            replicas = replica_aliases()
+            if not replicas:
+                return await view(request, *args, **kwargs)
+            token = read_alias.set(
+                ReplicaChoice(random.choice(replicas), request.user.id)
+            )
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                read_alias.reset(token)
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        replicas = replica_aliases()
+        if not replicas:
+            return view(request, *args, **kwargs)
+        token = read_alias.set(
+            ReplicaChoice(random.choice(replicas), request.user.id)
+        )
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            read_alias.reset(token)
+
+    return wrapper
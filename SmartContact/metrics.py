@@ -0,0 +1,407 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models import Count
+from django.http import HttpResponse
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger(__name__)
+
+# Request-level performance metrics, exported in the Prometheus text format
+# on /metrics.
+#
+# metrics_middleware opens a RequestStats for every request in a context
+# variable (so it follows the request into sync_to_async threads). It is fed
+# by:
+#   - a database execute wrapper: query count and time (and the SQL, for the
+#     slow-request log)
+#   - record_cache(): cache lookups (hit / miss) and time, called by the
+#     contact cache and the JWT user cache
+#   - span(): named timings, e.g. "jwt_decode", "password_hash", "serialize"
+# and folded into per-endpoint histograms / counters when the response is
+# back. Endpoints are labelled by URL route ("/api/contact/all/"), never by
+# raw path, so the number of series stays bounded.
+#
+# Metrics are per process: with several workers scrape each of them.
+#
+# Settings (all optional):
+#     METRICS = {
+#         "ENABLED": True,
+#         "TOKEN": None,                 # require "Authorization: Bearer <token>"
+#         "SLOW_REQUEST_SECONDS": None,  # log slower requests with their SQL
+#     }
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+MAX_CAPTURED_QUERIES = 200
+METRICS_PATH = "/metrics"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def get_config():
+    return getattr(settings, "METRICS", {})
+
+
+# Registry
+
+
+def format_labels(names, values, extra=""):
+    def escape(value):
+        return (
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+
+    labels = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self.lock:
+            values = sorted(self.values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # labels -> [count per bucket..., +Inf count, sum]
+        self.values = {}
+
+    def observe(self, labels, value):
+        with self.lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+    def totals(self):
+        # {labels: (count, sum)}, e.g. for benchmarks/
+        with self.lock:
+            return {
+                labels: (sum(counts[:-1]), counts[-1])
+                for labels, counts in self.values.items()
+            }
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self.lock:
+            values = sorted(
+                (labels, list(counts)) for labels, counts in self.values.items()
+            )
+        for labels, counts in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(
+                    f"{self.name}_bucket"
+                    f"{format_labels(self.labelnames, labels, le)} {cumulative}"
+                )
+            label_text = format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {counts[-1]}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "smartcontact_request_duration_seconds",
+    "Request latency",
+    ("endpoint", "method", "status"),
+    LATENCY_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    "smartcontact_request_db_queries",
+    "Database queries per request",
+    ("endpoint",),
+    QUERY_COUNT_BUCKETS,
+)
+DB_SECONDS = Counter(
+    "smartcontact_db_seconds_total", "Time spent in database queries", ("endpoint",)
+)
+CACHE_LOOKUPS = Counter(
+    "smartcontact_cache_lookups_total",
+    "Cache lookups by cache and result",
+    ("endpoint", "cache", "result"),
+)
+CACHE_SECONDS = Counter(
+    "smartcontact_cache_seconds_total",
+    "Time spent in cache lookups",
+    ("endpoint", "cache"),
+)
+SPAN_SECONDS = Histogram(
+    "smartcontact_span_duration_seconds",
+    "Time spent in named steps of a request (JWT decode, hashing, serialization)",
+    ("endpoint", "span"),
+    LATENCY_BUCKETS,
+)
+REQUEST_METRICS = [
+    REQUEST_SECONDS,
+    DB_QUERIES,
+    DB_SECONDS,
+    CACHE_LOOKUPS,
+    CACHE_SECONDS,
+    SPAN_SECONDS,
+]
+
+
+def reset():
+    # Tests
+    for metric in REQUEST_METRICS:
+        metric.clear()
+
+
+# Per-request collection
+
+
+class RequestStats:
+    def __init__(self, capture_sql=False):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        # cache -> [hits, misses, seconds]
+        self.caches = {}
+        self.spans = {}
+        self.queries = [] if capture_sql else None
+
+
+current_stats = ContextVar("request_stats", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.db_queries += 1
+        stats.db_seconds += elapsed
+        if stats.queries is not None and len(stats.queries) < MAX_CAPTURED_QUERIES:
+            stats.queries.append((elapsed, sql))
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+# New connections (e.g. in sync_to_async threads) get it when they connect
+connection_created.connect(install_query_recorder)
+
+
+def record_cache(name, hit, seconds):
+    stats = current_stats.get()
+    if stats is None:
+        return
+    entry = stats.caches.setdefault(name, [0, 0, 0.0])
+    entry[0 if hit else 1] += 1
+    entry[2] += seconds
+
+
+@contextmanager
+def span(name):
+    stats = current_stats.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.spans[name] = stats.spans.get(name, 0) + time.perf_counter() - started
+
+
+def start_request():
+    for alias in connections:
+        install_query_recorder(connections[alias])
+    slow = get_config().get("SLOW_REQUEST_SECONDS")
+    stats = RequestStats(capture_sql=slow is not None)
+    return stats, current_stats.set(stats)
+
+
+def endpoint_of(request):
+    match = getattr(request, "resolver_match", None)
+    return f"/{match.route}" if match is not None else "unmatched"
+
+
+def finish_request(request, response, stats):
+    elapsed = time.perf_counter() - stats.started
+    if request.path == METRICS_PATH:
+        return
+    endpoint = endpoint_of(request)
+
+    REQUEST_SECONDS.observe(
+        (endpoint, request.method, str(response.status_code)), elapsed
+    )
+    DB_QUERIES.observe((endpoint,), stats.db_queries)
+    DB_SECONDS.inc((endpoint,), stats.db_seconds)
+    for name, (hits, misses, seconds) in stats.caches.items():
+        if hits:
+            CACHE_LOOKUPS.inc((endpoint, name, "hit"), hits)
+        if misses:
+            CACHE_LOOKUPS.inc((endpoint, name, "miss"), misses)
+        CACHE_SECONDS.inc((endpoint, name), seconds)
+    for name, seconds in stats.spans.items():
+        SPAN_SECONDS.observe((endpoint, name), seconds)
+
+    slow = get_config().get("SLOW_REQUEST_SECONDS")
+    if slow is not None and elapsed >= slow:
+        log_slow_request(request, response, stats, elapsed)
+
+
+def log_slow_request(request, response, stats, elapsed):
+    lines = [
+        f"slow request {request.method} {request.path} {response.status_code}"
+        f" in {elapsed * 1000:.1f} ms:"
+        f" {stats.db_queries} queries ({stats.db_seconds * 1000:.1f} ms)"
+    ]
+    for name, (hits, misses, seconds) in sorted(stats.caches.items()):
+        lines.append(
+            f"  cache {name}: {hits} hits, {misses} misses ({seconds * 1000:.1f} ms)"
+        )
+    for name, seconds in sorted(stats.spans.items()):
+        lines.append(f"  {name}: {seconds * 1000:.1f} ms")
+    for seconds, sql in stats.queries:
+        lines.append(f"  {seconds * 1000:8.1f} ms  {sql}")
+    if stats.db_queries > len(stats.queries):
+        lines.append(f"  ... {stats.db_queries - len(stats.queries)} more queries")
+    logger.warning("\n".join(lines))
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    # First in MIDDLEWARE, so the latency covers the whole stack
+    if not get_config().get("ENABLED", True):
+        raise MiddlewareNotUsed
+
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request):
+            stats, token = start_request()
+            try:
+                response = await get_response(request)
+            finally:
+                current_stats.reset(token)
+            finish_request(request, response, stats)
+            return response
+
+    else:
+
+        def middleware(request):
+            stats, token = start_request()
+            try:
+                response = get_response(request)
+            finally:
+                current_stats.reset(token)
+            finish_request(request, response, stats)
+            return response
+
+    return middleware
+
+
+# /metrics
+
+
+# contact_cache.stats() key -> (type, help); counters get a _total suffix
+CONTACT_CACHE_STATS = {
+    "l1_hits": ("counter", "Contact cache lookups answered by the in-process L1"),
+    "l1_misses": ("counter", "Contact cache lookups missed by the in-process L1"),
+    "l2_hits": ("counter", "Contact cache lookups answered by the shared cache"),
+    "l2_misses": ("counter", "Contact cache lookups missed by the shared cache"),
+    "sets": ("counter", "Contact cache writes"),
+    "invalidations": ("counter", "Contact cache invalidations (generation bumps)"),
+    "l1_hit_rate": ("gauge", "Share of L1 lookups that hit"),
+    "l2_hit_rate": ("gauge", "Share of shared cache lookups that hit"),
+    "l1_entries": ("gauge", "Entries in the in-process L1"),
+    "l1_bytes": ("gauge", "Bytes held by the in-process L1"),
+}
+
+
+def process_metrics():
+    # Read at scrape time
+    from Contact.caching import contact_cache
+    from Jobs.models import Job
+
+    lines = []
+    stats = contact_cache.stats()
+    for key, (kind, help_text) in CONTACT_CACHE_STATS.items():
+        name = f"smartcontact_contact_cache_{key}"
+        if kind == "counter":
+            name += "_total"
+        lines += [
+            f"# HELP {name} {help_text}",
+            f"# TYPE {name} {kind}",
+            f"{name} {stats[key]}",
+        ]
+
+    name = "smartcontact_jobs"
+    lines += [f"# HELP {name} Background jobs by status", f"# TYPE {name} gauge"]
+    counts = dict(
+        Job.objects.values_list("status").annotate(count=Count("id")).order_by()
+    )
+    for job_status, _ in Job.STATUS_CHOICES:
+        lines.append(f'{name}{{status="{job_status}"}} {counts.get(job_status, 0)}')
+    return lines
+
+
+def metrics_view(request):
+    token = get_config().get("TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponse("unauthorized\n", status=401, content_type=CONTENT_TYPE)
+
+    lines = []
+    for metric in REQUEST_METRICS:
+        lines += metric.render()
+    lines += process_metrics()
+    return HttpResponse("\n".join(lines) + "\n", content_type=CONTENT_TYPE)
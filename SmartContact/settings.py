@@ -1,3 +1,4 @@
+import os
 from datetime import timedelta
 from pathlib import Path
 
@@ -30,10 +31,13 @@ INSTALLED_APPS = [
     "rest_framework_simplejwt",
     "AuthenticationSystem.apps.AuthenticationsystemConfig",
     "Contact",
+    "Jobs",
 ]
 
 
 MIDDLEWARE = [
+    # First, so request latency covers every other middleware (SmartContact/metrics.py)
+    "SmartContact.metrics.metrics_middleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -46,9 +50,19 @@ MIDDLEWARE = [
 AUTH_USER_MODEL = "AuthenticationSystem.CustomUser"
 
 
+# How a JWT becomes request.user (see AuthenticationSystem/authentication.py):
+#   "db"     -> load the user row (cached for JWT_USER_CACHE["TIMEOUT"] seconds)
+#   "claims" -> trust the signed claims, no DB lookup; revocation is checked in Redis
+JWT_AUTH_MODE = "db"
+
+JWT_AUTHENTICATION_CLASSES = {
+    "db": "AuthenticationSystem.authentication.CachedJWTAuthentication",
+    "claims": "AuthenticationSystem.authentication.ClaimsJWTAuthentication",
+}
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        JWT_AUTHENTICATION_CLASSES[JWT_AUTH_MODE],
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
@@ -63,6 +77,20 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=30),
 }
 
+# Short-lived cache of the user row behind each JWT
+# (see AuthenticationSystem/authentication.py). BACKEND: "local" | "cache" | None
+JWT_USER_CACHE = {
+    "BACKEND": "local",
+    "TIMEOUT": 30,
+    "MAX_ENTRIES": 10000,
+}
+
+# Cached "user" of the login/ response, retired on every save of the user
+# (see AuthenticationSystem/caching.py). None turns it off
+ME_CACHE = {
+    "TIMEOUT": 60 * 5,
+}
+
 # CACHES = {
 #     "default": {
 #         "BACKEND": "django_redis.cache.RedisCache",
@@ -72,7 +100,14 @@ SIMPLE_JWT = {
 #         },
 
 
-ROOT_URLCONF = "OAB.urls"
+# Native async views for the auth and hot contact endpoints (SmartContact/asgi_urls.py).
+# asgi.py turns them on; under WSGI every async view would need its own event loop.
+ASYNC_VIEWS = os.environ.get("SMARTCONTACT_ASYNC_VIEWS", "") == "1"
+
+ROOT_URLCONF = "SmartContact.asgi_urls" if ASYNC_VIEWS else "SmartContact.urls"
+
+# Extra redis.asyncio pool options for the async views (SmartContact/async_cache.py)
+ASYNC_CACHE_POOL_KWARGS = {"max_connections": 100}
 
 
 CACHES = {
@@ -85,6 +120,84 @@ CACHES = {
     }
 }
 
+# Contact read caches (see Contact/caching.py).
+# Keys are stamped with a per-user generation, a write bumps it with one INCR.
+CONTACT_CACHE = {
+    "TIMEOUT": 60 * 5,
+    "TIMEOUTS": {
+        "page": 60 * 5,
+        "tag": 60 * 5,
+        "tag_q": 60 * 5,
+        # Only rebuilt after a write, see Contact/dedup.py
+        "duplicates": 60 * 60 * 24,
+    },
+    "VERSION_TIMEOUT": 60 * 60 * 24 * 30,
+    # In-process tier in front of Redis; invalidations reach the other
+    # workers through Redis pub/sub within milliseconds
+    "L1": {
+        "MAX_BYTES": 64 * 1024 * 1024,
+        "MAX_ENTRIES": 5000,
+        "TIMEOUT": 60,
+        "VERSION_TIMEOUT": 5,
+    },
+}
+
+# Duplicate detection (Contact/dedup.py)
+CONTACT_DEDUP = {
+    "NAME_SIMILARITY": 0.88,
+    "MAX_BLOCK_SIZE": 200,
+    "MAX_GROUPS": 1000,
+}
+
+# Background jobs (Jobs/queue.py), run by: python manage.py run_jobs
+# "redis" wakes idle workers through a Redis list, "db" only polls the table
+JOBS = {
+    "BACKEND": os.environ.get("SMARTCONTACT_JOBS_BACKEND", "db"),
+    "POLL_INTERVAL": 1,
+    "LEASE_SECONDS": 60 * 10,
+    "MAX_ATTEMPTS": 3,
+    "INLINE_MAX_ITEMS": 5000,
+    "INLINE_MAX_UPLOAD_BYTES": 1024 * 1024,
+}
+
+# "jobs" keeps the inputs of queued jobs (uploaded files, big request bodies)
+# until a worker has run them, so it must be shared by the web and run_jobs
+# processes (a shared volume, or an object storage backend in production)
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+    },
+    "jobs": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {
+            "location": os.environ.get(
+                "SMARTCONTACT_JOB_INPUTS", BASE_DIR / "job_inputs"
+            ),
+        },
+    },
+}
+
+# Request metrics on /metrics in the Prometheus text format (SmartContact/metrics.py).
+# SMARTCONTACT_METRICS_TOKEN protects the endpoint with a bearer token;
+# SMARTCONTACT_SLOW_REQUEST_MS logs slower requests with their SQL.
+METRICS = {
+    "ENABLED": os.environ.get("SMARTCONTACT_METRICS", "1") == "1",
+    "TOKEN": os.environ.get("SMARTCONTACT_METRICS_TOKEN") or None,
+    "SLOW_REQUEST_SECONDS": (
+        int(os.environ["SMARTCONTACT_SLOW_REQUEST_MS"]) / 1000
+        if os.environ.get("SMARTCONTACT_SLOW_REQUEST_MS")
+        else None
+    ),
+}
+
+# Delta sync (Contact/sync.py); run prune_contact_changes to apply the retention
+CONTACT_SYNC = {
+    "PAGE_SIZE": 500,
+    "MAX_PAGE_SIZE": 2000,
+    "RETENTION_DAYS": 30,
+}
+
 
 TEMPLATES = [
     {
@@ -101,17 +214,116 @@ TEMPLATES = [
     },
 ]
 
-WSGI_APPLICATION = "OAB.wsgi.application"
+WSGI_APPLICATION = "SmartContact.wsgi.application"
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# SQLite by default (local development and tests). For production set
+#     SMARTCONTACT_DB_ENGINE=postgresql
+#     SMARTCONTACT_DB_NAME / _USER / _PASSWORD / _HOST / _PORT
+#     SMARTCONTACT_DB_POOL=1            Django's native psycopg pool (default)
+#     SMARTCONTACT_DB_POOL_MAX_SIZE=20  per process
+#     SMARTCONTACT_DB_POOL=0            persistent connections instead,
+#     SMARTCONTACT_DB_CONN_MAX_AGE=60   checked before reuse
+#     SMARTCONTACT_DB_REPLICA_HOSTS=replica1,replica2
+# Replicas serve the read-only list views, see SmartContact/db_router.py.
+DB_ENGINE = os.environ.get("SMARTCONTACT_DB_ENGINE", "sqlite")
+
+if DB_ENGINE == "postgresql":
+    DB_POOL = os.environ.get("SMARTCONTACT_DB_POOL", "1") == "1"
+    DB_PRIMARY = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ.get("SMARTCONTACT_DB_NAME", "smartcontact"),
+        "USER": os.environ.get("SMARTCONTACT_DB_USER", "smartcontact"),
+        "PASSWORD": os.environ.get("SMARTCONTACT_DB_PASSWORD", ""),
+        "HOST": os.environ.get("SMARTCONTACT_DB_HOST", "127.0.0.1"),
+        "PORT": os.environ.get("SMARTCONTACT_DB_PORT", "5432"),
+        # The native pool needs CONN_MAX_AGE = 0, it keeps the connections itself
+        "CONN_MAX_AGE": (
+            0 if DB_POOL else int(os.environ.get("SMARTCONTACT_DB_CONN_MAX_AGE", 60))
+        ),
+        "CONN_HEALTH_CHECKS": not DB_POOL,
+        "OPTIONS": {
+            "pool": {
+                "min_size": 2,
+                "max_size": int(os.environ.get("SMARTCONTACT_DB_POOL_MAX_SIZE", 20)),
+                "timeout": 10,
+            }
+        }
+        if DB_POOL
+        else {},
+    }
+    DATABASES = {"default": DB_PRIMARY}
+    for index, host in enumerate(
+        host
+        for host in os.environ.get("SMARTCONTACT_DB_REPLICA_HOSTS", "").split(",")
+        if host.strip()
+    ):
+        DATABASES[f"replica_{index}"] = {
+            **DB_PRIMARY,
+            "HOST": host.strip(),
+            "TEST": {"MIRROR": "default"},
+        }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+        }
     }
+
+DATABASE_ROUTERS = ["SmartContact.db_router.PrimaryReplicaRouter"]
+
+# After a write a user reads from the primary for this many seconds, so their
+# own changes are never hidden by replication lag (keep it above the lag)
+REPLICA_STICKY_SECONDS = 5
+
+
+# Password hashing (AuthenticationSystem/hashers.py). The first hasher hashes new
+# passwords; hashes of the others (e.g. Django's default PBKDF2) keep working and
+# are upgraded on the next login. SMARTCONTACT_PASSWORD_HASHER=argon2 needs
+# argon2-cffi.
+TUNED_PASSWORD_HASHERS = {
+    "scrypt": "AuthenticationSystem.hashers.ScryptPasswordHasher",
+    "argon2": "AuthenticationSystem.hashers.Argon2PasswordHasher",
+}
+PASSWORD_HASHER = os.environ.get("SMARTCONTACT_PASSWORD_HASHER", "scrypt")
+
+PASSWORD_HASHERS = [
+    TUNED_PASSWORD_HASHERS[PASSWORD_HASHER],
+    *[path for name, path in TUNED_PASSWORD_HASHERS.items() if name != PASSWORD_HASHER],
+    "django.contrib.auth.hashers.PBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+]
+
+PASSWORD_HASHING = {
+    "SCRYPT": {"WORK_FACTOR": 2**15, "BLOCK_SIZE": 8, "PARALLELISM": 3},
+    "ARGON2": {"TIME_COST": 2, "MEMORY_COST": 19456, "PARALLELISM": 1},
+    # Threads hashing at once per process (default: half the cores); more
+    # than QUEUE waiting hashes get 503
+    "WORKERS": None,
+    "QUEUE": 64,
+}
+
+# Bulk provisioning (/api/auth/provision/, manage.py provision_users,
+# see AuthenticationSystem/provisioning.py): processes hashing plaintext
+# passwords (default: all cores), and how many a request hashes inline
+# before it goes to a background job
+BULK_PROVISION = {
+    "PROCESSES": None,
+    "INLINE_MAX_PASSWORDS": 10,
+}
+
+# Attempts per window before signup / manual-login answer 429, counted in the
+# cache before any hashing (AuthenticationSystem/throttling.py)
+LOGIN_RATE_LIMIT = {
+    "WINDOW": 60 * 5,
+    "USER_ATTEMPTS": 10,
+    "IP_ATTEMPTS": 100,
+    "SIGNUP_IP_ATTEMPTS": 20,
+    "NUM_PROXIES": int(os.environ.get("SMARTCONTACT_NUM_PROXIES", 0)),
 }
 
 
@@ -1,11 +1,17 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from .metrics import metrics_view
+
 urlpatterns = [
     # Django admin
     # URL: /admin/
     path("admin/", admin.site.urls),
 
+    # Prometheus metrics of this process (see SmartContact/metrics.py)
+    # URL: /metrics  (Authorization: Bearer <METRICS["TOKEN"]> when set)
+    path("metrics", metrics_view),
+
     # Authentication endpoints (mounted under /api/auth/)
     # Available endpoints (see AuthenticationSystem/urls.py):
     #   POST /api/auth/signup/         -> create new user (returns 201 with "msg","user","tokens")
@@ -16,9 +22,26 @@ urlpatterns = [
     # Contact endpoints (mounted under /api/contact/)
     # Available endpoints (see Contact/urls.py):
     #   POST   /api/contact/create/    -> create contact (auth required)
+    #   POST   /api/contact/import/    -> bulk import JSON list / CSV / NDJSON file
     #   GET    /api/contact/all/       -> list all current user's contacts (auth required)
     #   GET    /api/contact/by-tag/?tag=<tag>
+    #   GET    /api/contact/detail/?contact_id=<id> -> one contact with an ETag
+    #   GET    /api/contact/search/?q=<text or digits>
+    #   GET    /api/contact/sync/?token=<token> -> changes + deleted ids since the last sync
+    #   GET    /api/contact/duplicates/ -> groups of likely duplicate contacts
+    #   POST   /api/contact/merge/     -> merge duplicates into one contact
+    #   GET    /api/contact/stats/     -> total / per-tag / recent contact counts
     #   DELETE /api/contact/delete/?contact_id=<id>
     #   PUT    /api/contact/edit/      -> edit contact (auth required)
+    #   DELETE /api/contact/bulk-delete/ -> delete by contact_ids / tag / q
+    #   PUT    /api/contact/bulk-edit/   -> retag by contact_ids / tag / q
+    #   GET    /api/contact/export/?output=ndjson|csv -> stream all contacts
     path("api/contact/", include("Contact.urls")),
+
+    # Background job endpoints (mounted under /api/jobs/)
+    # Available endpoints (see Jobs/urls.py):
+    #   GET    /api/jobs/detail/?job_id=<id>   -> status, progress, result
+    #   GET    /api/jobs/progress/?job_id=<id> -> status and progress only
+    #   GET    /api/jobs/all/                  -> recent jobs
+    path("api/jobs/", include("Jobs.urls")),
 ]
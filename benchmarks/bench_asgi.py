@@ -0,0 +1,148 @@
+"""
+Concurrency scaling of the sync (WSGI) and async (ASGI) views.
+
+Sends the same requests through Django's WSGI handler from a thread pool and
+through the ASGI handler from concurrent coroutines, at growing concurrency,
+and prints throughput and p50 / p99 latency. Runs in process against a
+throwaway test database, no server needed:
+
+    python -m benchmarks.bench_asgi [--requests 2000] [--concurrency 1,8,32,64]
+
+Uses the configured cache (Redis by default); pass --locmem to run without a
+Redis server. For an end-to-end run, serve SmartContact.asgi:application with
+uvicorn and SmartContact.wsgi:application with a WSGI server and point any
+HTTP load generator at both.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SmartContact.settings")
+django.setup()
+
+from django.core.cache import cache  # noqa: E402
+from django.db import connection, connections  # noqa: E402
+from django.test import AsyncClient, Client  # noqa: E402
+from django.test.utils import override_settings, setup_test_environment  # noqa: E402
+
+from AuthenticationSystem.models import CustomUser  # noqa: E402
+from AuthenticationSystem.views import get_tokens_for_user  # noqa: E402
+from Contact.models import Contact  # noqa: E402
+
+ENDPOINTS = {
+    "all": "/api/contact/all/?limit=50",
+    "detail": "/api/contact/detail/?contact_id={contact_id}",
+}
+
+
+def seed(contacts):
+    user = CustomUser.objects.create_user(user_name="bench", password="bench")
+    Contact.objects.bulk_create(
+        Contact(
+            name=f"Contact {number}",
+            phone_number=f"+1202555{number % 10000:04d}",
+            owner_user_id=user.id,
+            tags="bench",
+        )
+        for number in range(contacts)
+    )
+    contact_id = Contact.objects.filter(owner_user_id=user.id).values_list(
+        "id", flat=True
+    )[0]
+    return get_tokens_for_user(user)["access"], contact_id
+
+
+def report(name, concurrency, latencies, elapsed):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{name:<5} c={concurrency:<4} {len(latencies) / elapsed:9.1f} req/s"
+        f"  p50 {statistics.median(latencies) * 1000:7.2f} ms"
+        f"  p99 {p99 * 1000:7.2f} ms"
+    )
+
+
+def run_wsgi(url, headers, requests, concurrency):
+    def worker(count):
+        client = Client()
+        latencies = []
+        for _ in range(count):
+            started = time.perf_counter()
+            response = client.get(url, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.status_code
+        connections.close_all()
+        return latencies
+
+    shares = [requests // concurrency] * concurrency
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        latencies = [value for part in pool.map(worker, shares) for value in part]
+    report("wsgi", concurrency, latencies, time.perf_counter() - started)
+
+
+def run_asgi(url, headers, requests, concurrency):
+    async def worker(client, count, latencies):
+        for _ in range(count):
+            started = time.perf_counter()
+            response = await client.get(url, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.status_code
+
+    async def main():
+        latencies = []
+        client = AsyncClient()
+        await asyncio.gather(
+            *(
+                worker(client, requests // concurrency, latencies)
+                for _ in range(concurrency)
+            )
+        )
+        return latencies
+
+    started = time.perf_counter()
+    latencies = asyncio.run(main())
+    report("asgi", concurrency, latencies, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", default="1,8,32,64")
+    parser.add_argument("--contacts", type=int, default=1000)
+    parser.add_argument("--endpoint", choices=ENDPOINTS, default="detail")
+    parser.add_argument("--locmem", action="store_true", help="no Redis needed")
+    args = parser.parse_args()
+
+    overrides = {}
+    if args.locmem:
+        overrides["CACHES"] = {
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        }
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        with override_settings(**overrides):
+            access, contact_id = seed(args.contacts)
+            url = ENDPOINTS[args.endpoint].format(contact_id=contact_id)
+            headers = {"Authorization": f"Bearer {access}"}
+            for concurrency in [int(value) for value in args.concurrency.split(",")]:
+                cache.clear()
+                with override_settings(ROOT_URLCONF="SmartContact.urls"):
+                    run_wsgi(url, headers, args.requests, concurrency)
+                cache.clear()
+                with override_settings(ROOT_URLCONF="SmartContact.asgi_urls"):
+                    run_asgi(url, headers, args.requests, concurrency)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
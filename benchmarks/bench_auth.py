@@ -0,0 +1,94 @@
+"""
+Per-request cost of authenticating a JWT.
+
+Compares the old path (DRF authenticates, then the view decodes the token
+again with JWTAuthentication) with the current one (DRF authenticates once
+through CachedJWTAuthentication and the view reads request.user).
+
+Runs against a throwaway test database, no server needed:
+
+    python -m benchmarks.bench_auth [--requests 2000]
+"""
+
+import argparse
+import os
+import time
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SmartContact.settings")
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    CaptureQueriesContext,
+    override_settings,
+    setup_test_environment,
+)
+from rest_framework.test import APIRequestFactory  # noqa: E402
+from rest_framework_simplejwt.authentication import JWTAuthentication  # noqa: E402
+
+from AuthenticationSystem.authentication import (  # noqa: E402
+    CachedJWTAuthentication,
+    local_user_cache,
+)
+from AuthenticationSystem.models import CustomUser  # noqa: E402
+from AuthenticationSystem.views import get_tokens_for_user  # noqa: E402
+
+
+def old_path(request):
+    # Default authenticator + the second decode the views used to do
+    JWTAuthentication().authenticate(request)
+    JWTAuthentication().authenticate(request)
+
+
+def new_path(request):
+    CachedJWTAuthentication().authenticate(request)
+
+
+def measure(name, authenticate, request, requests):
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        for _ in range(requests):
+            authenticate(request)
+        elapsed = time.perf_counter() - started
+
+    per_request_us = elapsed / requests * 1_000_000
+    queries_per_request = len(queries) / requests
+    print(
+        f"{name:<32} {per_request_us:10.1f} us/request"
+        f" {queries_per_request:8.3f} queries/request"
+    )
+    return per_request_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        user = CustomUser.objects.create_user(user_name="bench", password="bench")
+        access = get_tokens_for_user(user)["access"]
+        request = APIRequestFactory().get(
+            "/api/contact/all/", HTTP_AUTHORIZATION=f"Bearer {access}"
+        )
+
+        before = measure("double decode, no cache", old_path, request, args.requests)
+        with override_settings(JWT_USER_CACHE={"BACKEND": None}):
+            measure("single decode, no cache", new_path, request, args.requests)
+        with override_settings(JWT_USER_CACHE={"BACKEND": "local", "TIMEOUT": 30}):
+            local_user_cache.clear()
+            after = measure(
+                "single decode, local user cache", new_path, request, args.requests
+            )
+
+        print(f"saved {before - after:.1f} us/request ({before / after:.1f}x faster)")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,507 @@
+"""
+Latency, queries and Redis round trips of the auth and contact endpoints.
+
+Seeds an address book of each --sizes (1k, 100k, 1m), then drives signup,
+manual-login, all/, by-tag/, create/, edit/ and delete/ and prints p50 / p99
+latency, throughput, database queries and Redis round trips per request:
+
+    python -m benchmarks.bench_endpoints [--sizes 1k,100k] [--requests 200]
+        [--driver client|http] [--concurrency 8] [--save results.json]
+        [--compare benchmarks/baselines/sqlite-fakeredis-1k.json]
+
+Drivers:
+    client  Django's test client, one request at a time (no network)
+    http    a threaded WSGI server in process, hit by --concurrency
+            threads over HTTP (every request opens a connection)
+
+Runs offline: an SQLite file database (kept in the temp directory with
+--keepdb, so a 1m book is only seeded once) and fakeredis in place of Redis.
+--redis-url uses a real Redis server instead; keys are written under a
+"bench" prefix but the cache is cleared between phases, so never point it at
+a shared server.
+
+--save writes the results as JSON; --compare reads such a file and exits
+with status 1 when an endpoint got slower than --tolerance (p50) or runs
+more queries than the baseline.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import socketserver
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "SmartContact.settings")
+django.setup()
+
+from django.core.cache import cache  # noqa: E402
+from django.core.wsgi import get_wsgi_application  # noqa: E402
+from django.db import connection, connections  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import override_settings, setup_test_environment  # noqa: E402
+
+from AuthenticationSystem.authentication import local_user_cache  # noqa: E402
+from AuthenticationSystem.models import CustomUser  # noqa: E402
+from AuthenticationSystem.views import get_tokens_for_user  # noqa: E402
+from Contact.caching import contact_cache  # noqa: E402
+from Contact.models import Contact  # noqa: E402
+from SmartContact import metrics  # noqa: E402
+from benchmarks import seed  # noqa: E402
+
+SIZES = {"1k": 1000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+ENDPOINTS = ["signup", "manual-login", "all", "by-tag", "create", "edit", "delete"]
+QUERY_TOLERANCE = 0.5
+# Password hashing makes these slow by design, they get --auth-requests
+HASHING_ENDPOINTS = {"signup", "manual-login"}
+ROUTES = {
+    "signup": "/api/auth/signup/",
+    "manual-login": "/api/auth/manual-login/",
+    "all": "/api/contact/all/",
+    "by-tag": "/api/contact/by-tag/",
+    "create": "/api/contact/create/",
+    "edit": "/api/contact/edit/",
+    "delete": "/api/contact/delete/",
+}
+
+
+# Redis round trips
+
+
+class RedisCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def increment(self):
+        with self.lock:
+            self.count += 1
+
+
+redis_ops = RedisCounter()
+
+
+def counting_connection(base):
+    # Every command or pipeline is one send_packed_command() (one round trip)
+    class CountingConnection(base):
+        def send_packed_command(self, command, check_health=True):
+            redis_ops.increment()
+            return super().send_packed_command(command, check_health)
+
+    return CountingConnection
+
+
+def cache_settings(redis_url):
+    if redis_url:
+        from redis import Connection
+
+        connection_class = counting_connection(Connection)
+        location = redis_url
+    else:
+        try:
+            from fakeredis import FakeRedisConnection
+        except ImportError:
+            raise SystemExit("install fakeredis, or pass --redis-url")
+        connection_class = counting_connection(FakeRedisConnection)
+        location = "redis://127.0.0.1:6379/1"
+    return {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": location,
+            "KEY_PREFIX": "bench",
+            "OPTIONS": {
+                "CLIENT_CLASS": "django_redis.client.DefaultClient",
+                "CONNECTION_POOL_KWARGS": {"connection_class": connection_class},
+            },
+        }
+    }
+
+
+def clear_caches():
+    cache.clear()
+    contact_cache.clear_local()
+    local_user_cache.clear()
+
+
+# Requests of each endpoint
+
+
+class Workload:
+    # Builds the i-th request of an endpoint: (method, path, JSON body, status)
+    def __init__(self, owner, run_id, tag):
+        self.run_id = run_id
+        self.tag = tag
+        self.headers = {
+            "Authorization": f"Bearer {get_tokens_for_user(owner)['access']}"
+        }
+        self.edit_ids = []
+        self.delete_ids = []
+        self.owner = owner
+
+    def prepare(self, endpoint, requests):
+        if endpoint == "edit":
+            self.edit_ids = list(
+                Contact.objects.filter(owner_user=self.owner)
+                .order_by("id")
+                .values_list("id", "name", "phone_e164")[:requests]
+            )
+        elif endpoint == "delete":
+            # The contacts create/ added, so the book keeps its size
+            self.delete_ids = list(
+                Contact.objects.filter(
+                    owner_user=self.owner, name__startswith=f"Bench {self.run_id} "
+                ).values_list("id", flat=True)
+            )
+
+    def request(self, endpoint, number):
+        if endpoint == "signup":
+            body = {
+                "user_name": f"bench_signup_{self.run_id}_{number}",
+                "password": seed.PASSWORD,
+            }
+            return "POST", ROUTES[endpoint], body, 201
+        if endpoint == "manual-login":
+            body = {"user_name": seed.OWNER, "password": seed.PASSWORD}
+            return "POST", ROUTES[endpoint], body, 200
+        if endpoint == "all":
+            return "GET", f"{ROUTES[endpoint]}?limit=50", None, 200
+        if endpoint == "by-tag":
+            return "GET", f"{ROUTES[endpoint]}?tag={self.tag}", None, 200
+        if endpoint == "create":
+            body = {
+                "name": f"Bench {self.run_id} {number}",
+                "phone_number": seed.phone_number(number),
+                "tags": "bench-new",
+            }
+            return "POST", ROUTES[endpoint], body, 201
+        if endpoint == "edit":
+            contact_id, name, phone_number = self.edit_ids[
+                number % len(self.edit_ids)
+            ]
+            body = {
+                "contact_id": contact_id,
+                "new_name": name,
+                "new_phone_number": phone_number,
+            }
+            return "PUT", ROUTES[endpoint], body, 200
+        if endpoint == "delete":
+            contact_id = self.delete_ids[number]
+            return "DELETE", f"{ROUTES[endpoint]}?contact_id={contact_id}", None, 200
+        raise ValueError(endpoint)
+
+    def count(self, endpoint, requests):
+        if endpoint == "delete":
+            return min(requests, len(self.delete_ids))
+        return requests
+
+
+# Drivers
+
+
+def run_client(workload, endpoint, count, cold):
+    client = Client()
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for number in range(count):
+        method, path, body, expected = workload.request(endpoint, number)
+        if cold:
+            clear_caches()
+        request_started = time.perf_counter()
+        response = client.generic(
+            method,
+            path,
+            json.dumps(body) if body is not None else "",
+            content_type="application/json",
+            headers=workload.headers,
+        )
+        latencies.append(time.perf_counter() - request_started)
+        errors += response.status_code != expected
+    return latencies, errors, time.perf_counter() - started
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def start_server():
+    server = make_server(
+        "127.0.0.1",
+        0,
+        get_wsgi_application(),
+        server_class=ThreadingWSGIServer,
+        handler_class=QuietHandler,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_http(workload, endpoint, count, concurrency, server):
+    host, port = server.server_address
+
+    def send(number):
+        method, path, body, expected = workload.request(endpoint, number)
+        headers = {**workload.headers, "Content-Type": "application/json"}
+        started = time.perf_counter()
+        http_connection = http.client.HTTPConnection(host, port, timeout=60)
+        try:
+            http_connection.request(
+                method,
+                path,
+                body=json.dumps(body) if body is not None else None,
+                headers=headers,
+            )
+            response = http_connection.getresponse()
+            response.read()
+        finally:
+            http_connection.close()
+        return time.perf_counter() - started, response.status != expected
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(send, range(count)))
+    elapsed = time.perf_counter() - started
+    return [latency for latency, _ in results], sum(e for _, e in results), elapsed
+
+
+# Results
+
+
+def percentile(latencies, fraction):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(endpoint, latencies, errors, elapsed, redis_delta):
+    queries = 0
+    served = 0
+    for (route,), (count, total) in metrics.DB_QUERIES.totals().items():
+        if route == ROUTES[endpoint]:
+            served, queries = count, total
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "queries_per_request": round(queries / served, 2) if served else None,
+        "redis_ops_per_request": round(redis_delta / len(latencies), 2),
+    }
+
+
+def print_results(size, results):
+    print(f"\n{size} contacts")
+    print(
+        f"{'endpoint':<14}{'req':>6}{'err':>5}{'req/s':>9}{'p50 ms':>10}"
+        f"{'p99 ms':>10}{'queries':>9}{'redis':>7}"
+    )
+    for endpoint, result in results.items():
+        print(
+            f"{endpoint:<14}{result['requests']:>6}{result['errors']:>5}"
+            f"{result['rps']:>9.1f}{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+            f"{result['queries_per_request'] or 0:>9.2f}"
+            f"{result['redis_ops_per_request']:>7.2f}"
+        )
+
+
+def compare(baseline, report, tolerance):
+    # Returns the list of regressions, printing old -> new for every endpoint
+    regressions = []
+    for size, results in report["results"].items():
+        for endpoint, result in results.items():
+            old = baseline["results"].get(size, {}).get(endpoint)
+            if old is None:
+                continue
+            change = result["p50_ms"] / old["p50_ms"] - 1 if old["p50_ms"] else 0
+            print(
+                f"{size:<5} {endpoint:<14} p50 {old['p50_ms']:8.2f} -> "
+                f"{result['p50_ms']:8.2f} ms ({change:+.0%})  queries "
+                f"{old['queries_per_request']} -> {result['queries_per_request']}"
+            )
+            if change > tolerance:
+                regressions.append(f"{size} {endpoint}: p50 {change:+.0%}")
+            # Averages include one-off queries (e.g. the first JWT user
+            # lookup), so only a whole extra query per request counts
+            if (result["queries_per_request"] or 0) >= (
+                old["queries_per_request"] or 0
+            ) + QUERY_TOLERANCE:
+                regressions.append(f"{size} {endpoint}: more queries")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Runs
+
+
+def use_database_file(path, keepdb):
+    # An SQLite file instead of the in-memory test database: big books do not
+    # have to fit in memory, threads of the http driver share it and --keepdb
+    # keeps the seeded data for the next run
+    if connection.vendor != "sqlite":
+        return
+    connection.settings_dict["TEST"]["NAME"] = path
+    # Concurrent writers wait for the write lock instead of failing with
+    # "database is locked" when a read transaction cannot be upgraded
+    connection.settings_dict["OPTIONS"].update(
+        transaction_mode="IMMEDIATE", timeout=30
+    )
+    if not keepdb and os.path.exists(path):
+        os.remove(path)
+
+
+def run_size(args, size, contacts):
+    path = os.path.join(tempfile.gettempdir(), f"smartcontact_bench_{size}.sqlite3")
+    use_database_file(path, args.keepdb)
+    old_name = connection.creation.create_test_db(verbosity=0, keepdb=args.keepdb)
+    try:
+        seeded = seed.is_seeded(contacts)
+        if seeded is None:
+            seed.seed(contacts)
+        elif not seeded:
+            raise SystemExit(f"{path} holds a partial seed, delete it first")
+        owner = CustomUser.objects.get(user_name=seed.OWNER)
+
+        run_id = int(time.time())
+        workload = Workload(owner, run_id, args.tag)
+        server = None
+        if args.driver == "http":
+            server = start_server()
+
+        results = {}
+        for endpoint in args.endpoints:
+            requests = (
+                args.auth_requests if endpoint in HASHING_ENDPOINTS else args.requests
+            )
+            workload.prepare(endpoint, requests)
+            count = workload.count(endpoint, requests)
+            if not count:
+                continue
+            clear_caches()
+            metrics.reset()
+            redis_before = redis_ops.count
+            if server is None:
+                latencies, errors, elapsed = run_client(
+                    workload, endpoint, count, args.cold
+                )
+            else:
+                latencies, errors, elapsed = run_http(
+                    workload, endpoint, count, args.concurrency, server
+                )
+            results[endpoint] = summarize(
+                endpoint, latencies, errors, elapsed, redis_ops.count - redis_before
+            )
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        # Leave a --keepdb database as seeded
+        Contact.objects.filter(owner_user=owner, name__startswith="Bench ").delete()
+        CustomUser.objects.filter(user_name__startswith="bench_signup_").delete()
+
+        print_results(size, results)
+        return results
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(
+            old_name, verbosity=0, keepdb=args.keepdb
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1k", help=f"any of {', '.join(SIZES)}")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--auth-requests", type=int, default=20)
+    parser.add_argument("--driver", choices=["client", "http"], default="client")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--cold", action="store_true", help="empty caches first")
+    parser.add_argument("--tag", default=seed.RARE_TAG)
+    parser.add_argument("--redis-url")
+    parser.add_argument("--keepdb", action="store_true")
+    parser.add_argument("--save")
+    parser.add_argument("--compare")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    sizes = [size.strip().lower() for size in args.sizes.split(",")]
+    unknown = set(sizes) - set(SIZES)
+    if unknown:
+        parser.error(f"unknown sizes: {', '.join(sorted(unknown))}")
+    args.endpoints = [endpoint.strip() for endpoint in args.endpoints.split(",")]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+    if args.cold and args.driver != "client":
+        parser.error("--cold needs --driver client")
+
+    setup_test_environment(debug=False)
+    report = {
+        "meta": {
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "redis": "server" if args.redis_url else "fakeredis",
+            "driver": args.driver,
+            "concurrency": args.concurrency if args.driver == "http" else 1,
+            "cold": args.cold,
+            "requests": args.requests,
+            "auth_requests": args.auth_requests,
+        },
+        "results": {},
+    }
+    with override_settings(
+        CACHES=cache_settings(args.redis_url),
+        ALLOWED_HOSTS=["testserver", "127.0.0.1"],
+        METRICS={"ENABLED": True},
+    ):
+        for size in sizes:
+            report["results"][size] = run_size(args, size, SIZES[size])
+
+    if args.save:
+        with open(args.save, "w") as output:
+            json.dump(report, output, indent=2)
+            output.write("\n")
+        print(f"\nsaved {args.save}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        print(f"\ncompared with {args.compare}")
+        regressions = compare(baseline, report, args.tolerance)
+        if regressions:
+            print("regressions:\n  " + "\n  ".join(regressions))
+            raise SystemExit(1)
+        print("no regressions")
+
+
+if __name__ == "__main__":
+    main()
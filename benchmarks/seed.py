@@ -0,0 +1,93 @@
+"""
+Synthetic users and address books for the benchmarks.
+
+seed(contacts) creates the benchmark owner with `contacts` contacts and a
+few other users with small books, straight through bulk_create (the same
+columns and tag links the write endpoints produce, without the per-row
+requests). The per-user stats counters are rebuilt afterwards with
+reconcile_stats(). Import it after django.setup().
+"""
+
+import time
+
+from AuthenticationSystem.models import CustomUser
+from Contact.models import Contact, ContactTag, Tag
+from Contact.phones import phone_digits
+from Contact.stats import reconcile_stats
+
+OWNER = "bench_owner"
+PASSWORD = "bench-password"
+COMMON_TAGS = ["work", "friends", "family", "school"]
+# On one contact in RARE_TAG_EVERY, so by-tag/ results stay small at any size
+RARE_TAG = "vip"
+RARE_TAG_EVERY = 1000
+BATCH_SIZE = 5000
+
+
+def phone_number(number):
+    # Valid, distinct NANP numbers: +1 202 <200..999> <0000..9999>
+    return f"+1202{200 + number // 10000:03d}{number % 10000:04d}"
+
+
+def contact_tags(number):
+    tags = [COMMON_TAGS[number % len(COMMON_TAGS)]]
+    if number % RARE_TAG_EVERY == 0:
+        tags.append(RARE_TAG)
+    return tags
+
+
+def seed_contacts(user, contacts, progress=None):
+    tag_ids = {}
+    for name in [*COMMON_TAGS, RARE_TAG]:
+        tag_ids[name] = Tag.objects.create(owner_user=user, name=name).id
+
+    for start in range(0, contacts, BATCH_SIZE):
+        numbers = range(start, min(start + BATCH_SIZE, contacts))
+        created = Contact.objects.bulk_create(
+            Contact(
+                name=f"Contact {number}",
+                phone_number=phone_number(number),
+                phone_e164=phone_number(number),
+                phone_digits=phone_digits(phone_number(number)),
+                owner_user=user,
+                tags="-".join(contact_tags(number)),
+            )
+            for number in numbers
+        )
+        ContactTag.objects.bulk_create(
+            ContactTag(contact_id=contact.id, tag_id=tag_ids[name])
+            for contact, number in zip(created, numbers)
+            for name in contact_tags(number)
+        )
+        if progress:
+            progress(numbers[-1] + 1, contacts)
+
+
+def is_seeded(contacts):
+    # None: nothing seeded yet, False: an interrupted or different seed
+    user = CustomUser.objects.filter(user_name=OWNER).first()
+    if user is None:
+        return None
+    return user.contacts.filter(name__startswith="Contact ").count() == contacts
+
+
+def seed(contacts, other_users=10, other_contacts=100, verbose=True):
+    started = time.perf_counter()
+
+    def progress(done, total):
+        if verbose:
+            print(f"\rseeding {done}/{total} contacts", end="", flush=True)
+
+    owner = CustomUser.objects.create_user(user_name=OWNER, password=PASSWORD)
+    seed_contacts(owner, contacts, progress)
+    reconcile_stats(owner.id)
+    for number in range(other_users):
+        user = CustomUser.objects.create_user(
+            user_name=f"bench_user_{number}", password=PASSWORD
+        )
+        seed_contacts(user, other_contacts)
+        reconcile_stats(user.id)
+
+    if verbose:
+        print(f"\nseeded in {time.perf_counter() - started:.1f} s")
+    return owner